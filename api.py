@@ -1,35 +1,76 @@
-from flask import Flask, request, jsonify
-from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from models import db, User, MeterReading, Payment, ElectricityRate, WaterBill
-from datetime import datetime
+"""The JSON API used by the mobile app, mounted at /api by factory.create_app."""
+from flask import Blueprint, request, jsonify, url_for, current_app
+from models import db, User, MeterReading, LatestReading, Payment
+from db_config import read_only, track_user
+from queries import latest_readings_by_tenant, recent_readings
+from billing import bill_for_tenant, current_electricity_rate, current_water_bill
+from cache import TTLCache
+from fragments import fragment_cache
+from card_payments import queue_card_payment, schedule_intent, intent_status_payload
+from ingest import ingest_readings, records_from_json, records_from_csv, BatchRejected
+from versions import dashboard_versions, user_version
+from usage import usage_params, usage_history
+from datetime import datetime, timedelta
 import os
-from dotenv import load_dotenv
-import stripe
-from werkzeug.utils import secure_filename
-from PIL import Image
+import time
 import jwt
 from functools import wraps
-from flask_cors import CORS
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 import random
 import string
 
-# Load environment variables
-load_dotenv()
+bp = Blueprint('api', __name__, url_prefix='/api')
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for API
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'default-secret-key')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///rentmanager.db')
-app.config['UPLOAD_FOLDER'] = 'static/uploads'
-stripe.api_key = os.getenv('STRIPE_API_KEY')
+# Verified token -> (detached User snapshot, its user version). Each call still reads the
+# version, so a change committed by any process retires the snapshot everywhere.
+token_cache = TTLCache(maxsize=int(os.getenv('TOKEN_CACHE_SIZE', 1024)),
+                       ttl=int(os.getenv('TOKEN_CACHE_TTL', 60)))
 
-# Initialize extensions
-db.init_app(app)
-login_manager = LoginManager()
-login_manager.init_app(app)
+@event.listens_for(Session, 'after_flush')
+def _note_changed_users(session, flush_context):
+    changed = {obj.id for obj in list(session.dirty) + list(session.deleted) if isinstance(obj, User)}
+    if changed:
+        session.info.setdefault('changed_user_ids', set()).update(changed)
 
-# Ensure upload directory exists
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+@event.listens_for(Session, 'after_commit')
+def invalidate_cached_users(session):
+    # Only once committed: dropping them at flush lets a concurrent call re-cache the old row
+    changed = session.info.pop('changed_user_ids', None)
+    if changed:
+        token_cache.discard_where(lambda entry: entry[0].id in changed)
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_users(session):
+    session.info.pop('changed_user_ids', None)
+
+def resolve_token_user(token):
+    """User for a token, from the cache when possible; raises jwt.InvalidTokenError if invalid"""
+    entry = token_cache.get(token)
+    if entry is not None and user_version(entry[0].id) != entry[1]:
+        token_cache.pop(token)
+        entry = None
+    if entry is None:
+        data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
+        # Read the version before the row, so a snapshot is never cached under a newer version
+        version = user_version(data['user_id'])
+        user = db.session.get(User, data['user_id'])
+        if not user:
+            return None
+        
+        # Cache a detached copy and hand the handler an instance attached to this session
+        db.session.expunge(user)
+        entry = (user, version)
+        ttl = token_cache.ttl
+        if 'exp' in data:
+            ttl = min(ttl, data['exp'] - time.time())
+        token_cache.set(token, entry, ttl=ttl)
+    
+    return db.session.merge(entry[0], load=False)
+
+# Serialized tenant dashboards keyed by their ETag; a version bump changes the key
+dashboard_cache = TTLCache(maxsize=int(os.getenv('DASHBOARD_CACHE_SIZE', 1024)),
+                           ttl=int(os.getenv('DASHBOARD_CACHE_TTL', 3600)))
 
 # Token verification decorator
 def token_required(f):
@@ -46,18 +87,18 @@ def token_required(f):
             return jsonify({'error': 'Token is missing'}), 401
         
         try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user = User.query.get(data['user_id'])
+            current_user = resolve_token_user(token)
             if not current_user:
                 return jsonify({'error': 'Invalid token'}), 401
         except:
             return jsonify({'error': 'Invalid token'}), 401
         
+        track_user(current_user.id)
         return f(current_user, *args, **kwargs)
     
     return decorated
 
-@app.route('/api/login', methods=['POST'])
+@bp.route('/login', methods=['POST'])
 def login():
     if not request.is_json:
         return jsonify({'error': 'Missing JSON in request'}), 400
@@ -76,12 +117,15 @@ def login():
         user = User.query.filter_by(email=tenant_id).first()
     
     if user and user.check_password(password):
+        if user.upgrade_password_hash(password):
+            db.session.commit()
+        
         # Generate token
         token = jwt.encode({
             'user_id': user.id,
             'is_owner': user.is_owner,
-            'exp': datetime.utcnow() + datetime.timedelta(days=1)
-        }, app.config['SECRET_KEY'], algorithm='HS256')
+            'exp': datetime.utcnow() + timedelta(days=1)
+        }, current_app.config['SECRET_KEY'], algorithm='HS256')
         
         return jsonify({
             'token': token,
@@ -95,28 +139,43 @@ def login():
     
     return jsonify({'error': 'Invalid credentials'}), 401
 
-@app.route('/api/tenant/dashboard', methods=['GET'])
+@bp.route('/tenant/dashboard', methods=['GET'])
 @token_required
+@read_only
 def tenant_dashboard(current_user):
     if current_user.is_owner:
         return jsonify({'error': 'Owner account cannot access tenant dashboard'}), 403
     
-    # Get the latest reading
-    latest_reading = MeterReading.query.filter_by(user_id=current_user.id).order_by(MeterReading.reading_date.desc()).first()
-    
-    # Get latest electricity reading
-    latest_electricity_reading = MeterReading.query.filter_by(
-        user_id=current_user.id,
-        meter_type='electricity'
-    ).order_by(MeterReading.reading_date.desc()).first()
+    # The dashboard only changes when this tenant's data or shared rates/bills change
+    tenant_version, global_version = dashboard_versions(current_user.id)
+    etag = f"tenant-{current_user.id}-{tenant_version}-{global_version}"
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    
+    body = dashboard_cache.get(etag)
+    if body is None:
+        body = current_app.json.dumps(build_tenant_dashboard(current_user))
+        dashboard_cache.set(etag, body)
+    
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response
+
+def build_tenant_dashboard(current_user):
+    # Latest and previous electricity and water readings in one query
+    readings = latest_readings_by_tenant([current_user.id])[current_user.id]
     
-    # Get latest water reading and bill
-    latest_water_reading = MeterReading.query.filter_by(
-        user_id=current_user.id,
-        meter_type='water'
-    ).order_by(MeterReading.reading_date.desc()).first()
+    # Get the latest reading of either meter
+    recent = recent_readings(readings)
+    latest_reading = recent[0] if recent else None
+    latest_electricity_reading = readings['electricity']['current']
+    latest_water_reading = readings['water']['current']
     
-    water_bill = WaterBill.query.order_by(WaterBill.billing_date.desc()).first()
+    current_rate = current_electricity_rate()
+    water_bill = current_water_bill()
+    bill = bill_for_tenant(current_user, readings={current_user.id: readings}, rate=current_rate, water_bill=water_bill)
     
     # Get payment history
     payments = Payment.query.filter_by(user_id=current_user.id).order_by(Payment.payment_date.desc()).limit(10).all()
@@ -129,8 +188,6 @@ def tenant_dashboard(current_user):
             Payment.payment_date >= latest_reading.reading_date
         ).order_by(Payment.payment_date.desc()).first()
     
-    current_rate = ElectricityRate.query.order_by(ElectricityRate.effective_from.desc()).first()
-    
     # Format data for response
     dashboard_data = {
         'tenant': {
@@ -139,10 +196,10 @@ def tenant_dashboard(current_user):
             'rent_amount': current_user.rent_amount
         },
         'billing': {
-            'rent': current_user.rent_amount,
-            'electricity': 0,
-            'water': 0,
-            'total': current_user.rent_amount
+            'rent': bill.rent,
+            'electricity': bill.electricity,
+            'water': bill.water,
+            'total': bill.total
         },
         'meter_readings': {
             'electricity': None,
@@ -152,49 +209,31 @@ def tenant_dashboard(current_user):
         'payment_history': []
     }
     
-    # Add electricity billing data if available
-    if latest_electricity_reading and current_rate:
-        electricity_previous = MeterReading.query.filter(
-            MeterReading.user_id == current_user.id,
-            MeterReading.meter_type == 'electricity',
-            MeterReading.reading_date < latest_electricity_reading.reading_date
-        ).order_by(MeterReading.reading_date.desc()).first()
-        
-        if electricity_previous:
-            consumption = latest_electricity_reading.reading_value - electricity_previous.reading_value
-            electricity_bill = consumption * current_rate.rate_per_unit
-            dashboard_data['billing']['electricity'] = electricity_bill
-            dashboard_data['billing']['total'] += electricity_bill
-            
-            dashboard_data['meter_readings']['electricity'] = {
-                'current': latest_electricity_reading.reading_value,
-                'previous': electricity_previous.reading_value,
-                'consumption': consumption,
-                'date': latest_electricity_reading.reading_date.isoformat(),
-                'has_image': bool(latest_electricity_reading.image_path),
-                'image_url': f"/static/uploads/{latest_electricity_reading.image_path}" if latest_electricity_reading.image_path else None
-            }
+    # Add electricity reading data if it was billed
+    if latest_electricity_reading and current_rate and bill.units_consumed is not None:
+        dashboard_data['meter_readings']['electricity'] = {
+            'current': latest_electricity_reading.reading_value,
+            'previous': readings['electricity']['previous'].reading_value,
+            'consumption': bill.units_consumed,
+            'date': latest_electricity_reading.reading_date.isoformat(),
+            'has_image': bool(latest_electricity_reading.image_path),
+            'image_url': f"/static/uploads/{latest_electricity_reading.photo_path}" if latest_electricity_reading.image_path else None,
+            'thumbnail_url': f"/static/uploads/{latest_electricity_reading.thumbnail}" if latest_electricity_reading.image_path else None
+        }
     
-    # Add water billing data if available
+    # Add water reading data if available
     if latest_water_reading:
-        water_previous = MeterReading.query.filter(
-            MeterReading.user_id == current_user.id,
-            MeterReading.meter_type == 'water',
-            MeterReading.reading_date < latest_water_reading.reading_date
-        ).order_by(MeterReading.reading_date.desc()).first()
+        water_previous = readings['water']['previous']
         
         dashboard_data['meter_readings']['water'] = {
             'current': latest_water_reading.reading_value,
             'previous': water_previous.reading_value if water_previous else None,
             'date': latest_water_reading.reading_date.isoformat(),
             'has_image': bool(latest_water_reading.image_path),
-            'image_url': f"/static/uploads/{latest_water_reading.image_path}" if latest_water_reading.image_path else None
+            'image_url': f"/static/uploads/{latest_water_reading.photo_path}" if latest_water_reading.image_path else None,
+            'thumbnail_url': f"/static/uploads/{latest_water_reading.thumbnail}" if latest_water_reading.image_path else None
         }
     
-    if water_bill:
-        dashboard_data['billing']['water'] = water_bill.amount_per_tenant
-        dashboard_data['billing']['total'] += water_bill.amount_per_tenant
-    
     # Add existing payment data
     if existing_payment:
         dashboard_data['payment_status'] = {
@@ -216,11 +255,11 @@ def tenant_dashboard(current_user):
             'reference': payment.transaction_reference or payment.stripe_payment_id
         })
     
-    return jsonify(dashboard_data)
+    return dashboard_data
 
 # Add more API endpoints for other functionality...
 
-@app.route('/api/create_payment', methods=['POST'])
+@bp.route('/create_payment', methods=['POST'])
 @token_required
 def create_payment(current_user):
     if not request.is_json:
@@ -232,36 +271,11 @@ def create_payment(current_user):
     if not payment_method or payment_method not in ['card', 'bank_transfer', 'cash']:
         return jsonify({'error': 'Invalid payment method'}), 400
     
-    # Calculate total amount due
-    total_amount = current_user.rent_amount
-    electricity_cost = 0
-    water_cost = 0
-    
-    # Get latest electricity reading and calculate cost
-    latest_electricity = MeterReading.query.filter_by(
-        user_id=current_user.id,
-        meter_type='electricity'
-    ).order_by(MeterReading.reading_date.desc()).first()
-    
-    current_rate = ElectricityRate.query.order_by(ElectricityRate.effective_from.desc()).first()
-    
-    if latest_electricity and current_rate:
-        previous_electricity = MeterReading.query.filter(
-            MeterReading.user_id == current_user.id,
-            MeterReading.meter_type == 'electricity',
-            MeterReading.reading_date < latest_electricity.reading_date
-        ).order_by(MeterReading.reading_date.desc()).first()
-        
-        if previous_electricity:
-            consumption = latest_electricity.reading_value - previous_electricity.reading_value
-            electricity_cost = consumption * current_rate.rate_per_unit
-            total_amount += electricity_cost
-    
-    # Add water bill if available
-    water_bill = WaterBill.query.order_by(WaterBill.billing_date.desc()).first()
-    if water_bill:
-        water_cost = water_bill.amount_per_tenant
-        total_amount += water_cost
+    # Calculate rent + electricity + water for the current period
+    bill = bill_for_tenant(current_user)
+    electricity_cost = bill.electricity
+    water_cost = bill.water
+    total_amount = bill.total
     
     # Create payment record
     payment = Payment(
@@ -276,22 +290,18 @@ def create_payment(current_user):
     )
     
     if payment_method == 'card':
-        try:
-            payment_intent = stripe.PaymentIntent.create(
-                amount=int(total_amount * 100),  # Convert to cents
-                currency='inr',
-                metadata={'user_id': current_user.id}
-            )
-            payment.stripe_payment_id = payment_intent.id
-            db.session.add(payment)
-            db.session.commit()
-            
-            return jsonify({
-                'clientSecret': payment_intent.client_secret,
-                'amount': total_amount
-            })
-        except Exception as e:
-            return jsonify({'error': str(e)}), 400
+        # The PaymentIntent is created in the background; the client polls status_url for its secret
+        queue_card_payment(payment)
+        db.session.add(payment)
+        db.session.commit()
+        schedule_intent(current_app._get_current_object(), payment.id)
+        
+        return jsonify({
+            'payment_id': payment.id,
+            'status': payment.intent_status,
+            'status_url': url_for('api.payment_intent_status', payment_id=payment.id),
+            'amount': total_amount
+        }), 202
     else:
         # For cash and bank transfer
         reference = f"RENT{datetime.now().strftime('%Y%m%d%H%M%S')}{current_user.id}"
@@ -305,13 +315,99 @@ def create_payment(current_user):
             'message': f'Please use reference {reference} when making the payment'
         })
 
+@bp.route('/payments/<int:payment_id>/intent', methods=['GET'])
+@token_required
+def payment_intent_status(current_user, payment_id):
+    payment = db.session.get(Payment, payment_id)
+    if not payment or (payment.user_id != current_user.id and not current_user.is_owner):
+        return jsonify({'error': 'Payment not found'}), 404
+    
+    response = jsonify(intent_status_payload(payment))
+    if payment.intent_status in ('queued', 'creating'):
+        response.headers['Retry-After'] = '1'
+    return response
+
+@bp.route('/readings/batch', methods=['POST'])
+@token_required
+def ingest_reading_batch(current_user):
+    """Bulk-load meter readings exported by sub-meters, as JSON or CSV"""
+    if not current_user.is_owner:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    try:
+        if request.is_json:
+            records = records_from_json(request.get_json())
+        elif request.mimetype == 'text/csv':
+            records = records_from_csv(request.get_data(as_text=True))
+        elif 'file' in request.files:
+            records = records_from_csv(request.files['file'].read().decode('utf-8-sig'))
+        else:
+            return jsonify({'error': 'Send JSON, a text/csv body or a CSV file upload'}), 400
+        report = ingest_readings(records)
+        db.session.commit()
+    except (BatchRejected, UnicodeDecodeError) as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception:
+        db.session.rollback()
+        raise
+    
+    return jsonify(report)
+
+@bp.route('/tenant/usage', methods=['GET'])
+@token_required
+@read_only
+def tenant_usage(current_user):
+    """The tenant's units per month and meter, from the monthly rollup"""
+    if current_user.is_owner:
+        return jsonify({'error': 'Owner account cannot access tenant usage'}), 403
+    
+    try:
+        months, meter_types = usage_params(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'tenant_id': current_user.tenant_id, **usage_history(current_user.id, months, meter_types)})
+
+@bp.route('/owner/usage', methods=['GET'])
+@token_required
+@read_only
+def owner_usage(current_user):
+    """Units per month and meter for one tenant (?tenant_id=) or summed over the building"""
+    if not current_user.is_owner:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    try:
+        months, meter_types = usage_params(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    tenant_id = request.args.get('tenant_id')
+    user_id = None
+    if tenant_id:
+        tenant = User.query.filter_by(tenant_id=tenant_id, is_owner=False).first()
+        if not tenant:
+            return jsonify({'error': 'Tenant not found'}), 404
+        user_id = tenant.id
+    
+    return jsonify({'tenant_id': tenant_id, **usage_history(user_id, months, meter_types)})
+
+@bp.route('/admin/cache_stats', methods=['GET'])
+@token_required
+def cache_stats(current_user):
+    if not current_user.is_owner:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    return jsonify({'token_cache': token_cache.stats(), 'dashboard_cache': dashboard_cache.stats(),
+                    'fragment_cache': fragment_cache.stats()})
+
 def generate_tenant_password(length=8):
     """Generate a random password for tenant"""
     characters = string.ascii_letters + string.digits + string.punctuation
     password = ''.join(random.choice(characters) for _ in range(length))
     return password
 
-@app.route('/api/register_tenant', methods=['POST'])
+@bp.route('/register_tenant', methods=['POST'])
 @token_required
 def register_tenant(current_user):
     if not current_user.is_owner:
@@ -325,23 +421,29 @@ def register_tenant(current_user):
     rent_amount = float(data.get('rent_amount'))
     initial_electricity_reading = float(data.get('initial_electricity_reading'))
     initial_water_reading = float(data.get('initial_water_reading'))
+    phone_number = data.get('phone_number') or None
+    rent_due_day = data.get('rent_due_day')
     
     if not all([name, rent_amount, initial_electricity_reading, initial_water_reading]):
         return jsonify({'error': 'Missing required fields'}), 400
     
-    # Generate unique tenant ID
-    tenant_id = User.generate_unique_tenant_id()
+    if rent_due_day is not None and (not isinstance(rent_due_day, int) or not 1 <= rent_due_day <= 31):
+        return jsonify({'error': 'rent_due_day must be a day of the month (1-31)'}), 400
     
     # Generate random password
     password = generate_tenant_password()
     
     tenant = User(
-        tenant_id=tenant_id,
         name=name,
         rent_amount=rent_amount,
+        phone_number=phone_number,
+        rent_due_day=rent_due_day,
         is_owner=False
     )
+    # Hash before reserving the ID, which holds the write lock until commit
     tenant.set_password(password)
+    tenant_id = User.generate_unique_tenant_id()
+    tenant.tenant_id = tenant_id
     
     # Add tenant to database first to get the user_id
     db.session.add(tenant)
@@ -369,6 +471,8 @@ def register_tenant(current_user):
     
     db.session.add(initial_electricity)
     db.session.add(initial_water)
+    LatestReading.record(initial_electricity)
+    LatestReading.record(initial_water)
     db.session.commit()
     
     return jsonify({
@@ -381,7 +485,7 @@ def register_tenant(current_user):
         }
     })
 
-@app.route('/api/change_password', methods=['POST'])
+@bp.route('/change_password', methods=['POST'])
 @token_required
 def change_password(current_user):
     if not request.is_json:
@@ -403,8 +507,3 @@ def change_password(current_user):
     db.session.commit()
     
     return jsonify({'message': 'Password updated successfully'})
-
-if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-    app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
@@ -0,0 +1 @@
+"""Local benchmarks and stand-in services; run modules with python -m benchmarks.<name>"""
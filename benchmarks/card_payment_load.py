@@ -0,0 +1,78 @@
+"""Card payment load test against the local Stripe stub.
+
+Seeds a throwaway SQLite database with tenants, points the API at
+benchmarks.stripe_stub, and has every tenant start a card payment at once.
+Reports how long create_payment held a request thread and how long it took
+until every PaymentIntent's client secret was ready to poll.
+
+    python -m benchmarks.card_payment_load --tenants 200 --concurrency 16 --latency 0.3
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tenants', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.3, help='Stub Stripe latency in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.02)
+    args = parser.parse_args()
+
+    from benchmarks.stripe_stub import serve
+    stub = serve(latency=args.latency, failure_rate=args.failure_rate)
+    database = os.path.join(tempfile.mkdtemp(), 'card_bench.db')
+    os.environ.update(DATABASE_URL=f'sqlite:///{database}', STRIPE_API_BASE=stub.url,
+                      STRIPE_API_KEY='sk_test_stub', PASSWORD_HASH_WORKERS='0')
+
+    import jwt
+    from app import app
+    from models import db, User, Payment
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(db.insert(User), [
+            {'tenant_id': f'{i:06d}', 'name': f'Tenant {i}', 'password_hash': 'x', 'is_owner': False, 'rent_amount': 5000.0}
+            for i in range(args.tenants)
+        ])
+        db.session.commit()
+        tokens = [jwt.encode({'user_id': user_id, 'is_owner': False}, app.config['SECRET_KEY'], algorithm='HS256')
+                  for user_id in db.session.scalars(db.select(User.id))]
+
+    def pay(token):
+        started = time.perf_counter()
+        response = app.test_client().post('/api/create_payment', json={'payment_method': 'card'},
+                                          headers={'Authorization': f'Bearer {token}'})
+        assert response.status_code == 202, response.get_data(as_text=True)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        latencies = list(executor.map(pay, tokens))
+    accepted = time.perf_counter() - started
+
+    with app.app_context():
+        while db.session.scalar(db.select(db.func.count()).where(Payment.intent_status.in_(('queued', 'creating')))):
+            db.session.rollback()
+            time.sleep(0.05)
+        failed = db.session.scalar(db.select(db.func.count()).where(Payment.intent_status == 'failed'))
+    ready = time.perf_counter() - started
+
+    stats = stub.state.stats()
+    print(f"tenants={args.tenants} concurrency={args.concurrency} stripe_latency={args.latency}s "
+          f"failure_rate={args.failure_rate}")
+    print(f"create_payment  p50={statistics.median(latencies) * 1000:.1f}ms "
+          f"p99={percentile(latencies, 0.99) * 1000:.1f}ms  all accepted in {accepted:.2f}s")
+    print(f"intents ready in {ready:.2f}s: created={stats['created']} replayed={stats['replayed']} "
+          f"provider_errors={stats['failures']} failed_payments={failed}")
+    stub.shutdown()
+
+if __name__ == '__main__':
+    main()
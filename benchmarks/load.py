@@ -0,0 +1,434 @@
+"""Load test for every web and API route on a seeded database.
+
+Seeds a throwaway SQLite database with benchmarks.seed and then runs each
+route in turn from a thread pool. Read routes go first, then writes.
+Web routes use logged-in session clients and API routes use JWT bearer
+tokens. Each worker thread logs in once per role; logins are not timed.
+For every route the report shows p50/p99 latency, throughput and SQL
+statements per request. Statements are counted on the request's own
+thread, so background workers are not included.
+
+    python -m benchmarks.load                     # 200 tenants x 3 years, 40 requests per route
+    python -m benchmarks.load --check             # fail on errors or extra queries vs benchmarks/baselines.json
+    python -m benchmarks.load --update-baseline   # record this run as the new baseline
+    python -m benchmarks.load --route owner_dashboard --requests 200 --tenants 1000
+
+--check compares against a baseline recorded with the same --tenants,
+--years, --requests and --concurrency.
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from benchmarks.report import (BASELINE_FILE, summarize, format_table, load_baseline, save_baseline, compare,
+                               slower_routes, LATENCY_SLACK_MS)
+from benchmarks.seed import OWNER_EMAIL, PASSWORD, seed
+from benchmarks.webhook_burst import SECRET, event, signed
+
+METRICS_TOKEN = 'load-test-metrics-token'
+
+Route = namedtuple('Route', 'name app role request')
+ROUTES = []
+
+def route(name, app='web', role='anon'):
+    """Register a route; the function gets (fixtures, session, n) and returns the call to time"""
+    def register(fn):
+        ROUTES.append(Route(name, app, role, fn))
+        return fn
+    return register
+
+# Statements run by the current thread, reset before each timed request
+_counter = threading.local()
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    _counter.statements = getattr(_counter, 'statements', 0) + 1
+
+class Session:
+    """A test client acting as one user"""
+
+    def __init__(self, client, user_id=None, headers=None):
+        self.client = client
+        self.user_id = user_id
+        self.headers = headers or {}
+
+    def get(self, path, headers=None, **kwargs):
+        return self.client.get(path, headers={**self.headers, **(headers or {})}, **kwargs)
+
+    def post(self, path, headers=None, **kwargs):
+        return self.client.post(path, headers={**self.headers, **(headers or {})}, **kwargs)
+
+class Fixtures:
+    """Seeded data plus per-thread logged-in sessions for web and API routes"""
+
+    def __init__(self, apps, data):
+        self.apps = apps
+        self.data = data
+        self.cards = {}
+        for payment_id, user_id, intent_id in data.card_payments:
+            self.cards.setdefault(user_id, (payment_id, intent_id))
+        self._local = threading.local()
+        self._tenants = itertools.cycle(data.tenants)
+        self._numbers = itertools.count()
+        self._lock = threading.Lock()
+
+    def number(self):
+        """A process-wide unique, increasing number"""
+        with self._lock:
+            return next(self._numbers)
+
+    def next_tenant(self):
+        with self._lock:
+            return next(self._tenants)
+
+    def login_web(self, tenant=None):
+        client = self.apps['web'].test_client()
+        login = tenant[1] if tenant else OWNER_EMAIL
+        response = client.post('/login', data={'tenant_id': login, 'password': PASSWORD})
+        assert response.status_code == 302, f'login failed for {login}'
+        return Session(client, tenant[0] if tenant else self.data.owner_id)
+
+    def token_session(self, user_id, is_owner):
+        import jwt
+        app = self.apps['api']
+        token = jwt.encode({'user_id': user_id, 'is_owner': is_owner, 'exp': datetime.utcnow() + timedelta(days=1)},
+                           app.config['SECRET_KEY'], algorithm='HS256')
+        return Session(app.test_client(), user_id, {'Authorization': f'Bearer {token}'})
+
+    def session(self, app, role):
+        """This thread's session for `role` on `app`, logging in the first time"""
+        sessions = self._local.__dict__.setdefault('sessions', {})
+        if (app, role) not in sessions:
+            if role == 'anon':
+                sessions[app, role] = Session(self.apps[app].test_client())
+            elif app == 'web':
+                sessions[app, role] = self.login_web(self.next_tenant() if role == 'tenant' else None)
+            elif role == 'tenant':
+                sessions[app, role] = self.token_session(self.next_tenant()[0], False)
+            else:
+                sessions[app, role] = self.token_session(self.data.owner_id, True)
+        return sessions[app, role]
+
+    def make_tenant(self):
+        """A throwaway tenant with some history, for delete_tenant"""
+        from models import db, User, MeterReading, Payment
+        from tenant_ids import allocate_tenant_ids
+        with self.apps['web'].app_context():
+            user_id = db.session.scalar(db.insert(User).returning(User.id).values(
+                tenant_id=allocate_tenant_ids(1)[0], name='Leaving tenant', password_hash='x', rent_amount=5000.0))
+            start = datetime.now() - timedelta(days=365)
+            db.session.execute(db.insert(MeterReading), [
+                {'user_id': user_id, 'reading_value': 100.0 * month, 'reading_date': start + timedelta(days=30 * month),
+                 'image_path': '', 'meter_type': meter_type, 'is_processed': True}
+                for month in range(12) for meter_type in ('electricity', 'water')])
+            db.session.execute(db.insert(Payment), [
+                {'user_id': user_id, 'amount': 5000.0, 'payment_date': start + timedelta(days=30 * month),
+                 'payment_method': 'cash', 'status': 'confirmed'} for month in range(12)])
+            db.session.commit()
+        return user_id
+
+def _meter_photo():
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), (90, 120, 150)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+METER_PHOTO = None
+
+# Web app, reads
+
+@route('GET /')
+def index(f, s, n):
+    return lambda: s.get('/')
+
+@route('GET /login')
+def login_form(f, s, n):
+    return lambda: s.get('/login')
+
+@route('GET /register')
+def register_form(f, s, n):
+    return lambda: s.get('/register')
+
+@route('GET /tenant_dashboard', role='tenant')
+def tenant_dashboard(f, s, n):
+    return lambda: s.get('/tenant_dashboard')
+
+@route('GET /owner_dashboard', role='owner')
+def owner_dashboard(f, s, n):
+    return lambda: s.get('/owner_dashboard')
+
+@route('GET /payments', role='owner')
+def payments(f, s, n):
+    return lambda: s.get('/payments', query_string={'status': 'pending'} if n % 2 else {})
+
+@route('GET /export/payments.csv', role='owner')
+def export_payments(f, s, n):
+    start = (datetime.now() - timedelta(days=90)).strftime('%Y-%m-%d')
+    return lambda: s.get('/export/payments.csv', query_string={'start': start})
+
+@route('GET /export/readings.ndjson', role='owner')
+def export_readings(f, s, n):
+    tenant = f.data.tenants[n % len(f.data.tenants)][1]
+    return lambda: s.get('/export/readings.ndjson', query_string={'tenant_id': tenant})
+
+@route('GET /register_tenant', role='owner')
+def register_tenant_form(f, s, n):
+    return lambda: s.get('/register_tenant')
+
+@route('GET /payment_intent/<id>', role='tenant')
+def payment_intent(f, s, n):
+    payment_id, _ = f.cards.get(s.user_id, (0, None))
+    return lambda: s.get(f'/payment_intent/{payment_id}')
+
+@route('GET /change_password', role='tenant')
+def change_password_form(f, s, n):
+    return lambda: s.get('/change_password')
+
+@route('GET /usage', role='tenant')
+def usage(f, s, n):
+    return lambda: s.get('/usage?months=36')
+
+@route('GET /usage (building)', role='owner')
+def usage_building(f, s, n):
+    return lambda: s.get('/usage?months=36')
+
+# API, reads
+
+@route('GET /api/tenant/dashboard', app='api', role='tenant')
+def api_tenant_dashboard(f, s, n):
+    return lambda: s.get('/api/tenant/dashboard')
+
+@route('GET /api/payments/<id>/intent', app='api', role='tenant')
+def api_payment_intent(f, s, n):
+    payment_id, _ = f.cards.get(s.user_id, (0, None))
+    return lambda: s.get(f'/api/payments/{payment_id}/intent')
+
+@route('GET /api/tenant/usage', app='api', role='tenant')
+def api_tenant_usage(f, s, n):
+    return lambda: s.get('/api/tenant/usage?months=36')
+
+@route('GET /api/owner/usage', app='api', role='owner')
+def api_owner_usage(f, s, n):
+    _, tenant_id = f.data.tenants[n % len(f.data.tenants)]
+    return lambda: s.get(f'/api/owner/usage?months=36&tenant_id={tenant_id}')
+
+@route('GET /api/admin/cache_stats', app='api', role='owner')
+def api_cache_stats(f, s, n):
+    return lambda: s.get('/api/admin/cache_stats')
+
+@route('GET /metrics')
+def metrics(f, s, n):
+    # With the token, as a Prometheus scraper would call it; anything else gets 401/403 and counts as an error
+    return lambda: s.get('/metrics', headers={'Authorization': f'Bearer {METRICS_TOKEN}'})
+
+# Logins
+
+@route('POST /login')
+def login(f, s, n):
+    tenant = f.data.tenants[n % len(f.data.tenants)][1]
+    client = f.apps['web'].test_client()
+    return lambda: client.post('/login', data={'tenant_id': tenant, 'password': PASSWORD})
+
+@route('GET /logout')
+def logout(f, s, n):
+    session = f.login_web(f.next_tenant())
+    return lambda: session.get('/logout')
+
+@route('POST /api/login', app='api')
+def api_login(f, s, n):
+    tenant = f.data.tenants[n % len(f.data.tenants)][1]
+    return lambda: s.post('/api/login', json={'tenant_id': tenant, 'password': PASSWORD})
+
+# Web app, writes
+
+@route('POST /register')
+def register(f, s, n):
+    # An owner exists, so this is turned away after the lookup
+    return lambda: s.post('/register', data={'email': f'owner{n}@benchmark.local', 'name': 'Owner', 'password': PASSWORD})
+
+@route('POST /register_tenant', role='owner')
+def register_tenant(f, s, n):
+    form = {'name': f'New tenant {n}', 'rent_amount': '7500', 'initial_electricity_reading': '1200',
+            'initial_water_reading': '80', 'phone_number': '+919000099999', 'rent_due_day': '5'}
+    return lambda: s.post('/register_tenant', data=form)
+
+@route('POST /bulk_register_tenants', role='owner')
+def bulk_register_tenants(f, s, n):
+    rows = '\n'.join(f'Imported {n}-{i},6000,{100 * i},{10 * i}' for i in range(1, 6))
+    body = f'name,rent_amount,initial_electricity_reading,initial_water_reading\n{rows}\n'.encode()
+    return lambda: s.post('/bulk_register_tenants', data={'tenants_csv': (io.BytesIO(body), 'tenants.csv')})
+
+@route('POST /set_electricity_rate', role='owner')
+def set_electricity_rate(f, s, n):
+    return lambda: s.post('/set_electricity_rate', data={'rate_per_unit': str(8 + n % 3)})
+
+@route('POST /upload_reading', role='tenant')
+def upload_reading(f, s, n):
+    value = 100000 + f.number()
+    form = {'electricity_reading': str(value), 'electricity_image': (io.BytesIO(METER_PHOTO), 'electricity.jpg'),
+            'water_reading': str(value), 'water_image': (io.BytesIO(METER_PHOTO), 'water.jpg')}
+    return lambda: s.post('/upload_reading', data=form, content_type='multipart/form-data')
+
+@route('POST /create_payment', role='tenant')
+def create_payment(f, s, n):
+    return lambda: s.post('/create_payment', json={'payment_method': 'cash' if n % 2 else 'bank_transfer'})
+
+@route('POST /confirm_payment/<id>', role='owner')
+def confirm_payment(f, s, n):
+    pending = f.data.pending_payment_ids
+    return lambda: s.post(f'/confirm_payment/{pending[(2 * n) % len(pending)]}')
+
+@route('POST /reject_payment/<id>', role='owner')
+def reject_payment(f, s, n):
+    pending = f.data.pending_payment_ids
+    return lambda: s.post(f'/reject_payment/{pending[(2 * n + 1) % len(pending)]}')
+
+@route('GET /payment_success', role='tenant')
+def payment_success(f, s, n):
+    _, intent_id = f.cards.get(s.user_id, (0, 'pi_missing'))
+    return lambda: s.get('/payment_success', query_string={'payment_intent': intent_id})
+
+@route('POST /stripe/webhook')
+def stripe_webhook(f, s, n):
+    _, _, intent_id = f.data.card_payments[n % len(f.data.card_payments)]
+    body = event(10 ** 7 + f.number(), 'payment_intent.succeeded', intent_id)
+    return lambda: s.post('/stripe/webhook', data=body, headers=signed(body))
+
+@route('POST /delete_tenant/<id>', role='owner')
+def delete_tenant(f, s, n):
+    user_id = f.make_tenant()
+    return lambda: s.post(f'/delete_tenant/{user_id}')
+
+@route('POST /change_password', role='tenant')
+def change_password(f, s, n):
+    form = {'current_password': PASSWORD, 'new_password': PASSWORD, 'confirm_password': PASSWORD}
+    return lambda: s.post('/change_password', data=form)
+
+# API, writes
+
+@route('POST /api/create_payment', app='api', role='tenant')
+def api_create_payment(f, s, n):
+    return lambda: s.post('/api/create_payment', json={'payment_method': 'cash'})
+
+@route('POST /api/readings/batch', app='api', role='owner')
+def api_readings_batch(f, s, n):
+    records = []
+    for i in range(20):
+        number = f.number()
+        records.append({'tenant_id': f.data.tenants[number % len(f.data.tenants)][1],
+                        'meter_type': ('electricity', 'water')[i % 2], 'value': 200000 + number,
+                        'timestamp': int(time.time()) + number})
+    return lambda: s.post('/api/readings/batch', json=records)
+
+@route('POST /api/register_tenant', app='api', role='owner')
+def api_register_tenant(f, s, n):
+    body = {'name': f'API tenant {n}', 'rent_amount': 6500, 'initial_electricity_reading': 500,
+            'initial_water_reading': 40, 'rent_due_day': 10}
+    return lambda: s.post('/api/register_tenant', json=body)
+
+@route('POST /api/change_password', app='api', role='tenant')
+def api_change_password(f, s, n):
+    return lambda: s.post('/api/change_password', json={'current_password': PASSWORD, 'new_password': PASSWORD})
+
+def run_route(executor, concurrency, fixtures, route, requests):
+    def one(n):
+        session = fixtures.session(route.app, route.role)
+        call = route.request(fixtures, session, n)
+        _counter.statements = 0
+        started = time.perf_counter()
+        try:
+            response = call()
+            response.get_data()  # drain streamed responses inside the timing
+            ok = response.status_code < 400
+        except Exception:
+            ok = False
+        return time.perf_counter() - started, _counter.statements, ok
+
+    outcomes = list(executor.map(one, range(requests)))
+    latencies = [latency for latency, _, ok in outcomes if ok]
+    statements = [count for _, count, ok in outcomes if ok]
+    # Throughput of the timed calls only; per-request setup such as logging in is left out
+    busy = sum(latency for latency, _, _ in outcomes) / concurrency
+    return summarize(route.name, latencies, statements, len(outcomes) - len(latencies), busy)
+
+def main():
+    global METER_PHOTO
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tenants', type=int, default=200)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--requests', type=int, default=40, help='Requests per route')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--route', action='append', help='Only routes whose name contains this (repeatable)')
+    parser.add_argument('--check', action='store_true',
+                        help='Exit 1 on errors or query-count regressions against the baseline')
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--latency-tolerance', type=float, default=1.0,
+                        help='p50 slowdown --check reports as advisory, as a fraction (1.0 = twice as slow)')
+    parser.add_argument('--latency-slack-ms', type=float, default=LATENCY_SLACK_MS,
+                        help='...and in milliseconds; a route is reported only when over both')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ.update(DATABASE_URL=f"sqlite:///{os.path.join(directory, 'load.db')}", STRIPE_WEBHOOK_SECRET=SECRET,
+                      METRICS_TOKEN=METRICS_TOKEN)
+    os.environ.setdefault('SECRET_KEY', 'load-test-secret-key-of-a-decent-length')
+    os.environ.pop('DATABASE_REPLICA_URL', None)
+
+    from sqlalchemy import event as sa_event
+    from sqlalchemy.engine import Engine
+    from app import app
+    from models import db
+
+    uploads = os.path.join(directory, 'uploads')
+    os.makedirs(uploads)
+    app.config['UPLOAD_FOLDER'] = uploads
+    app.config['UPLOAD_STAGING_FOLDER'] = os.path.join(directory, 'upload-staging')
+    app.logger.disabled = True  # failures are counted in the report
+    METER_PHOTO = _meter_photo()
+
+    with app.app_context():
+        db.create_all()
+        data = seed(args.tenants, args.years)
+    fixtures = Fixtures({'web': app, 'api': app}, data)
+    sa_event.listen(Engine, 'before_cursor_execute', _count_statement)
+
+    routes = [r for r in ROUTES if not args.route or any(part in r.name for part in args.route)]
+    rows = []
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for route_ in routes:
+            # The routes print debug lines of their own
+            with contextlib.redirect_stdout(io.StringIO()):
+                rows.append(run_route(executor, args.concurrency, fixtures, route_, args.requests))
+            print(f'{route_.name}: done', file=sys.stderr)
+
+    print(f"tenants={args.tenants} years={args.years} requests={args.requests} concurrency={args.concurrency}")
+    print(format_table(rows))
+
+    params = {'tenants': args.tenants, 'years': args.years, 'requests': args.requests, 'concurrency': args.concurrency}
+    if args.update_baseline:
+        save_baseline(rows, params, args.baseline)
+        print(f'Baseline written to {args.baseline}')
+    if args.check:
+        baseline = load_baseline(args.baseline)
+        failures = compare(rows, baseline, params)
+        if baseline['params'] == params:
+            # Latency depends on the machine, so it is reported but never fails the check
+            for note in slower_routes(rows, baseline, args.latency_tolerance, args.latency_slack_ms):
+                print(f'SLOWER (advisory) {note}')
+        for failure in failures:
+            print(f'REGRESSION {failure}')
+        if failures:
+            sys.exit(1)
+        print('No regressions against the baseline')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Login throughput at different concurrency levels, with and without the hashing pool.
+
+Seeds a throwaway SQLite database with tenants and fires concurrent
+POST /api/login requests from a thread pool, the way waitress threads would.
+
+    python -m benchmarks.login_throughput --users 32 --concurrency 1 2 4 8 16
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+def run(app, tenant_ids, password, concurrency, rounds):
+    def login(tenant_id):
+        client = app.test_client()
+        response = client.post('/api/login', json={'tenant_id': tenant_id, 'password': password})
+        assert response.status_code == 200, response.get_data(as_text=True)
+
+    attempts = tenant_ids * rounds
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(login, attempts))
+    elapsed = time.perf_counter() - started
+    return len(attempts) / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=32)
+    parser.add_argument('--rounds', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, os.cpu_count() or 1],
+                        help='PASSWORD_HASH_WORKERS values to compare (0 = hash on the request thread)')
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'login_bench.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+
+    import passwords
+    from app import app
+    from models import db, User
+
+    password = 'bench-password'
+    with app.app_context():
+        db.create_all()
+        pwhash = passwords.hash_password(password)
+        for i in range(args.users):
+            db.session.add(User(tenant_id=f'{i:06d}', name=f'Tenant {i}', password_hash=pwhash))
+        db.session.commit()
+    tenant_ids = [f'{i:06d}' for i in range(args.users)]
+
+    print(f"method={passwords.METHOD} users={args.users} rounds={args.rounds}")
+    print(f"{'workers':>8} {'concurrency':>12} {'logins/s':>10}")
+    for workers in args.workers:
+        passwords.shutdown()
+        passwords.WORKERS = workers
+        if workers:
+            passwords.hash_password('warm up the pool')
+        for concurrency in args.concurrency:
+            rate = run(app, tenant_ids, password, concurrency, args.rounds)
+            print(f"{workers:>8} {concurrency:>12} {rate:>10.1f}")
+    passwords.shutdown()
+
+if __name__ == '__main__':
+    main()
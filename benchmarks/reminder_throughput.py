@@ -0,0 +1,59 @@
+"""Rent reminder throughput against the local SMS gateway stub.
+
+Seeds a throwaway SQLite database with tenants due today, then for each
+concurrency level empties the outbox, queues the reminders and sends them
+through benchmarks.sms_gateway. Every run checks that each tenant got exactly
+one message.
+
+    python -m benchmarks.reminder_throughput --tenants 2000 --latency 0.05 --concurrency 1 10 50
+"""
+import argparse
+import os
+import tempfile
+from datetime import date
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tenants', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--failure-rate', type=float, default=0.02)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50])
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'reminder_bench.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+
+    from app import app
+    from models import db, User, ReminderOutbox
+    from reminders import SmsGateway, enqueue_due_reminders, dispatch_reminders
+    from benchmarks.sms_gateway import serve
+
+    today = date.today()
+    with app.app_context():
+        db.create_all()
+        db.session.execute(db.insert(User), [
+            {'tenant_id': f'{i:06d}', 'name': f'Tenant {i}', 'password_hash': 'x', 'is_owner': False,
+             'rent_amount': 1000.0, 'phone_number': f'+9190000{i:05d}', 'rent_due_day': today.day}
+            for i in range(args.tenants)
+        ])
+        db.session.commit()
+
+    server = serve(latency=args.latency, failure_rate=args.failure_rate)
+    print(f"tenants={args.tenants} latency={args.latency}s failure_rate={args.failure_rate}")
+    print(f"{'concurrency':>12} {'sent':>6} {'failed':>7} {'retries':>8} {'seconds':>8} {'msgs/s':>8}")
+    for concurrency in args.concurrency:
+        server.state.reset()
+        with app.app_context():
+            db.session.execute(db.delete(ReminderOutbox))
+            db.session.commit()
+            enqueue_due_reminders(today)
+            result = dispatch_reminders(SmsGateway(server.url, pool_size=concurrency),
+                                        concurrency=concurrency, backoff=0.05)
+        stats = server.state.stats()
+        assert stats['delivered'] == result['sent'] and stats['duplicates'] == 0, stats
+        print(f"{concurrency:>12} {result['sent']:>6} {result['failed']:>7} {stats['failures']:>8} "
+              f"{result['seconds']:>8.2f} {result['sent'] / result['seconds']:>8.1f}")
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Read-replica routing against two local SQLite files.
+
+Seeds a primary database and copies it to a second file that stands in for
+the replica. Nothing replicates between them, so any write shows up only on
+the primary, which makes the routing easy to see. A thread pool then loads
+API dashboards while some tenants record cash payments. The report counts
+statements per database. It then checks read-your-writes: a tenant's payment
+is on their dashboard right after they make it, and once the window has
+passed the dashboard is read from the replica again.
+
+    python -m benchmarks.replica_routing --tenants 200 --requests 2000 --concurrency 16
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+WINDOW = 1.0  # DB_REPLICA_READ_YOUR_WRITES for this run
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tenants', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--write-share', type=float, default=0.05)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    primary, replica = os.path.join(directory, 'primary.db'), os.path.join(directory, 'replica.db')
+    os.environ.update(DATABASE_URL=f'sqlite:///{primary}', DATABASE_REPLICA_URL=f'sqlite:///{replica}',
+                      DB_REPLICA_READ_YOUR_WRITES=str(WINDOW), PASSWORD_HASH_WORKERS='0')
+    os.environ.setdefault('SECRET_KEY', 'replica-routing-benchmark-secret')
+
+    from datetime import datetime, timedelta
+    import jwt
+    from sqlalchemy import event
+    from app import app
+    from db_config import REPLICA_BIND
+    from models import db, User, MeterReading, ElectricityRate
+    from queries import rebuild_latest_readings
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(ElectricityRate(rate_per_unit=8.0, effective_from=datetime.now() - timedelta(days=365)))
+        db.session.execute(db.insert(User), [
+            {'tenant_id': f'{i:06d}', 'name': f'Tenant {i}', 'password_hash': 'x', 'is_owner': False, 'rent_amount': 5000.0}
+            for i in range(args.tenants)
+        ])
+        user_ids = db.session.scalars(db.select(User.id)).all()
+        start = datetime.now() - timedelta(days=90)
+        db.session.execute(db.insert(MeterReading), [
+            {'user_id': user_id, 'reading_value': 100.0 * month, 'reading_date': start + timedelta(days=30 * month),
+             'image_path': '', 'meter_type': meter_type, 'is_processed': True}
+            for user_id in user_ids for month in range(4) for meter_type in ('electricity', 'water')
+        ])
+        rebuild_latest_readings()
+        db.session.commit()
+        source, target = sqlite3.connect(primary), sqlite3.connect(replica)
+        source.backup(target)
+        source.close(), target.close()
+
+        engines = {db.engine: 'primary', app.extensions['sqlite_writer_engine']: 'primary',
+                   db.engines[REPLICA_BIND]: 'replica'}
+        tokens = {user_id: jwt.encode({'user_id': user_id, 'is_owner': False}, app.config['SECRET_KEY'],
+                                      algorithm='HS256')
+                  for user_id in user_ids}
+
+    statements = Counter()
+    lock = threading.Lock()
+    for engine, name in engines.items():
+        @event.listens_for(engine, 'before_cursor_execute')
+        def count(conn, cursor, statement, parameters, context, executemany, name=name):
+            with lock:
+                statements[name] += 1
+
+    def call(seed):
+        rng = random.Random(seed)
+        headers = {'Authorization': f'Bearer {tokens[rng.choice(user_ids[1:])]}'}
+        client = app.test_client()
+        if rng.random() < args.write_share:
+            response = client.post('/api/create_payment', json={'payment_method': 'cash'}, headers=headers)
+        else:
+            response = client.get('/api/tenant/dashboard', headers=headers)
+        assert response.status_code < 400, response.get_data(as_text=True)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(call, range(args.requests)))
+    elapsed = time.perf_counter() - started
+    print(f"tenants={args.tenants} requests={args.requests} concurrency={args.concurrency} "
+          f"write_share={args.write_share}")
+    print(f"{args.requests / elapsed:.0f} req/s; statements on primary: {statements['primary']}, "
+          f"on replica: {statements['replica']}")
+
+    # Read-your-writes, for a tenant left out of the load: the replica never receives this payment
+    user_id = user_ids[0]
+    headers = {'Authorization': f'Bearer {tokens[user_id]}'}
+    client = app.test_client()
+    def payments():
+        return len(client.get('/api/tenant/dashboard', headers=headers).get_json()['payment_history'])
+    before = payments()
+    client.post('/api/create_payment', json={'payment_method': 'cash'}, headers=headers)
+    right_after = payments()
+    time.sleep(WINDOW + 0.2)
+    later = payments()
+    print(f"tenant {user_id}: {before} payments before paying, {right_after} right after (primary), "
+          f"{later} after {WINDOW}s (replica, which never got the write)")
+    assert right_after == before + 1 and later == before
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Per-route summary of a load run, and comparison against checked-in baselines.
+
+A route fails the check when it:
+- returned errors
+- ran more SQL statements per request (median) than its baseline
+
+Statement counts do not depend on the machine, so they catch N+1 regressions
+reliably and are the only thing the check gates on. Baseline latencies are
+absolute milliseconds from whichever machine recorded them, so a p50 well
+above its baseline is only reported as advisory, for a human to judge.
+"""
+import json
+import os
+import statistics
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'baselines.json')
+# p50 latencies below this are too noisy to compare
+LATENCY_FLOOR_MS = 5.0
+# A route may always get this much slower in absolute terms, so scheduler
+# jitter on millisecond routes does not fail the check
+LATENCY_SLACK_MS = 20.0
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))] if values else 0.0
+
+def summarize(route, latencies, statements, errors, elapsed):
+    return {
+        'route': route,
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(statistics.median(latencies) * 1000, 2) if latencies else 0.0,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'queries': statistics.median(statements) if statements else 0,
+        'queries_max': max(statements, default=0),
+    }
+
+def format_table(rows):
+    width = max([len(row['route']) for row in rows] + [5])
+    lines = [f"{'route':<{width}} {'n':>5} {'err':>4} {'p50 ms':>8} {'p99 ms':>8} {'req/s':>7} {'queries':>7} {'max':>5}"]
+    for row in rows:
+        lines.append(f"{row['route']:<{width}} {row['requests']:>5} {row['errors']:>4} {row['p50_ms']:>8.1f} "
+                     f"{row['p99_ms']:>8.1f} {row['rps']:>7.1f} {row['queries']:>7g} {row['queries_max']:>5}")
+    return '\n'.join(lines)
+
+def load_baseline(path=BASELINE_FILE):
+    with open(path) as f:
+        return json.load(f)
+
+def save_baseline(rows, params, path=BASELINE_FILE):
+    routes = {row['route']: {'queries': row['queries'], 'p50_ms': row['p50_ms'], 'p99_ms': row['p99_ms']}
+              for row in rows}
+    with open(path, 'w') as f:
+        json.dump({'params': params, 'routes': routes}, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+def compare(rows, baseline, params):
+    """Regressions against `baseline` as a list of messages; empty when the run passes"""
+    if baseline['params'] != params:
+        return [f"baseline was recorded with {baseline['params']}, this run used {params}; "
+                f"rerun with the same options or record a new baseline"]
+    failures = []
+    for row in rows:
+        if row['errors']:
+            failures.append(f"{row['route']}: {row['errors']} failed requests")
+        expected = baseline['routes'].get(row['route'])
+        if expected is None:
+            continue
+        if row['queries'] > expected['queries']:
+            failures.append(f"{row['route']}: {row['queries']:g} queries per request, baseline {expected['queries']:g}")
+    return failures
+
+def slower_routes(rows, baseline, latency_tolerance=1.0, latency_slack_ms=LATENCY_SLACK_MS):
+    """Advisory messages for routes whose p50 exceeds both the relative and the absolute allowance"""
+    notes = []
+    for row in rows:
+        expected = baseline['routes'].get(row['route'])
+        if expected is None:
+            continue
+        limit = max(max(expected['p50_ms'], LATENCY_FLOOR_MS) * (1 + latency_tolerance),
+                    expected['p50_ms'] + latency_slack_ms)
+        if row['p50_ms'] > limit:
+            notes.append(f"{row['route']}: p50 {row['p50_ms']:.1f}ms, baseline {expected['p50_ms']:.1f}ms "
+                         f"(limit {limit:.1f}ms)")
+    return notes
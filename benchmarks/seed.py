@@ -0,0 +1,139 @@
+"""Synthetic data for benchmarks: an owner, N tenants and years of history.
+
+Every tenant gets a monthly electricity and water reading, and a monthly
+payment. Payments are confirmed or completed, except this month's, which
+are still pending. Some are card payments with a Stripe PaymentIntent.
+The electricity rate changes every six months, and there is one water bill
+per month. The same --seed always produces the same data.
+
+    python -m benchmarks.seed --database /tmp/bench.db --tenants 500 --years 3
+"""
+import argparse
+import os
+import random
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+OWNER_EMAIL = 'owner@benchmark.local'
+PASSWORD = 'benchmark-password'
+INSERT_BATCH = 5000
+
+Dataset = namedtuple('Dataset', 'owner_id tenants pending_payment_ids card_payments')
+
+def _months(now, count):
+    """First day of each of the last `count` months, oldest first, ending with this month"""
+    year, month = now.year, now.month
+    starts = []
+    for _ in range(count):
+        starts.append(datetime(year, month, 1))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return starts[::-1]
+
+def _insert(model, rows):
+    from models import db
+    for start in range(0, len(rows), INSERT_BATCH):
+        db.session.execute(db.insert(model), rows[start:start + INSERT_BATCH])
+
+def seed(tenants=200, years=3, seed=0, now=None):
+    """Fill the current app's empty database and commit; returns a Dataset"""
+    from models import db, User, MeterReading, Payment, ElectricityRate, WaterBill
+    from passwords import hash_password
+    from queries import rebuild_latest_readings
+    from tenant_ids import allocate_tenant_ids
+    from usage import rebuild_monthly_consumption
+
+    rng = random.Random(seed)
+    now = now or datetime.now()
+    months = _months(now, years * 12)
+    password_hash = hash_password(PASSWORD)
+
+    owner = User(email=OWNER_EMAIL, name='Benchmark Owner', is_owner=True, password_hash=password_hash)
+    db.session.add(owner)
+    db.session.flush()
+    tenant_ids = allocate_tenant_ids(tenants)
+    users = db.session.scalars(db.insert(User).returning(User.id, sort_by_parameter_order=True), [
+        {'tenant_id': tenant_id, 'name': f'Tenant {number}', 'password_hash': password_hash, 'is_owner': False,
+         'rent_amount': float(rng.randrange(4000, 15000, 500)), 'phone_number': f'+9190000{number:05d}',
+         'rent_due_day': rng.randint(1, 28), 'created_at': months[0]}
+        for number, tenant_id in enumerate(tenant_ids)
+    ]).all()
+
+    rates = [{'rate_per_unit': round(6.0 + 0.25 * number, 2), 'effective_from': start}
+             for number, start in enumerate(months[::6])]
+    _insert(ElectricityRate, rates)
+
+    readings, payments = [], []
+    for user_id in users:
+        electricity, water = rng.uniform(0, 5000), rng.uniform(0, 500)
+        for month, start in enumerate(months):
+            day = start + timedelta(days=rng.randint(0, 4), hours=rng.randint(8, 20))
+            if day > now:
+                break
+            electricity += rng.uniform(80, 400)
+            water += rng.uniform(5, 30)
+            for meter_type, value in (('electricity', electricity), ('water', water)):
+                readings.append({'user_id': user_id, 'reading_value': round(value, 1), 'reading_date': day,
+                                 'image_path': '', 'meter_type': meter_type, 'is_processed': True})
+
+            payment_date = day + timedelta(days=rng.randint(1, 10))
+            if payment_date > now:
+                continue
+            method = rng.choice(('cash', 'bank_transfer', 'card'))
+            payment = {'user_id': user_id, 'amount': round(rng.uniform(5000, 20000), 2),
+                       'payment_date': payment_date, 'payment_method': method,
+                       'status': 'pending' if month == len(months) - 1 else 'confirmed'}
+            if method == 'card':
+                intent = f'pi_seed_{user_id}_{month}'
+                payment.update(stripe_payment_id=intent, idempotency_key=f'seed-{user_id}-{month}',
+                               intent_status='created', client_secret=f'{intent}_secret')
+                if payment['status'] == 'confirmed':
+                    payment['status'] = 'completed'
+            else:
+                payment['transaction_reference'] = f'RENT{payment_date:%Y%m%d%H%M%S}{user_id}'
+            payments.append(payment)
+    _insert(MeterReading, readings)
+    _insert(Payment, payments)
+
+    water_bills = []
+    for start, end in zip(months, months[1:] + [None]):
+        if end is None:
+            break
+        total = round(rng.uniform(200, 600), 1)
+        water_bills.append({'total_amount': total, 'billing_date': end, 'total_tenants': tenants,
+                            'amount_per_tenant': round(total / (tenants + 1) * 40, 2),
+                            'period_start': start, 'period_end': end})
+    _insert(WaterBill, water_bills)
+
+    rebuild_latest_readings()
+    rebuild_monthly_consumption()
+    db.session.commit()
+
+    pending = db.session.scalars(db.select(Payment.id).where(Payment.status == 'pending').order_by(Payment.id)).all()
+    cards = db.session.execute(
+        db.select(Payment.id, Payment.user_id, Payment.stripe_payment_id)
+        .where(Payment.payment_method == 'card').order_by(Payment.id)
+    ).all()
+    return Dataset(owner.id, list(zip(users, tenant_ids)), pending, [tuple(card) for card in cards])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', required=True, help='SQLite file to create')
+    parser.add_argument('--tenants', type=int, default=200)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if os.path.exists(args.database):
+        parser.error(f'{args.database} already exists')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.database)}'
+    from app import app
+    from models import db
+
+    with app.app_context():
+        db.create_all()
+        data = seed(args.tenants, args.years, args.seed)
+    print(f"Seeded {args.database}: {len(data.tenants)} tenants over {args.years} years, "
+          f"{len(data.pending_payment_ids)} pending payments. Owner {OWNER_EMAIL}, every password {PASSWORD!r}")
+
+if __name__ == '__main__':
+    main()
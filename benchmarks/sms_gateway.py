@@ -0,0 +1,111 @@
+"""Stand-in SMS gateway for running and benchmarking reminders offline.
+
+Accepts POST /messages with JSON {"to", "message", "reference"}, waits a
+configurable latency, fails a configurable share of requests with 503 and
+acknowledges repeated references without counting them twice. GET /stats
+returns the counters as JSON.
+
+    python -m benchmarks.sms_gateway --port 8025 --latency 0.05 --failure-rate 0.02
+    SMS_GATEWAY_URL=http://127.0.0.1:8025/messages flask --app app send-reminders
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class GatewayState:
+    def __init__(self, latency=0.05, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.lock = threading.Lock()
+        self.references = set()
+        self.counts = {'requests': 0, 'delivered': 0, 'duplicates': 0, 'failures': 0, 'in_flight': 0, 'max_in_flight': 0}
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def reset(self):
+        with self.lock:
+            self.references.clear()
+            for key in self.counts:
+                self.counts[key] = 0
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path != '/stats':
+            return self._reply(404, {'error': 'not found'})
+        self._reply(200, self.server.state.stats())
+
+    def do_POST(self):
+        state = self.server.state
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path != '/messages':
+            return self._reply(404, {'error': 'not found'})
+        try:
+            message = json.loads(body)
+            to, reference = message['to'], message['reference']
+        except (ValueError, KeyError, TypeError):
+            return self._reply(400, {'error': 'expected JSON with to, message and reference'})
+
+        with state.lock:
+            state.counts['requests'] += 1
+            state.counts['in_flight'] += 1
+            state.counts['max_in_flight'] = max(state.counts['max_in_flight'], state.counts['in_flight'])
+        try:
+            time.sleep(state.latency * random.uniform(0.5, 1.5))
+            if random.random() < state.failure_rate:
+                with state.lock:
+                    state.counts['failures'] += 1
+                return self._reply(503, {'error': 'temporarily unavailable'})
+            with state.lock:
+                duplicate = reference in state.references
+                state.references.add(reference)
+                state.counts['duplicates' if duplicate else 'delivered'] += 1
+            self._reply(200, {'status': 'queued', 'to': to, 'duplicate': duplicate})
+        finally:
+            with state.lock:
+                state.counts['in_flight'] -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port=0, latency=0.05, failure_rate=0.0):
+    """Start the gateway on a background thread; returns the server (server.url, server.state)"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    server.state = GatewayState(latency, failure_rate)
+    server.url = f'http://127.0.0.1:{server.server_address[1]}/messages'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds per message (randomised +/-50%%)')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of requests answered with 503')
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency, args.failure_rate)
+    print(f"SMS gateway listening on {server.url}")
+    try:
+        while True:
+            time.sleep(10)
+            print(server.state.stats())
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
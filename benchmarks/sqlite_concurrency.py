@@ -0,0 +1,118 @@
+"""Mixed read/write load on SQLite, stock settings versus the db_config profile.
+
+Seeds a throwaway database, then has a thread pool of tenants load their API
+dashboard and record cash payments for a fixed time. Each payment computes the
+bill first and inserts afterwards. With stock settings concurrent writers spin
+in SQLite's busy handler (and fail with "database is locked" once it runs
+out) while readers queue behind them; the profile hands writes to one writer
+connection in turn and lets WAL readers carry on. Each profile
+runs in its own process because the engine is configured at import time.
+Reports throughput, latency per request kind and failed requests.
+
+    python -m benchmarks.sqlite_concurrency --tenants 200 --concurrency 16 --seconds 10 --write-share 0.2
+    python -m benchmarks.sqlite_concurrency --profile stock     # one profile only
+"""
+import argparse
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PROFILES = {'stock': '0', 'production': '1'}
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))] if values else 0.0
+
+def run(args):
+    database = os.path.join(tempfile.mkdtemp(), 'concurrency_bench.db')
+    os.environ.update(DATABASE_URL=f'sqlite:///{database}', DB_SQLITE_PROFILE=PROFILES[args.profile],
+                      PASSWORD_HASH_WORKERS='0')
+    os.environ.setdefault('SECRET_KEY', 'sqlite-concurrency-benchmark-secret')
+
+    from datetime import datetime, timedelta
+    import jwt
+    from app import app
+    from models import db, User, MeterReading, ElectricityRate
+    from queries import rebuild_latest_readings
+
+    app.logger.disabled = True  # failed requests are counted below, not printed
+    with app.app_context():
+        db.create_all()
+        db.session.add(ElectricityRate(rate_per_unit=8.0, effective_from=datetime.now() - timedelta(days=365)))
+        db.session.execute(db.insert(User), [
+            {'tenant_id': f'{i:06d}', 'name': f'Tenant {i}', 'password_hash': 'x', 'is_owner': False, 'rent_amount': 5000.0}
+            for i in range(args.tenants)
+        ])
+        user_ids = db.session.scalars(db.select(User.id)).all()
+        start = datetime.now() - timedelta(days=90)
+        db.session.execute(db.insert(MeterReading), [
+            {'user_id': user_id, 'reading_value': 100.0 * month, 'reading_date': start + timedelta(days=30 * month),
+             'image_path': '', 'meter_type': meter_type, 'is_processed': True}
+            for user_id in user_ids for month in range(4) for meter_type in ('electricity', 'water')
+        ])
+        rebuild_latest_readings()
+        db.session.commit()
+        tokens = [jwt.encode({'user_id': user_id, 'is_owner': False}, app.config['SECRET_KEY'], algorithm='HS256')
+                  for user_id in user_ids]
+
+    deadline = time.perf_counter() + args.seconds
+    results = {'read': [], 'write': []}
+    failures = {'read': 0, 'write': 0}
+    lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            headers = {'Authorization': f'Bearer {rng.choice(tokens)}'}
+            kind = 'write' if rng.random() < args.write_share else 'read'
+            started = time.perf_counter()
+            if kind == 'write':
+                response = client.post('/api/create_payment', json={'payment_method': 'cash'}, headers=headers)
+            else:
+                response = client.get('/api/tenant/dashboard', headers=headers)
+            elapsed = time.perf_counter() - started
+            with lock:
+                if response.status_code >= 500:
+                    failures[kind] += 1
+                else:
+                    results[kind].append(elapsed)
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(worker, range(args.concurrency)))
+
+    done = len(results['read']) + len(results['write'])
+    print(f"[{args.profile}] {done / args.seconds:.0f} req/s  "
+          f"failed: {failures['write']} writes, {failures['read']} reads")
+    for kind in ('read', 'write'):
+        latencies = results[kind]
+        if latencies:
+            print(f"[{args.profile}]   {kind:5} n={len(latencies):6d}  p50={statistics.median(latencies) * 1000:7.1f}ms  "
+                  f"p99={percentile(latencies, 0.99) * 1000:7.1f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profile', choices=['both'] + list(PROFILES), default='both')
+    parser.add_argument('--tenants', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-share', type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.profile != 'both':
+        return run(args)
+    print(f"tenants={args.tenants} concurrency={args.concurrency} seconds={args.seconds} "
+          f"write_share={args.write_share}")
+    for profile in PROFILES:
+        subprocess.run([sys.executable, '-m', 'benchmarks.sqlite_concurrency', '--profile', profile,
+                        '--tenants', str(args.tenants), '--concurrency', str(args.concurrency),
+                        '--seconds', str(args.seconds), '--write-share', str(args.write_share)], check=True)
+
+if __name__ == '__main__':
+    main()
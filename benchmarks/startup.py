@@ -0,0 +1,85 @@
+"""Cold start: import time, first request and memory of a freshly started app.
+
+Each run starts a new interpreter. It imports an app, serves one request
+(/metrics, which needs no database) and reports the time taken and the
+process RSS. It also lists which heavy optional libraries were imported on
+the way. --target can be given more than once. The summary line then adds
+them up, as if each target ran as its own process.
+
+    python -m benchmarks.startup                                   # the combined app in app.py
+    python -m benchmarks.startup --target "factory:create_app('api')"
+    python -m benchmarks.startup --tree /path/to/older/checkout --target app:app --target api:app
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HEAVY_MODULES = ('stripe', 'PIL', 'numpy', 'requests', 'apscheduler')
+
+# Runs in the child interpreter; argv[1] is "module:attribute" or "module:factory(args)"
+CHILD = r'''
+import importlib, json, resource, sys, time
+started = time.perf_counter()
+module_name, expression = sys.argv[1].split(':', 1)
+module = importlib.import_module(module_name)
+app = eval(expression, vars(module))
+loaded = time.perf_counter()
+assert app.test_client().get('/metrics').status_code == 200
+served = time.perf_counter()
+try:
+    with open('/proc/self/status') as f:
+        rss_kb = next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+except OSError:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_kb = peak // 1024 if sys.platform == 'darwin' else peak
+print(json.dumps({'import_ms': (loaded - started) * 1000, 'first_request_ms': (served - loaded) * 1000,
+                  'rss_mb': rss_kb / 1024, 'heavy': [name for name in HEAVY if name in sys.modules]}))
+'''
+
+def measure(target, tree, runs):
+    """Median import time, first request time, RSS and wall time over `runs` fresh processes"""
+    samples = []
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(directory, 'startup.db')}",
+                   PYTHONDONTWRITEBYTECODE='1', METRICS_PUBLIC='1')
+        code = f'HEAVY = {HEAVY_MODULES!r}\n{CHILD}'
+        for _ in range(runs):
+            started = time.perf_counter()
+            output = subprocess.run([sys.executable, '-c', code, target], cwd=tree, env=env,
+                                    capture_output=True, text=True, check=True).stdout
+            sample = json.loads(output.strip().splitlines()[-1])
+            sample['wall_ms'] = (time.perf_counter() - started) * 1000
+            samples.append(sample)
+    row = {key: statistics.median(sample[key] for sample in samples)
+           for key in ('import_ms', 'first_request_ms', 'rss_mb', 'wall_ms')}
+    row['heavy'] = samples[-1]['heavy']
+    return row
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', action='append', help='module:app or module:factory(...) (default app:app)')
+    parser.add_argument('--tree', default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help='checkout to import from (default: this one)')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+    targets = args.target or ['app:app']
+
+    print(f"{'target':<32} {'import ms':>9} {'1st req ms':>10} {'wall ms':>8} {'RSS MB':>7}  heavy modules loaded")
+    rows = []
+    for target in targets:
+        row = measure(target, args.tree, args.runs)
+        rows.append(row)
+        print(f"{target:<32} {row['import_ms']:>9.0f} {row['first_request_ms']:>10.1f} {row['wall_ms']:>8.0f} "
+              f"{row['rss_mb']:>7.1f}  {', '.join(row['heavy']) or '-'}")
+    if len(rows) > 1:
+        print(f"{'total (one process each)':<32} {sum(row['import_ms'] for row in rows):>9.0f} "
+              f"{sum(row['first_request_ms'] for row in rows):>10.1f} {sum(row['wall_ms'] for row in rows):>8.0f} "
+              f"{sum(row['rss_mb'] for row in rows):>7.1f}")
+
+if __name__ == '__main__':
+    main()
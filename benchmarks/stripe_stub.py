@@ -0,0 +1,146 @@
+"""Stand-in for the Stripe PaymentIntents API, for load tests without a network.
+
+Implements POST /v1/payment_intents and GET /v1/payment_intents/<id> with a
+configurable latency and share of 500 responses, and honours Idempotency-Key
+the way Stripe does: a repeated key returns the original intent. Point the
+apps at it with STRIPE_API_BASE.
+
+    python -m benchmarks.stripe_stub --port 12111 --latency 0.3
+    STRIPE_API_BASE=http://127.0.0.1:12111 STRIPE_API_KEY=sk_test_stub python app.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+class StripeState:
+    def __init__(self, latency=0.3, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.lock = threading.Lock()
+        self.intents = {}
+        self.by_key = {}
+        self.counts = {'requests': 0, 'created': 0, 'replayed': 0, 'failures': 0}
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
+
+def _form_to_object(pairs):
+    """Decode Stripe's form encoding (metadata[user_id]=1) into a dict"""
+    data = {}
+    for key, value in pairs:
+        if '[' in key and key.endswith(']'):
+            outer, inner = key[:-1].split('[', 1)
+            data.setdefault(outer, {})[inner] = value
+        else:
+            data[key] = value
+    return data
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _error(self, status, message, kind='api_error'):
+        self._reply(status, {'error': {'type': kind, 'message': message}})
+
+    def _delay(self):
+        state = self.server.state
+        with state.lock:
+            state.counts['requests'] += 1
+        time.sleep(state.latency * random.uniform(0.5, 1.5))
+        if random.random() < state.failure_rate:
+            with state.lock:
+                state.counts['failures'] += 1
+            return True
+        return False
+
+    def do_GET(self):
+        state = self.server.state
+        if self.path == '/stats':
+            return self._reply(200, state.stats())
+        if not self.path.startswith('/v1/payment_intents/'):
+            return self._error(404, 'Unrecognized request URL', 'invalid_request_error')
+        if self._delay():
+            return self._error(500, 'Simulated failure')
+        intent = state.intents.get(self.path.rsplit('/', 1)[1])
+        if intent is None:
+            return self._error(404, 'No such payment_intent', 'invalid_request_error')
+        self._reply(200, intent)
+
+    def do_POST(self):
+        state = self.server.state
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+        if self.path != '/v1/payment_intents':
+            return self._error(404, 'Unrecognized request URL', 'invalid_request_error')
+        if self._delay():
+            return self._error(500, 'Simulated failure')
+
+        data = _form_to_object(parse_qsl(body))
+        if not data.get('amount', '').isdigit() or int(data['amount']) < 1:
+            return self._error(400, 'Invalid positive integer', 'invalid_request_error')
+
+        key = self.headers.get('Idempotency-Key')
+        with state.lock:
+            if key and key in state.by_key:
+                state.counts['replayed'] += 1
+                return self._reply(200, state.intents[state.by_key[key]])
+            intent_id = f'pi_{uuid.uuid4().hex[:24]}'
+            intent = {
+                'id': intent_id,
+                'object': 'payment_intent',
+                'amount': int(data['amount']),
+                'currency': data.get('currency', 'inr'),
+                'client_secret': f'{intent_id}_secret_{uuid.uuid4().hex[:16]}',
+                'metadata': data.get('metadata', {}),
+                'status': 'requires_payment_method',
+                'created': int(time.time()),
+                'livemode': False,
+            }
+            state.intents[intent_id] = intent
+            if key:
+                state.by_key[key] = intent_id
+            state.counts['created'] += 1
+        self._reply(200, intent)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port=0, latency=0.3, failure_rate=0.0):
+    """Start the stub on a background thread; returns the server (server.url, server.state)"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    server.state = StripeState(latency, failure_rate)
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=12111)
+    parser.add_argument('--latency', type=float, default=0.3, help='Seconds per call (randomised +/-50%%)')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of calls answered with 500')
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency, args.failure_rate)
+    print(f"Stripe stub listening on {server.url}")
+    try:
+        while True:
+            time.sleep(10)
+            print(server.state.stats())
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
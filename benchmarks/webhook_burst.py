@@ -0,0 +1,112 @@
+"""Month-end burst of Stripe webhook events against /stripe/webhook.
+
+Seeds a throwaway SQLite database with pending card payments, then posts
+correctly signed events for all of them from a thread pool: processing
+notices, some failures followed by success, and redeliveries of random
+events, the way Stripe retries. Reports the ingest rate and how many SQL
+statements the batched consumer needed, then checks every payment ended up
+completed.
+
+    python -m benchmarks.webhook_burst --payments 2000 --concurrency 16
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SECRET = 'whsec_benchmark'
+
+def signed(payload, secret=SECRET):
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+    return {'Stripe-Signature': f't={timestamp},v1={signature}', 'Content-Type': 'application/json'}
+
+def event(number, event_type, intent_id):
+    return json.dumps({
+        'id': f'evt_{number:08d}', 'object': 'event', 'type': event_type, 'created': int(time.time()),
+        'data': {'object': {'id': intent_id, 'object': 'payment_intent'}},
+    })
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--payments', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--failure-share', type=float, default=0.1)
+    parser.add_argument('--redelivery-share', type=float, default=0.2)
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'webhook_bench.db')
+    os.environ.update(DATABASE_URL=f'sqlite:///{database}', STRIPE_WEBHOOK_SECRET=SECRET, PASSWORD_HASH_WORKERS='0')
+
+    from datetime import datetime
+    from sqlalchemy import event as sa_event
+    from sqlalchemy.engine import Engine
+    from app import app
+    from models import db, User, Payment, StripeEvent
+    from stripe_events import apply_pending_events
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(db.insert(User), [
+            {'tenant_id': f'{i:06d}', 'name': f'Tenant {i}', 'password_hash': 'x', 'is_owner': False}
+            for i in range(args.payments)
+        ])
+        user_ids = db.session.scalars(db.select(User.id)).all()
+        db.session.execute(db.insert(Payment), [
+            {'user_id': user_id, 'amount': 5000.0, 'payment_date': datetime.now(), 'payment_method': 'card',
+             'status': 'pending', 'stripe_payment_id': f'pi_{user_id:08d}', 'intent_status': 'created'}
+            for user_id in user_ids
+        ])
+        db.session.commit()
+
+    bodies = []
+    for user_id in user_ids:
+        intent_id = f'pi_{user_id:08d}'
+        bodies.append(event(len(bodies), 'payment_intent.processing', intent_id))
+        if random.random() < args.failure_share:
+            bodies.append(event(len(bodies), 'payment_intent.payment_failed', intent_id))
+        bodies.append(event(len(bodies), 'payment_intent.succeeded', intent_id))
+    redeliveries = random.sample(bodies, int(len(bodies) * args.redelivery_share))
+    deliveries = bodies + redeliveries
+    random.shuffle(deliveries)
+
+    statements = {'count': 0}
+    lock = threading.Lock()
+
+    @sa_event.listens_for(Engine, 'before_cursor_execute')
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if threading.current_thread().name.startswith('stripe-events'):
+            with lock:
+                statements['count'] += 1
+
+    def deliver(body):
+        response = app.test_client().post('/stripe/webhook', data=body, headers=signed(body))
+        assert response.status_code == 200, response.get_data(as_text=True)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(deliver, deliveries))
+    ingest = time.perf_counter() - started
+
+    with app.app_context():
+        apply_pending_events()
+        stored = db.session.scalar(db.select(db.func.count()).select_from(StripeEvent))
+        completed = db.session.scalar(db.select(db.func.count()).where(Payment.status == 'completed'))
+    total = time.perf_counter() - started
+
+    print(f"payments={args.payments} deliveries={len(deliveries)} unique_events={len(bodies)} concurrency={args.concurrency}")
+    print(f"ingested {len(deliveries) / ingest:.0f} deliveries/s; stored {stored} events "
+          f"({len(deliveries) - stored} redeliveries dropped)")
+    print(f"background consumer ran {statements['count']} SQL statements for {stored} events; "
+          f"all applied after {total:.2f}s")
+    print(f"completed payments: {completed}/{args.payments}")
+    assert stored == len(bodies) and completed == args.payments
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""Bill calculation shared by the web app, the API and month-end generation.
+
+A bill is rent + electricity units consumed since the previous reading x the
+current rate + the latest water bill share. Bills for any number of tenants are
+computed from one bulk read of readings and rates, with the arithmetic done on
+NumPy arrays.
+
+The water bill is allocated once per calendar month by allocate_water_bill(),
+which is idempotent: re-running it for a period rewrites that period's single
+WaterBill row instead of adding another.
+"""
+from collections import namedtuple
+from datetime import datetime
+import numpy as np
+from sqlalchemy import func, case, insert
+from sqlalchemy.exc import IntegrityError
+from models import db, User, MeterReading, Payment, ElectricityRate, WaterBill
+from queries import latest_readings_by_tenant
+from versions import bump_tenants
+
+Bill = namedtuple('Bill', 'user_id rent electricity water total units_consumed')
+
+def current_electricity_rate():
+    return ElectricityRate.query.order_by(ElectricityRate.effective_from.desc()).first()
+
+def current_water_bill():
+    """The bill for the most recent billing period, falling back to bills made before periods existed"""
+    return WaterBill.query.order_by(WaterBill.period_start.desc().nulls_last(), WaterBill.billing_date.desc()).first()
+
+def _reading_values(tenants, readings, key):
+    return np.array([
+        getattr(readings[tenant.id]['electricity'][key], 'reading_value', None)
+        for tenant in tenants
+    ], dtype=float)
+
+def compute_bills(tenants, readings=None, rate=None, water_bill=None):
+    """Compute a Bill for every tenant, in the same order as `tenants`.
+
+    `readings`, `rate` and `water_bill` are loaded in bulk when not supplied,
+    so callers that already have them (dashboards) do not query twice.
+    """
+    tenants = list(tenants)
+    if not tenants:
+        return []
+    if readings is None:
+        readings = latest_readings_by_tenant([tenant.id for tenant in tenants])
+    if rate is None:
+        rate = current_electricity_rate()
+    if water_bill is None:
+        water_bill = current_water_bill()
+
+    rent = np.array([tenant.rent_amount or 0.0 for tenant in tenants], dtype=float)
+    current = _reading_values(tenants, readings, 'current')
+    previous = _reading_values(tenants, readings, 'previous')
+
+    # Electricity is only billed once there are two readings and a rate
+    billable = ~np.isnan(current) & ~np.isnan(previous)
+    units = np.where(billable, current - previous, 0.0)
+    electricity = units * rate.rate_per_unit if rate else np.zeros_like(units)
+    water = np.full(len(tenants), water_bill.amount_per_tenant if water_bill else 0.0)
+    total = rent + electricity + water
+
+    return [
+        Bill(tenant.id, float(rent[i]), float(electricity[i]), float(water[i]), float(total[i]),
+             float(units[i]) if billable[i] else None)
+        for i, tenant in enumerate(tenants)
+    ]
+
+def bill_for_tenant(tenant, **kwargs):
+    return compute_bills([tenant], **kwargs)[0]
+
+def generate_monthly_bills(payment_method='bank_transfer', now=None):
+    """Create a pending Payment for every tenant without one for the current period.
+
+    A tenant is considered billed when they already have a payment dated in
+    the billing period containing `now`, so re-running it in the same month
+    adds nothing, whether or not the tenant has readings yet. Returns the
+    number of payments created.
+    """
+    now = now or datetime.now()
+    period_start, period_end = billing_period(now)
+    tenants = User.query.filter_by(is_owner=False).all()
+    readings = latest_readings_by_tenant([tenant.id for tenant in tenants])
+    billed = set(db.session.scalars(
+        db.select(Payment.user_id).distinct()
+        .where(Payment.payment_date >= period_start, Payment.payment_date < period_end)
+    ))
+
+    stamp = now.strftime('%Y%m%d%H%M%S')
+    rows = [
+        {
+            'user_id': bill.user_id,
+            'amount': bill.total,
+            'rent_component': bill.rent,
+            'electricity_component': bill.electricity,
+            'water_component': bill.water,
+            'payment_date': now,
+            'payment_method': payment_method,
+            'status': 'pending',
+            'transaction_reference': f"RENT{stamp}{bill.user_id}",
+            'created_at': now,
+        }
+        for bill in compute_bills([tenant for tenant in tenants if tenant.id not in billed], readings=readings)
+    ]
+    if rows:
+        db.session.execute(insert(Payment), rows)
+        bump_tenants([row['user_id'] for row in rows])
+    db.session.commit()
+    return len(rows)
+
+def billing_period(day):
+    """(start, end) of the calendar month containing `day`; end is exclusive"""
+    start = datetime(day.year, day.month, 1)
+    end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start, end
+
+def previous_billing_period(now=None):
+    """The last complete calendar month before `now`"""
+    this_start, _ = billing_period(now or datetime.now())
+    return billing_period(datetime.fromordinal(this_start.toordinal() - 1))
+
+def water_consumption(period_start, period_end):
+    """{user_id: water units used in [period_start, period_end)} in one grouped query.
+
+    Meters only count up, so usage is the last reading before the period end
+    minus the last reading before the period start (or the first reading, for
+    tenants who moved in during the period). The composite reading index
+    covers the whole query.
+    """
+    opening = func.max(case((MeterReading.reading_date < period_start, MeterReading.reading_value)))
+    rows = db.session.execute(
+        db.select(MeterReading.user_id, opening, func.min(MeterReading.reading_value), func.max(MeterReading.reading_value))
+        .where(MeterReading.meter_type == 'water', MeterReading.reading_date < period_end)
+        .group_by(MeterReading.user_id)
+    ).all()
+    return {
+        user_id: max(closing - (start_value if start_value is not None else first), 0.0)
+        for user_id, start_value, first, closing in rows
+    }
+
+def allocate_water_bill(period=None, now=None):
+    """Create or refresh the WaterBill for `period` (default: last month) and commit.
+
+    The building's usage is shared equally by the tenants plus the owner,
+    priced at the current unit rate, as it has been since water billing was
+    added. Returns the bill.
+    """
+    period_start, period_end = period or previous_billing_period(now)
+    usage = water_consumption(period_start, period_end)
+    total_usage = float(sum(usage.values()))
+    total_tenants = User.query.filter_by(is_owner=False).count()
+    rate = current_electricity_rate()
+    amount_per_tenant = total_usage / (total_tenants + 1)
+    if rate:
+        amount_per_tenant *= rate.rate_per_unit
+
+    values = dict(total_amount=total_usage, billing_date=period_end, total_tenants=total_tenants,
+                  amount_per_tenant=amount_per_tenant, period_end=period_end)
+    for attempt in range(2):
+        bill = WaterBill.query.filter_by(period_start=period_start).first()
+        if bill is None:
+            bill = WaterBill(period_start=period_start)
+            db.session.add(bill)
+        for key, value in values.items():
+            setattr(bill, key, value)
+        try:
+            db.session.commit()
+            return bill
+        except IntegrityError:
+            # Another run created this period's bill first; update theirs instead
+            db.session.rollback()
+            if attempt:
+                raise
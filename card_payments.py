@@ -0,0 +1,121 @@
+"""Card payments without a Stripe round trip on the request path.
+
+create_payment commits a pending Payment with intent_status 'queued' and a
+fresh idempotency key, then returns at once. A small worker pool creates
+the Stripe PaymentIntent and stores its id and client secret on the row.
+The browser or app polls intent_status_payload() until the secret is there.
+Stripe sees the same idempotency key on every attempt, so retries, and runs
+picked up again after a restart, never create a second intent.
+
+STRIPE_WORKERS             intent-creation threads per process (default 4)
+STRIPE_MAX_ATTEMPTS        tries per payment before it is marked failed (default 5)
+STRIPE_API_BASE            point the client at another server, e.g. benchmarks/stripe_stub.py
+"""
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import or_, and_
+from models import db, Payment
+from stripe_client import get_stripe
+
+CURRENCY = 'inr'
+MAX_ATTEMPTS = int(os.getenv('STRIPE_MAX_ATTEMPTS', 5))
+RETRY_BACKOFF = 0.5
+CLAIM_TIMEOUT = timedelta(minutes=2)
+
+def _transient_errors(stripe):
+    # Provider hiccups worth retrying; anything else (bad request, auth, card) fails the payment
+    return (stripe.error.APIConnectionError, stripe.error.RateLimitError, stripe.error.APIError)
+
+_executor = None
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=int(os.getenv('STRIPE_WORKERS', 4)),
+                                       thread_name_prefix='stripe-worker')
+    return _executor
+
+def queue_card_payment(payment):
+    """Mark a new card Payment for background intent creation; the caller adds and commits it"""
+    payment.idempotency_key = uuid.uuid4().hex
+    payment.intent_status = 'queued'
+    payment.intent_attempts = 0
+
+def _claimable(now):
+    return or_(Payment.intent_status == 'queued',
+               and_(Payment.intent_status == 'creating', Payment.intent_claimed_at < now - CLAIM_TIMEOUT))
+
+def _claim(payment_id):
+    """Take the payment for this worker; False if it is done or another worker has it"""
+    now = datetime.now()
+    claimed = db.session.execute(
+        db.update(Payment)
+        .where(Payment.id == payment_id, _claimable(now))
+        .values(intent_status='creating', intent_claimed_at=now)
+    ).rowcount
+    db.session.commit()
+    return claimed == 1
+
+def create_intent(app, payment_id):
+    """Create the PaymentIntent for one queued payment; returns the final intent_status"""
+    with app.app_context():
+        if not _claim(payment_id):
+            return None
+        payment = db.session.get(Payment, payment_id)
+        stripe = get_stripe()
+        error = None
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            payment.intent_attempts = (payment.intent_attempts or 0) + 1
+            try:
+                intent = stripe.PaymentIntent.create(
+                    amount=int(round(payment.amount * 100)),  # Convert to paise
+                    currency=CURRENCY,
+                    metadata={'user_id': payment.user_id, 'payment_id': payment.id},
+                    idempotency_key=payment.idempotency_key
+                )
+            except _transient_errors(stripe) as e:
+                error = e
+                if attempt < MAX_ATTEMPTS:
+                    time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+                continue
+            except stripe.error.StripeError as e:
+                error = e
+                break
+            payment.stripe_payment_id = intent.id
+            payment.client_secret = intent.client_secret
+            payment.intent_status = 'created'
+            payment.intent_error = None
+            db.session.commit()
+            return payment.intent_status
+
+        app.logger.warning('Could not create PaymentIntent for payment %s: %s', payment_id, error)
+        payment.intent_status = 'failed'
+        payment.intent_error = (getattr(error, 'user_message', None) or str(error))[:200]
+        # A failed payment no longer blocks the tenant from trying again
+        payment.status = 'failed'
+        db.session.commit()
+        return payment.intent_status
+
+def schedule_intent(app, payment_id):
+    """Queue intent creation; `app` must be the real app object, not the proxy"""
+    return _get_executor().submit(create_intent, app, payment_id)
+
+def process_pending_intents(app):
+    """Synchronously create intents for queued payments and ones abandoned mid-creation"""
+    with app.app_context():
+        payment_ids = db.session.scalars(
+            db.select(Payment.id).where(_claimable(datetime.now())).order_by(Payment.id)
+        ).all()
+    return sum(create_intent(app, payment_id) == 'created' for payment_id in payment_ids)
+
+def intent_status_payload(payment):
+    """What a polling client needs: the client secret once ready, or the failure reason"""
+    payload = {'payment_id': payment.id, 'status': payment.intent_status, 'amount': payment.amount}
+    if payment.intent_status == 'created':
+        payload['clientSecret'] = payment.client_secret
+    elif payment.intent_status == 'failed':
+        payload['error'] = payment.intent_error
+    return payload
@@ -0,0 +1,232 @@
+"""Database engine settings shared by the web app and the API.
+
+configure_database(app, db) reads DATABASE_URL, sets the engine options for its
+backend and initialises db on the app.
+
+SQLite (the default) gets a profile for a multi-threaded server. Every
+connection runs in WAL mode, so readers never wait for the writer, with
+synchronous=NORMAL, a busy timeout and a bigger mmap and page cache. Writes go
+through one dedicated writer connection: once a session flushes or runs an
+INSERT/UPDATE/DELETE, the rest of its transaction moves to that connection,
+which starts with BEGIN IMMEDIATE. Threads queue for it in process instead of
+racing for SQLite's single write lock. Writers that start from an old read
+snapshot could otherwise fail with "database is locked".
+
+Postgres (or any other server database) gets a sized connection pool with
+pre-ping and recycling.
+
+With DATABASE_REPLICA_URL set, views marked @read_only read from that
+replica. A request still reads from the primary once it has written, and for
+a few seconds after its user committed a write, so people see their own
+changes. A Postgres replica that falls too far behind is skipped until it
+catches up.
+
+DATABASE_URL               default sqlite:///rentmanager.db
+DB_SQLITE_PROFILE          1 (default) or 0 for stock SQLite settings, e.g. to compare
+DB_SQLITE_SYNCHRONOUS      NORMAL (default), FULL or OFF
+DB_SQLITE_BUSY_TIMEOUT_MS  how long a blocked connection waits for a lock (default 5000)
+DB_SQLITE_MMAP_SIZE        bytes of the database file to memory-map (default 256 MiB)
+DB_SQLITE_CACHE_SIZE_KB    page cache per connection (default 64000)
+DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT   reader pool for SQLite (default 20 + 20),
+                           the whole pool for a server database (default 10 + 20)
+DB_POOL_RECYCLE            seconds before a server database connection is replaced (default 1800)
+DB_SQLITE_WRITER_TIMEOUT   seconds a write waits for the writer connection (default 60)
+DATABASE_REPLICA_URL       read replica for @read_only views (unset: read from the primary)
+DB_REPLICA_READ_YOUR_WRITES  seconds a user reads from the primary after a write (default 5)
+DB_REPLICA_MAX_LAG         skip a Postgres replica further behind than this (default 10, 0 = never)
+DB_REPLICA_LAG_CHECK       seconds between replica lag checks (default 5)
+"""
+import os
+import threading
+import time
+from functools import wraps
+from flask import current_app, g, has_app_context, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.dml import UpdateBase
+from cache import TTLCache
+
+DEFAULT_DATABASE_URL = 'sqlite:///rentmanager.db'
+WRITER_EXTENSION = 'sqlite_writer_engine'
+REPLICA_BIND = 'replica'
+
+def _env_int(name, default):
+    return int(os.getenv(name, default))
+
+def sqlite_pragmas():
+    return {
+        'journal_mode': 'WAL',
+        'synchronous': os.getenv('DB_SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': _env_int('DB_SQLITE_BUSY_TIMEOUT_MS', 5000),
+        'mmap_size': _env_int('DB_SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+        'cache_size': -_env_int('DB_SQLITE_CACHE_SIZE_KB', 64000),  # negative = KiB
+    }
+
+def _set_pragmas(engine, pragmas):
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+def _make_writer_engine(url, pragmas):
+    """One connection, taken by one transaction at a time, that begins with the write lock held"""
+    engine = create_engine(url, pool_size=1, max_overflow=0,
+                           pool_timeout=_env_int('DB_SQLITE_WRITER_TIMEOUT', 60))
+    _set_pragmas(engine, pragmas)
+
+    @event.listens_for(engine, 'connect')
+    def disable_driver_transactions(dbapi_connection, connection_record):
+        # Let the 'begin' hook below issue BEGIN instead of the sqlite3 module
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def begin_immediate(connection):
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+    return engine
+
+def _is_file_sqlite(url):
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+def configure_database(app, db):
+    """Set the database URL and engine options on `app` and initialise `db` for it"""
+    uri = os.getenv('DATABASE_URL', DEFAULT_DATABASE_URL)
+    url = make_url(uri)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+
+    sqlite_profile = _is_file_sqlite(url) and os.getenv('DB_SQLITE_PROFILE', '1') == '1'
+    if sqlite_profile:
+        # WAL readers don't block each other, so give every request thread its own connection
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {
+            'pool_size': _env_int('DB_POOL_SIZE', 20),
+            'max_overflow': _env_int('DB_MAX_OVERFLOW', 20),
+            'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+        })
+    elif url.get_backend_name() != 'sqlite':
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {
+            'pool_size': _env_int('DB_POOL_SIZE', 10),
+            'max_overflow': _env_int('DB_MAX_OVERFLOW', 20),
+            'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+            'pool_recycle': _env_int('DB_POOL_RECYCLE', 1800),
+            'pool_pre_ping': True,
+        })
+
+    replica_uri = os.getenv('DATABASE_REPLICA_URL')
+    if replica_uri:
+        # No model uses this bind key; RoutingSession picks it per request
+        app.config.setdefault('SQLALCHEMY_BINDS', {})[REPLICA_BIND] = {
+            'url': replica_uri, **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+
+    db.init_app(app)
+
+    if sqlite_profile:
+        pragmas = sqlite_pragmas()
+        with app.app_context():
+            # Flask-SQLAlchemy makes a relative SQLite path relative to the instance folder
+            _set_pragmas(db.engine, pragmas)
+            app.extensions[WRITER_EXTENSION] = _make_writer_engine(db.engine.url, pragmas)
+            if replica_uri and _is_file_sqlite(make_url(replica_uri)):
+                _set_pragmas(db.engines[REPLICA_BIND], pragmas)
+
+def writer_engine():
+    if has_app_context():
+        return current_app.extensions.get(WRITER_EXTENSION)
+    return None
+
+# Read-your-writes: users who committed a write recently keep reading from the primary
+_recent_writers = TTLCache(maxsize=int(os.getenv('DB_REPLICA_WRITERS_TRACKED', 10000)),
+                           ttl=float(os.getenv('DB_REPLICA_READ_YOUR_WRITES', 5)))
+_lag_checks = {}
+_lag_lock = threading.Lock()
+
+# On a streaming replica: seconds behind the primary, 0 when it has replayed everything it
+# received, NULL when the server is not a replica
+REPLICA_LAG_SQL = """
+SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END
+"""
+
+def track_user(user_id):
+    """Tie this request's reads and writes to a user, for read-your-writes"""
+    g.db_user = user_id
+
+def read_only(f):
+    """Let a view's queries go to the replica, if one is configured
+
+    The view still reads from the primary once it writes, or if its user
+    committed a write within DB_REPLICA_READ_YOUR_WRITES seconds.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        g.db_read_only = True
+        return f(*args, **kwargs)
+    return decorated
+
+def _replica_fresh(engine):
+    """False while a Postgres replica is more than DB_REPLICA_MAX_LAG seconds behind"""
+    max_lag = float(os.getenv('DB_REPLICA_MAX_LAG', 10))
+    if max_lag <= 0 or engine.dialect.name != 'postgresql':
+        return True
+    now = time.monotonic()
+    with _lag_lock:
+        checked = _lag_checks.get(engine)
+    if checked and now - checked[0] < float(os.getenv('DB_REPLICA_LAG_CHECK', 5)):
+        return checked[1]
+    try:
+        with engine.connect() as connection:
+            lag = connection.exec_driver_sql(REPLICA_LAG_SQL).scalar()
+        fresh = lag is None or lag <= max_lag
+    except Exception:
+        current_app.logger.exception('Replica lag check failed; reading from the primary')
+        fresh = False
+    with _lag_lock:
+        _lag_checks[engine] = (now, fresh)
+    return fresh
+
+def _replica(db):
+    """The replica engine if this request may read from it, else None"""
+    if not (has_request_context() and g.get('db_read_only')):
+        return None
+    engine = db.engines.get(REPLICA_BIND)
+    if engine is None or _recent_writers.get(g.get('db_user')) or not _replica_fresh(engine):
+        return None
+    return engine
+
+class RoutingSession(Session):
+    """db.session class that routes each statement to the right engine
+
+    Writes, and everything after them in the same transaction, go to the
+    SQLite writer connection when there is one. Reads in read-only views go to
+    the replica when one is configured and fresh enough.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if (self.info.get('writing') or clause is None and mapper is None
+                    or isinstance(clause, UpdateBase)):
+                self.info['writing'] = True
+                writer = writer_engine()
+                if writer is not None:
+                    return writer
+            else:
+                replica = _replica(self._db)
+                if replica is not None:
+                    return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+@event.listens_for(RoutingSession, 'before_flush')
+def _flush_on_writer(session, flush_context, instances):
+    session.info['writing'] = True
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _remember_writer(session):
+    if session.info.get('writing') and has_request_context() and g.get('db_user') is not None:
+        _recent_writers.set(g.db_user, True)
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _transaction_done(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('writing', None)
@@ -0,0 +1,55 @@
+"""Application factory: the HTML site and the /api routes in one Flask app.
+
+Serving both from one process means one database engine and connection pool,
+one copy of the caches and one /metrics endpoint, instead of two of each.
+Either half can still be run on its own:
+
+    flask --app app run                              # both; app.py calls create_app()
+    flask --app "factory:create_app('api')" run      # the API only
+"""
+import os
+from dotenv import load_dotenv
+from flask import Flask
+from models import db
+from db_config import configure_database
+from instrumentation import init_instrumentation
+from uploads import MAX_REQUEST_BYTES
+
+BLUEPRINTS = ('web', 'api')
+
+def create_app(*blueprints, config=None):
+    """Build an app serving `blueprints` ('web', 'api'; both by default)"""
+    blueprints = blueprints or BLUEPRINTS
+    unknown = set(blueprints) - set(BLUEPRINTS)
+    if unknown:
+        raise ValueError(f"Unknown blueprints: {', '.join(sorted(unknown))}")
+    
+    # Load environment variables
+    load_dotenv()
+    
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'default-secret-key')
+    app.config['UPLOAD_FOLDER'] = 'static/uploads'
+    # Partial uploads are written here, outside the static tree, then renamed into UPLOAD_FOLDER
+    app.config['UPLOAD_STAGING_FOLDER'] = 'instance/upload-staging'
+    app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
+    app.config.update(config or {})
+    
+    # Initialize extensions
+    configure_database(app, db)
+    init_instrumentation(app)
+    
+    if 'web' in blueprints:
+        import web
+        web.login_manager.init_app(app)
+        app.register_blueprint(web.bp)
+    if 'api' in blueprints:
+        import api
+        from flask_cors import CORS
+        CORS(app, resources={r'/api/*': {}})  # Enable CORS for the API only
+        app.register_blueprint(api.bp)
+    
+    # Ensure upload directory exists
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    
+    return app
@@ -0,0 +1,108 @@
+"""Rendered HTML fragments cached by data version.
+
+A fragment is one piece of a page, such as a tenant's row on the owner
+dashboard. It is stored under its name together with the data version it
+was rendered from (see versions.py). The version changes whenever the data
+behind it changes, so an entry is never invalidated, it just stops being
+asked for. A hash of the template source is part of the version too, so
+a deploy that edits the template does not serve old markup.
+
+Fragments live in a per-process LRU. With FRAGMENT_CACHE_DIR set they are
+also written to that directory, one file per fragment name, so worker
+processes on the same host share renders. Files are replaced atomically and
+a file holding another version counts as a miss.
+
+FRAGMENT_CACHE_SIZE    fragments kept in memory per process (default 10000)
+FRAGMENT_CACHE_DIR     directory shared by workers (default: memory only)
+"""
+import hashlib
+import os
+import tempfile
+from markupsafe import Markup
+from flask import current_app, render_template
+from cache import TTLCache
+
+# Entries are only ever superseded, not invalidated; the TTL just clears out cold ones
+MEMORY_TTL = 24 * 60 * 60
+
+class FragmentCache:
+    def __init__(self, maxsize=10000, directory=None):
+        self.memory = TTLCache(maxsize=maxsize, ttl=MEMORY_TTL)
+        self.directory = directory
+        self.renders = 0
+        self.disk_hits = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, hashlib.sha1(name.encode()).hexdigest() + '.html')
+
+    def get(self, name, version):
+        """The cached HTML of fragment `name` at `version`, or None"""
+        html = self.memory.get((name, version))
+        if html is not None or not self.directory:
+            return html
+        try:
+            with open(self._path(name), encoding='utf-8') as f:
+                stored_version, _, html = f.read().partition('\n')
+        except FileNotFoundError:
+            return None
+        if stored_version != version:
+            return None
+        self.disk_hits += 1
+        self.memory.set((name, version), html)
+        return html
+
+    def set(self, name, version, html):
+        self.renders += 1
+        self.memory.set((name, version), html)
+        if not self.directory:
+            return
+        fd, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(f'{version}\n{html}')
+            os.replace(temporary, self._path(name))
+        except OSError as e:
+            current_app.logger.warning('Could not store fragment %s: %s', name, e)
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+    def stats(self):
+        return {**self.memory.stats(), 'renders': self.renders, 'disk_hits': self.disk_hits,
+                'directory': self.directory}
+
+fragment_cache = FragmentCache(maxsize=int(os.getenv('FRAGMENT_CACHE_SIZE', 10000)),
+                               directory=os.getenv('FRAGMENT_CACHE_DIR') or None)
+
+_template_hashes = {}
+
+def template_hash(template_name):
+    """Short hash of a template's source, computed once per process"""
+    if template_name not in _template_hashes:
+        source, _, _ = current_app.jinja_env.loader.get_source(current_app.jinja_env, template_name)
+        _template_hashes[template_name] = hashlib.sha1(source.encode()).hexdigest()[:12]
+    return _template_hashes[template_name]
+
+def render_fragments(template_name, versions, load_context, cache=fragment_cache):
+    """Render `template_name` once per key, reusing cached output where the version is unchanged.
+
+    `versions` maps each key to its data version. load_context(keys) is only
+    called for the keys that missed, and returns each one's template context.
+    Returns {key: Markup}.
+    """
+    template_version = template_hash(template_name)
+    fragments = {}
+    missing = []
+    for key, version in versions.items():
+        html = cache.get(f'{template_name}:{key}', f'{version}:{template_version}')
+        if html is None:
+            missing.append(key)
+        else:
+            fragments[key] = Markup(html)
+    if missing:
+        for key, context in load_context(missing).items():
+            html = render_template(template_name, **context)
+            cache.set(f'{template_name}:{key}', f'{versions[key]}:{template_version}', html)
+            fragments[key] = Markup(html)
+    return fragments
@@ -0,0 +1,74 @@
+"""Background processing of meter photo uploads.
+
+upload_reading stores the original and returns; a small worker pool then fixes
+EXIF orientation and writes a compressed display image and a thumbnail next to
+it, recording both on the MeterReading.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from models import db, MeterReading
+
+DISPLAY_SIZE = (1280, 1280)
+THUMBNAIL_SIZE = (320, 320)
+JPEG_QUALITY = 80
+
+# Placeholder stored on readings entered by the owner at registration
+INITIAL_READING_IMAGE = 'initial_reading.jpg'
+
+_executor = None
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=int(os.getenv('IMAGE_WORKERS', 2)),
+                                       thread_name_prefix='image-worker')
+    return _executor
+
+def _save_variant(image, size, path):
+    variant = image.copy()
+    variant.thumbnail(size)
+    variant.save(path, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+
+def make_variants(upload_folder, filename):
+    """Write <name>_display.jpg and <name>_thumb.jpg for an upload; returns their file names"""
+    stem = os.path.splitext(filename)[0]
+    display_name = f"{stem}_display.jpg"
+    thumbnail_name = f"{stem}_thumb.jpg"
+
+    # Pillow is imported on first use; most processes never resize a photo
+    from PIL import Image, ImageOps
+
+    with Image.open(os.path.join(upload_folder, filename)) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+    _save_variant(image, DISPLAY_SIZE, os.path.join(upload_folder, display_name))
+    _save_variant(image, THUMBNAIL_SIZE, os.path.join(upload_folder, thumbnail_name))
+    return display_name, thumbnail_name
+
+def process_reading_image(app, reading_id):
+    with app.app_context():
+        reading = db.session.get(MeterReading, reading_id)
+        if not reading or not reading.image_path:
+            return False
+        from PIL import Image
+        try:
+            reading.display_path, reading.thumbnail_path = make_variants(app.config['UPLOAD_FOLDER'], reading.image_path)
+        except (OSError, Image.DecompressionBombError) as e:
+            app.logger.warning('Could not process image for reading %s: %s', reading_id, e)
+            return False
+        db.session.commit()
+        return True
+
+def schedule_reading_images(app, reading_ids):
+    """Queue display/thumbnail generation; `app` must be the real app object, not the proxy"""
+    executor = _get_executor()
+    return [executor.submit(process_reading_image, app, reading_id) for reading_id in reading_ids]
+
+def process_pending_images(app):
+    """Synchronously generate variants for every uploaded reading that lacks them"""
+    with app.app_context():
+        reading_ids = db.session.scalars(
+            db.select(MeterReading.id)
+            .where(MeterReading.display_path.is_(None),
+                   MeterReading.image_path.notin_(('', INITIAL_READING_IMAGE)))
+        ).all()
+    return sum(process_reading_image(app, reading_id) for reading_id in reading_ids)
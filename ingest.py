@@ -0,0 +1,208 @@
+"""Batch ingestion of meter readings exported by smart sub-meters.
+
+A batch is a list of (tenant_id, meter_type, value, timestamp) records, sent
+as JSON or CSV. Every record is checked before anything is written, using a
+handful of bulk queries rather than one per record:
+
+- the tenant exists (one IN query per chunk of tenant IDs)
+- the value is not lower than the reading before it, nor higher than the
+  reading after it, counting both stored readings and earlier records in
+  the same batch
+- no reading is already stored for that tenant, meter and timestamp, so
+  re-sending an export does not duplicate it
+
+Valid records are written with executemany inserts in the caller's
+transaction. Invalid ones are skipped and reported with their index.
+"""
+import bisect
+import csv
+import io
+import math
+from collections import defaultdict, namedtuple
+from datetime import datetime
+from sqlalchemy import func
+from models import db, User, MeterReading
+from queries import METER_TYPES, rebuild_latest_readings
+from usage import rebuild_monthly_consumption
+from versions import bump_tenants
+
+FIELDS = ('tenant_id', 'meter_type', 'value', 'timestamp')
+MAX_RECORDS = 50000
+INSERT_BATCH = 1000
+# Keeps IN lists below SQLite's bound-parameter limit
+LOOKUP_CHUNK = 500
+
+Record = namedtuple('Record', 'index tenant_id meter_type value timestamp')
+
+class BatchRejected(ValueError):
+    """The batch as a whole could not be read"""
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def records_from_json(data):
+    """Raw records from a JSON body: a list, or an object with a "readings" list"""
+    if isinstance(data, dict):
+        data = data.get('readings')
+    if not isinstance(data, list):
+        raise BatchRejected('Expected a list of readings or {"readings": [...]}')
+    return data
+
+def records_from_csv(text):
+    """Raw records from CSV text with a tenant_id,meter_type,value,timestamp header"""
+    reader = csv.DictReader(io.StringIO(text))
+    missing = [field for field in FIELDS if field not in (reader.fieldnames or [])]
+    if missing:
+        raise BatchRejected(f"CSV is missing column(s): {', '.join(missing)}")
+    return list(reader)
+
+def _parse_timestamp(value):
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value)
+    value = str(value).strip()
+    if value.replace('.', '', 1).isdigit():
+        return datetime.fromtimestamp(float(value))
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    # Readings are stored as naive local times, like the rest of the app
+    return parsed.astimezone().replace(tzinfo=None) if parsed.tzinfo else parsed
+
+def _parse(index, raw, errors):
+    if not isinstance(raw, dict):
+        errors.append({'index': index, 'error': 'record must be an object'})
+        return None
+    tenant_id = str(raw.get('tenant_id') or '').strip()
+    meter_type = str(raw.get('meter_type') or '').strip().lower()
+    problem = None
+    if not tenant_id:
+        problem = 'tenant_id is required'
+    elif meter_type not in METER_TYPES:
+        problem = f"meter_type must be one of {', '.join(METER_TYPES)}"
+    else:
+        try:
+            value = float(raw.get('value'))
+        except (TypeError, ValueError):
+            problem = 'value must be a number'
+        else:
+            if not math.isfinite(value) or value < 0:
+                problem = 'value must be a non-negative number'
+        if problem is None:
+            try:
+                timestamp = _parse_timestamp(raw.get('timestamp'))
+            except (TypeError, ValueError, OverflowError, OSError):
+                problem = 'timestamp must be ISO 8601 or Unix seconds'
+    if problem:
+        errors.append({'index': index, 'tenant_id': tenant_id or None, 'error': problem})
+        return None
+    return Record(index, tenant_id, meter_type, value, timestamp)
+
+def _tenant_ids(tenant_ids):
+    """{tenant_id: user id} for the tenants that exist"""
+    found = {}
+    for chunk in _chunks(tenant_ids, LOOKUP_CHUNK):
+        found.update(db.session.execute(
+            db.select(User.tenant_id, User.id).where(User.tenant_id.in_(chunk), User.is_owner.is_(False))
+        ).all())
+    return found
+
+def _stored_readings(user_ids, since):
+    """{(user_id, meter_type): [(reading_date, value), ...]} sorted by date.
+
+    Includes every reading from `since` on, plus the last reading before it,
+    which is all the history needed to check records dated on or after `since`.
+    """
+    stored = defaultdict(list)
+    for chunk in _chunks(user_ids, LOOKUP_CHUNK):
+        rows = db.session.execute(
+            db.select(MeterReading.user_id, MeterReading.meter_type, MeterReading.reading_date, MeterReading.reading_value)
+            .where(MeterReading.user_id.in_(chunk), MeterReading.reading_date >= since)
+        ).all()
+        before = (db.select(
+                      MeterReading.user_id, MeterReading.meter_type, MeterReading.reading_date, MeterReading.reading_value,
+                      func.row_number().over(
+                          partition_by=(MeterReading.user_id, MeterReading.meter_type),
+                          order_by=(MeterReading.reading_date.desc(), MeterReading.id.desc())
+                      ).label('position'))
+                  .where(MeterReading.user_id.in_(chunk), MeterReading.reading_date < since)
+                  .subquery())
+        rows += db.session.execute(
+            db.select(before.c.user_id, before.c.meter_type, before.c.reading_date, before.c.reading_value)
+            .where(before.c.position == 1)
+        ).all()
+        for user_id, meter_type, reading_date, value in rows:
+            stored[(user_id, meter_type)].append((reading_date, value))
+    for history in stored.values():
+        history.sort()
+    return stored
+
+def _check_series(records, history, errors):
+    """Records of one tenant and meter that keep the series non-decreasing"""
+    dates = [reading_date for reading_date, _ in history]
+    accepted = []
+    floor = None
+    for record in sorted(records, key=lambda record: (record.timestamp, record.index)):
+        position = bisect.bisect_left(dates, record.timestamp)
+        if position < len(dates) and dates[position] == record.timestamp:
+            problem = 'a reading is already recorded at this timestamp'
+        elif accepted and accepted[-1].timestamp == record.timestamp:
+            problem = 'duplicate timestamp in batch'
+        else:
+            before = [value for value in (floor, history[position - 1][1] if position else None) if value is not None]
+            after = history[position][1] if position < len(history) else None
+            if before and record.value < max(before):
+                problem = f'value {record.value:g} is lower than the previous reading {max(before):g}'
+            elif after is not None and record.value > after:
+                problem = f'value {record.value:g} is higher than the next reading {after:g}'
+            else:
+                accepted.append(record)
+                floor = record.value
+                continue
+        errors.append({'index': record.index, 'tenant_id': record.tenant_id, 'error': problem})
+    return accepted
+
+def ingest_readings(raw_records, now=None):
+    """Validate and insert a batch of readings; the caller commits.
+
+    Returns {'received', 'accepted', 'rejected', 'errors'} where each error is
+    {'index', 'tenant_id', 'error'} and `index` is the record's position in
+    the batch.
+    """
+    if len(raw_records) > MAX_RECORDS:
+        raise BatchRejected(f'At most {MAX_RECORDS} readings can be sent in one batch')
+    now = now or datetime.now()
+    errors = []
+    records = [record for record in (_parse(index, raw, errors) for index, raw in enumerate(raw_records)) if record]
+
+    users = _tenant_ids({record.tenant_id for record in records})
+    series = defaultdict(list)
+    for record in records:
+        if record.tenant_id in users:
+            series[(users[record.tenant_id], record.meter_type)].append(record)
+        else:
+            errors.append({'index': record.index, 'tenant_id': record.tenant_id, 'error': 'unknown tenant'})
+
+    accepted = []
+    if series:
+        stored = _stored_readings({user_id for user_id, _ in series},
+                                  min(record.timestamp for group in series.values() for record in group))
+        for key, group in series.items():
+            accepted += [(key, record) for record in _check_series(group, stored.get(key, []), errors)]
+
+    for chunk in _chunks(accepted, INSERT_BATCH):
+        db.session.execute(db.insert(MeterReading), [
+            {'user_id': user_id, 'meter_type': meter_type, 'reading_value': record.value,
+             'reading_date': record.timestamp, 'image_path': '', 'is_processed': True, 'created_at': now}
+            for (user_id, meter_type), record in chunk
+        ])
+
+    if accepted:
+        user_ids = sorted({user_id for (user_id, _), _ in accepted})
+        earliest = min(record.timestamp for _, record in accepted)
+        for chunk in _chunks(user_ids, LOOKUP_CHUNK):
+            rebuild_latest_readings(user_ids=chunk)
+            rebuild_monthly_consumption(user_ids=chunk, since=earliest)
+        bump_tenants(user_ids)
+
+    errors.sort(key=lambda error: error['index'])
+    return {'received': len(raw_records), 'accepted': len(accepted), 'rejected': len(errors), 'errors': errors}
@@ -1,5 +1,6 @@
 from app import app, db
-from models import User, ElectricityRate
+from models import ElectricityRate
+from migrations import upgrade
 from datetime import datetime
 
 def init_database():
@@ -7,6 +8,9 @@ def init_database():
         # Create all tables
         db.create_all()
         
+        # Bring existing tables up to date (indexes, new columns)
+        upgrade(db.engine)
+        
         # Set initial electricity rate only
         rate = ElectricityRate.query.first()
         if not rate:
@@ -0,0 +1,233 @@
+"""Per-request SQL instrumentation and a Prometheus /metrics endpoint.
+
+Engine event hooks time every statement. Inside an app context they also add
+it to that request's stats: statement count, total database time and how
+often each statement shape ran. A shape is the SQL with literals and
+placeholder lists collapsed. The same shape running over and over in one
+request is the N+1 signature; such requests are logged and counted per
+route. Statements slower than SQL_SLOW_QUERY_MS are logged wherever they run.
+
+init_instrumentation(app) adds the request hooks to an app and mounts
+/metrics. That endpoint serves per-route histograms of request duration,
+queries per request and database time in Prometheus text format, along with
+N+1 and slow-query counters. The `app` label is the blueprint that served
+the request (web or api), or the app name for routes outside both.
+
+SQL_SLOW_QUERY_MS      log statements slower than this (default 200)
+SQL_N_PLUS_ONE_MIN     flag a request that runs one statement shape this many times (default 5)
+METRICS_TOKEN          /metrics requires "Authorization: Bearer <token>"; without it
+                       /metrics answers 403 unless the app is in debug or testing mode
+METRICS_PUBLIC         1 to serve /metrics without a token (e.g. behind a private network)
+"""
+import hmac
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from flask import Response, current_app, g, has_app_context, has_request_context, make_response, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SLOW_QUERY_MS = float(os.getenv('SQL_SLOW_QUERY_MS', 200))
+N_PLUS_ONE_MIN = int(os.getenv('SQL_N_PLUS_ONE_MIN', 5))
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+def _logger():
+    return current_app.logger if has_app_context() else logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r'\s+')
+_LITERALS = re.compile(r"'(?:[^']|'')*'|(?<![\w.$])\d+(?:\.\d+)?\b|%\(\w+\)s|\$\d+")
+_PLACEHOLDER_LISTS = re.compile(r'\?(?:\s*,\s*\?)+')
+_VALUES_LISTS = re.compile(r'(\(\?\))(?:\s*,\s*\(\?\))+')
+
+def statement_shape(statement):
+    """The statement with literals and IN/VALUES lists collapsed, so repeats of one query compare equal"""
+    shape = _LITERALS.sub('?', _WHITESPACE.sub(' ', statement).strip())
+    return _VALUES_LISTS.sub(r'\1', _PLACEHOLDER_LISTS.sub('?', shape))
+
+class RequestStats:
+    """SQL activity of one request (or one app context outside a request)"""
+
+    def __init__(self):
+        self.count = 0
+        self.db_seconds = 0.0
+        self.slow = 0
+        self.shapes = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.db_seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, minimum=None):
+        """(shape, times) for every shape that ran at least `minimum` times, most repeated first"""
+        minimum = N_PLUS_ONE_MIN if minimum is None else minimum
+        return [(shape, times) for shape, times in self.shapes.most_common() if times >= minimum]
+
+def request_stats():
+    """Stats for the current app context, started on first use"""
+    if 'sql_stats' not in g:
+        g.sql_stats = RequestStats()
+    return g.sql_stats
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's own execution context: a failing statement never
+    # reaches after_cursor_execute, so a per-connection stack would go out of step
+    if context is not None:
+        context._query_started = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_query_started', None)
+    if started is None:
+        return
+    seconds = time.perf_counter() - started
+    stats = request_stats() if has_app_context() else None
+    if stats is not None:
+        stats.record(statement, seconds)
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        route = request.endpoint if has_request_context() else None
+        if stats is not None:
+            stats.slow += 1
+        _logger().warning('Slow query (%.1f ms) in %s: %s', seconds * 1000, route or 'background',
+                          statement_shape(statement)[:500])
+
+def count_queries(f):
+    """Report the number of SQL statements the request ran in the X-Query-Count header.
+
+    Streamed responses render after the headers are sent, so they are not counted.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        response = make_response(f(*args, **kwargs))
+        if response.is_streamed:
+            return response
+        stats = request_stats()
+        response.headers['X-Query-Count'] = str(stats.count)
+        current_app.logger.info('%s ran %d queries in %.1f ms', f.__name__, stats.count, stats.db_seconds * 1000)
+        return response
+
+    return decorated
+
+LABEL_NAMES = ('app', 'route', 'method')
+
+class Histogram:
+    def __init__(self, name, documentation, buckets, label_names=LABEL_NAMES):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.label_names = label_names
+        self.series = {}  # labels -> [count per bucket..., sum, count]
+
+    def observe(self, labels, value):
+        series = self.series.setdefault(labels, [0] * len(self.buckets) + [0.0, 0])
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[position] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labels, series in sorted(self.series.items()):
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, labels, le=f"{bound:g}")} {count}')
+            lines.append(f'{self.name}_bucket{_labels(self.label_names, labels, le="+Inf")} {series[-1]}')
+            lines.append(f'{self.name}_sum{_labels(self.label_names, labels)} {series[-2]:.6f}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, labels)} {series[-1]}')
+        return lines
+
+class CounterMetric:
+    def __init__(self, name, documentation, label_names=LABEL_NAMES):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.series = Counter()
+
+    def inc(self, labels, amount=1):
+        self.series[labels] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        lines.extend(f'{self.name}{_labels(self.label_names, labels)} {value}'
+                     for labels, value in sorted(self.series.items()))
+        return lines
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names, values, **extra):
+    pairs = list(zip(names, values)) + list(extra.items())
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+_metrics_lock = threading.Lock()
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'Time to handle a request, by route.', DURATION_BUCKETS)
+REQUEST_QUERIES = Histogram('db_queries_per_request', 'SQL statements run by one request, by route.', QUERY_BUCKETS)
+REQUEST_DB_TIME = Histogram('db_time_per_request_seconds', 'Time spent in SQL by one request, by route.',
+                            DURATION_BUCKETS)
+N_PLUS_ONE = CounterMetric('db_n_plus_one_requests_total',
+                           f'Requests that ran one statement shape at least {N_PLUS_ONE_MIN} times.')
+SLOW_QUERIES = CounterMetric('db_slow_queries_total', f'Statements slower than {SLOW_QUERY_MS:g} ms.')
+RESPONSES = CounterMetric('http_responses_total', 'Responses by route and status class.',
+                          LABEL_NAMES + ('status',))
+METRICS = (REQUEST_DURATION, REQUEST_QUERIES, REQUEST_DB_TIME, N_PLUS_ONE, SLOW_QUERIES, RESPONSES)
+
+def render_metrics():
+    with _metrics_lock:
+        lines = [line for metric in METRICS for line in metric.render()]
+    return '\n'.join(lines) + '\n'
+
+def _start_request():
+    g.request_started = time.perf_counter()
+    request_stats()
+
+def _note_status(response):
+    g.response_status = response.status_code
+    return response
+
+def _finish_request(exc):
+    # Runs when the request context is torn down, so streamed responses are
+    # measured after their last chunk rather than when the headers go out
+    started = g.pop('request_started', None)
+    if started is None:
+        return
+    stats = request_stats()
+    labels = (request.blueprint or current_app.name, request.endpoint or 'unmatched', request.method)
+    status = 500 if exc is not None else g.get('response_status', 500)
+    repeated = stats.repeated()
+    with _metrics_lock:
+        REQUEST_DURATION.observe(labels, time.perf_counter() - started)
+        REQUEST_QUERIES.observe(labels, stats.count)
+        REQUEST_DB_TIME.observe(labels, stats.db_seconds)
+        RESPONSES.inc(labels + (f'{status // 100}xx',))
+        if stats.slow:
+            SLOW_QUERIES.inc(labels, stats.slow)
+        if repeated:
+            N_PLUS_ONE.inc(labels)
+    if repeated:
+        shape, times = repeated[0]
+        _logger().warning('Possible N+1 in %s %s: %d statements, %d x %s', request.method, labels[1],
+                       stats.count, times, shape[:300])
+
+def metrics():
+    token = os.getenv('METRICS_TOKEN')
+    if not token:
+        # Route names and traffic are not for the public; only open without a token when asked to
+        if not (os.getenv('METRICS_PUBLIC') == '1' or current_app.debug or current_app.testing):
+            return Response('Set METRICS_TOKEN to enable /metrics\n', status=403, mimetype='text/plain')
+    elif not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+def init_instrumentation(app):
+    """Record per-route SQL and latency metrics for `app` and serve them at /metrics"""
+    app.before_request(_start_request)
+    app.after_request(_note_status)
+    app.teardown_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics)
@@ -0,0 +1,228 @@
+"""Versioned schema migrations for existing databases.
+
+db.create_all() only creates missing tables, so changes to tables that already
+exist (new indexes, new columns) are applied here. Each migration runs in its
+own transaction and is recorded in the schema_migrations table; every step is
+written to be a no-op on a database that create_all() has just built, so the
+runner is safe on both fresh and production SQLite/Postgres databases.
+
+Usage: python migrations.py [status]
+"""
+import sys
+from datetime import datetime
+from sqlalchemy import (MetaData, Table, Column, ForeignKey, Integer, Float, String, Text, Date, DateTime, Index,
+                        inspect, select, update, delete, text)
+
+schema_migrations = Table(
+    'schema_migrations', MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('name', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+def _reflect(conn, table_name):
+    return Table(table_name, MetaData(), autoload_with=conn)
+
+def create_index(conn, table_name, index_name, *columns, unique=False):
+    """Create an index unless an index with that name already exists"""
+    if index_name in {index['name'] for index in inspect(conn).get_indexes(table_name)}:
+        return
+    table = _reflect(conn, table_name)
+    Index(index_name, *(table.c[column] for column in columns), unique=unique).create(conn)
+
+def add_column(conn, table_name, column):
+    """Add a column (a sqlalchemy Column) unless the table already has it"""
+    if column.name in {existing['name'] for existing in inspect(conn).get_columns(table_name)}:
+        return
+    preparer = conn.dialect.identifier_preparer
+    ddl = f'ALTER TABLE {preparer.quote(table_name)} ADD COLUMN {preparer.quote(column.name)} {column.type.compile(dialect=conn.dialect)}'
+    if column.server_default is not None:
+        ddl += f' DEFAULT {column.server_default.arg}'
+    conn.execute(text(ddl))
+
+def create_table(conn, table_name, *items, references=()):
+    """Create a table as defined here unless it exists.
+
+    Steps spell out their columns instead of using the models, so a later
+    model change cannot alter what an old migration builds. `references`
+    names the existing tables its foreign keys point at.
+    """
+    metadata = MetaData()
+    if references:
+        metadata.reflect(conn, only=list(references))
+    Table(table_name, metadata, *items).create(conn, checkfirst=True)
+
+def _hot_path_indexes(conn):
+    create_index(conn, 'meter_reading', 'ix_meter_reading_user_type_date', 'user_id', 'meter_type', 'reading_date', 'reading_value')
+    create_index(conn, 'meter_reading', 'ix_meter_reading_reading_date', 'reading_date')
+    create_index(conn, 'payment', 'ix_payment_user_date', 'user_id', 'payment_date')
+    create_index(conn, 'payment', 'ix_payment_status_date', 'status', 'payment_date')
+    create_index(conn, 'electricity_rate', 'ix_electricity_rate_effective_from', 'effective_from')
+    create_index(conn, 'water_bill', 'ix_water_bill_billing_date', 'billing_date')
+
+def _latest_reading_table(conn):
+    from queries import rebuild_latest_readings
+
+    create_table(
+        conn, 'latest_reading',
+        Column('user_id', Integer, ForeignKey('user.id'), primary_key=True),
+        Column('meter_type', String(20), primary_key=True),
+        Column('latest_id', Integer, ForeignKey('meter_reading.id'), nullable=False),
+        Column('previous_id', Integer, ForeignKey('meter_reading.id')),
+        references=('user', 'meter_reading'))
+    rebuild_latest_readings(conn)
+
+def _payment_keyset_index(conn):
+    create_index(conn, 'payment', 'ix_payment_date_id', 'payment_date', 'id')
+
+def _reading_image_variants(conn):
+    add_column(conn, 'meter_reading', Column('display_path', String(200)))
+    add_column(conn, 'meter_reading', Column('thumbnail_path', String(200)))
+
+def _reading_image_hash(conn):
+    add_column(conn, 'meter_reading', Column('image_hash', String(64)))
+    create_index(conn, 'meter_reading', 'ix_meter_reading_user_image_hash', 'user_id', 'image_hash')
+
+def _data_version_table(conn):
+    create_table(
+        conn, 'data_version',
+        Column('key', String(50), primary_key=True),
+        Column('version', Integer, nullable=False))
+
+def _id_sequence_table(conn):
+    create_table(
+        conn, 'id_sequence',
+        Column('name', String(50), primary_key=True),
+        Column('next_value', Integer, nullable=False))
+    # Seed the tenant ID counter so the first registrations never race to create it
+    id_sequence = _reflect(conn, 'id_sequence')
+    if conn.execute(select(id_sequence.c.name).where(id_sequence.c.name == 'tenant_id')).first() is None:
+        conn.execute(id_sequence.insert().values(name='tenant_id', next_value=0))
+
+def _water_bill_periods(conn):
+    add_column(conn, 'water_bill', Column('period_start', DateTime))
+    add_column(conn, 'water_bill', Column('period_end', DateTime))
+    create_index(conn, 'water_bill', 'ix_water_bill_period_start', 'period_start', unique=True)
+
+def _rent_reminders(conn):
+    add_column(conn, 'user', Column('phone_number', String(20)))
+    add_column(conn, 'user', Column('rent_due_day', Integer))
+    create_index(conn, 'user', 'ix_user_rent_due_day', 'rent_due_day')
+    create_table(
+        conn, 'reminder_outbox',
+        Column('id', Integer, primary_key=True),
+        Column('user_id', Integer, ForeignKey('user.id', ondelete='CASCADE'), nullable=False),
+        Column('kind', String(20), nullable=False),
+        Column('period', String(10), nullable=False),
+        Column('phone_number', String(20), nullable=False),
+        Column('message', Text, nullable=False),
+        Column('status', String(20), nullable=False),
+        Column('attempts', Integer, nullable=False),
+        Column('last_error', String(200)),
+        Column('claimed_by', String(32)),
+        Column('claimed_at', DateTime),
+        Column('sent_at', DateTime),
+        Column('created_at', DateTime),
+        Index('ix_reminder_outbox_key', 'user_id', 'kind', 'period', unique=True),
+        Index('ix_reminder_outbox_status_id', 'status', 'id'),
+        references=('user',))
+
+def _payment_intent_outbox(conn):
+    add_column(conn, 'payment', Column('idempotency_key', String(64)))
+    add_column(conn, 'payment', Column('intent_status', String(20)))
+    add_column(conn, 'payment', Column('intent_attempts', Integer, nullable=False, server_default='0'))
+    add_column(conn, 'payment', Column('intent_error', String(200)))
+    add_column(conn, 'payment', Column('intent_claimed_at', DateTime))
+    add_column(conn, 'payment', Column('client_secret', String(200)))
+    create_index(conn, 'payment', 'ix_payment_idempotency_key', 'idempotency_key', unique=True)
+    create_index(conn, 'payment', 'ix_payment_intent_status', 'intent_status', 'id')
+
+def _stripe_events(conn):
+    create_table(
+        conn, 'stripe_event',
+        Column('id', Integer, primary_key=True),
+        Column('event_id', String(255), nullable=False),
+        Column('type', String(100), nullable=False),
+        Column('payment_intent_id', String(100)),
+        Column('created', Integer),
+        Column('payload', Text, nullable=False),
+        Column('received_at', DateTime),
+        Index('ix_stripe_event_event_id', 'event_id', unique=True))
+    create_index(conn, 'payment', 'ix_payment_stripe_payment_id', 'stripe_payment_id')
+
+def _monthly_consumption(conn):
+    from usage import rebuild_monthly_consumption
+
+    create_table(
+        conn, 'monthly_consumption',
+        Column('user_id', Integer, ForeignKey('user.id'), primary_key=True),
+        Column('meter_type', String(20), primary_key=True),
+        Column('month', Date, primary_key=True),
+        Column('units', Float, nullable=False),
+        Column('readings', Integer, nullable=False),
+        Index('ix_monthly_consumption_month', 'month', 'meter_type'),
+        references=('user',))
+    rebuild_monthly_consumption(conn)
+
+def _stripe_event_applied_at(conn):
+    add_column(conn, 'stripe_event', Column('applied_at', DateTime))
+    create_index(conn, 'stripe_event', 'ix_stripe_event_applied_at', 'applied_at', 'id')
+    # Events up to the old consumer offset were applied; later ones are picked up on the next run
+    id_sequence = _reflect(conn, 'id_sequence')
+    stripe_event = _reflect(conn, 'stripe_event')
+    offset = conn.execute(select(id_sequence.c.next_value).where(id_sequence.c.name == 'stripe_events')).scalar()
+    if offset is not None:
+        conn.execute(update(stripe_event).where(stripe_event.c.id <= offset, stripe_event.c.applied_at.is_(None))
+                     .values(applied_at=datetime.utcnow()))
+        conn.execute(delete(id_sequence).where(id_sequence.c.name == 'stripe_events'))
+
+# (version, name, function) - append only, never renumber
+MIGRATIONS = [
+    (1, 'Composite indexes for reading, payment, rate and water bill lookups', _hot_path_indexes),
+    (2, 'Latest/previous reading table per tenant and meter', _latest_reading_table),
+    (3, 'Keyset pagination index on payment (payment_date, id)', _payment_keyset_index),
+    (4, 'Display and thumbnail image paths on meter_reading', _reading_image_variants),
+    (5, 'Photo content hash on meter_reading for duplicate detection', _reading_image_hash),
+    (6, 'Per-tenant and global data versions for dashboard caching', _data_version_table),
+    (7, 'Counter table for the tenant ID allocator', _id_sequence_table),
+    (8, 'Billing period columns on water_bill', _water_bill_periods),
+    (9, 'Tenant phone number and rent due day, reminder outbox', _rent_reminders),
+    (10, 'PaymentIntent outbox columns on payment', _payment_intent_outbox),
+    (11, 'Stripe webhook event log and payment lookup by intent id', _stripe_events),
+    (12, 'Monthly consumption rollup per tenant and meter', _monthly_consumption),
+    (13, 'Per-event applied_at on stripe_event, replacing the single consumer offset', _stripe_event_applied_at),
+]
+
+def applied_versions(engine):
+    schema_migrations.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        return set(conn.execute(schema_migrations.select().with_only_columns(schema_migrations.c.version)).scalars())
+
+def upgrade(engine):
+    """Apply all pending migrations in order; returns the versions applied"""
+    done = applied_versions(engine)
+    applied = []
+    for version, name, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(schema_migrations.insert().values(version=version, name=name, applied_at=datetime.utcnow()))
+        print(f"Applied migration {version}: {name}")
+        applied.append(version)
+    return applied
+
+def status(engine):
+    done = applied_versions(engine)
+    for version, name, _ in MIGRATIONS:
+        print(f"{version:>4} {'applied' if version in done else 'pending':<8} {name}")
+
+if __name__ == '__main__':
+    from app import app
+    from models import db
+
+    with app.app_context():
+        if len(sys.argv) > 1 and sys.argv[1] == 'status':
+            status(db.engine)
+        else:
+            upgrade(db.engine)
@@ -1,15 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
-import random
-import string
+from passwords import hash_password, verify_password, needs_rehash
+from db_config import RoutingSession
 
-db = SQLAlchemy()
-
-def generate_tenant_id():
-    # Generate a random 6-digit tenant ID
-    return ''.join(random.choices(string.digits, k=6))
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -19,22 +14,34 @@ class User(UserMixin, db.Model):
     name = db.Column(db.String(100), nullable=False)
     is_owner = db.Column(db.Boolean, default=False)
     rent_amount = db.Column(db.Float, nullable=False, default=0.0)
+    phone_number = db.Column(db.String(20), nullable=True)  # for SMS rent reminders
+    rent_due_day = db.Column(db.Integer, nullable=True, index=True)  # day of the month, 1-31
     meter_readings = db.relationship('MeterReading', backref='user', lazy=True)
     payments = db.relationship('Payment', backref='user', lazy=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+
+    def upgrade_password_hash(self, password):
+        """Re-hash a just-verified password if the configured method or cost changed"""
+        if needs_rehash(self.password_hash):
+            self.set_password(password)
+            return True
+        return False
 
     @staticmethod
     def generate_unique_tenant_id():
-        while True:
-            tenant_id = generate_tenant_id()
-            if not User.query.filter_by(tenant_id=tenant_id).first():
-                return tenant_id
+        """Reserve one unused tenant ID in the current transaction.
+
+        This takes the database write lock until the transaction ends, so do
+        slow work such as hashing the tenant's password first.
+        """
+        from tenant_ids import allocate_tenant_ids
+        return allocate_tenant_ids(1)[0]
 
     @staticmethod
     def generate_tenant_password():
@@ -70,10 +77,75 @@ class MeterReading(db.Model):
     reading_value = db.Column(db.Float, nullable=True)
     reading_date = db.Column(db.DateTime, nullable=False)
     image_path = db.Column(db.String(200), nullable=False)
+    display_path = db.Column(db.String(200), nullable=True)  # compressed copy, set by images.py
+    thumbnail_path = db.Column(db.String(200), nullable=True)
+    image_hash = db.Column(db.String(64), nullable=True)  # sha256 of the uploaded photo
     is_processed = db.Column(db.Boolean, default=False)
     meter_type = db.Column(db.String(20), nullable=False)  # 'electricity' or 'water'
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Latest/previous reading per tenant and meter; reading_value makes it covering
+        db.Index('ix_meter_reading_user_type_date', 'user_id', 'meter_type', 'reading_date', 'reading_value'),
+        db.Index('ix_meter_reading_reading_date', 'reading_date'),
+        db.Index('ix_meter_reading_user_image_hash', 'user_id', 'image_hash'),
+    )
+
+    @property
+    def photo_path(self):
+        """Upload to link to: the compressed display image once it has been generated"""
+        return self.display_path or self.image_path
+
+    @property
+    def thumbnail(self):
+        return self.thumbnail_path or self.photo_path
+
+class LatestReading(db.Model):
+    """Latest and previous reading per tenant and meter, kept up to date on every insert"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    meter_type = db.Column(db.String(20), primary_key=True)
+    latest_id = db.Column(db.Integer, db.ForeignKey('meter_reading.id'), nullable=False)
+    previous_id = db.Column(db.Integer, db.ForeignKey('meter_reading.id'), nullable=True)
+    latest = db.relationship('MeterReading', foreign_keys=[latest_id], lazy='joined')
+    previous = db.relationship('MeterReading', foreign_keys=[previous_id], lazy='joined')
+
+    @staticmethod
+    def record(reading):
+        """Fold a newly added reading into its tenant's entry and monthly consumption, in the caller's transaction"""
+        from usage import add_consumption, rebuild_monthly_consumption  # usage.py imports this module
+        if reading.id is None:
+            db.session.flush()
+        # Lock the entry so concurrent uploads for the same meter apply their deltas one after the other
+        entry = db.session.get(LatestReading, (reading.user_id, reading.meter_type),
+                               with_for_update={'of': LatestReading}, populate_existing=True)
+        if entry is None:
+            db.session.add(LatestReading(user_id=reading.user_id, meter_type=reading.meter_type, latest=reading))
+            add_consumption(reading, 0.0)
+            return
+        
+        position = (reading.reading_date, reading.id)
+        if position >= (entry.latest.reading_date, entry.latest.id):
+            add_consumption(reading, reading.reading_value - entry.latest.reading_value)
+            entry.previous = entry.latest
+            entry.latest = reading
+            return
+        if entry.previous is None or position > (entry.previous.reading_date, entry.previous.id):
+            entry.previous = reading
+        # A backdated reading also changes the units of the reading after it
+        rebuild_monthly_consumption(user_ids=[reading.user_id])
+
+class MonthlyConsumption(db.Model):
+    """Units used per tenant, meter and calendar month, kept up to date on every insert, see usage.py"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    meter_type = db.Column(db.String(20), primary_key=True)
+    month = db.Column(db.Date, primary_key=True)  # first day of the month
+    units = db.Column(db.Float, nullable=False, default=0.0)
+    readings = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_monthly_consumption_month', 'month', 'meter_type'),
+    )
+
 class Payment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -86,18 +158,90 @@ class Payment(db.Model):
     status = db.Column(db.String(20), default='pending')
     stripe_payment_id = db.Column(db.String(100))
     transaction_reference = db.Column(db.String(100))
+    # Card payments: PaymentIntent creation runs in the background, see card_payments.py
+    idempotency_key = db.Column(db.String(64), nullable=True)
+    intent_status = db.Column(db.String(20), nullable=True)  # queued, creating, created, failed
+    intent_attempts = db.Column(db.Integer, nullable=False, default=0)
+    intent_error = db.Column(db.String(200), nullable=True)
+    intent_claimed_at = db.Column(db.DateTime, nullable=True)
+    client_secret = db.Column(db.String(200), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_payment_user_date', 'user_id', 'payment_date'),
+        db.Index('ix_payment_status_date', 'status', 'payment_date'),
+        db.Index('ix_payment_date_id', 'payment_date', 'id'),
+        db.Index('ix_payment_idempotency_key', 'idempotency_key', unique=True),
+        db.Index('ix_payment_intent_status', 'intent_status', 'id'),
+        db.Index('ix_payment_stripe_payment_id', 'stripe_payment_id'),
+    )
+
 class ElectricityRate(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     rate_per_unit = db.Column(db.Float, nullable=False)
-    effective_from = db.Column(db.DateTime, nullable=False)
+    effective_from = db.Column(db.DateTime, nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class WaterBill(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     total_amount = db.Column(db.Float, nullable=False)
-    billing_date = db.Column(db.DateTime, nullable=False)
+    billing_date = db.Column(db.DateTime, nullable=False, index=True)
     total_tenants = db.Column(db.Integer, nullable=False)
     amount_per_tenant = db.Column(db.Float, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow) 
\ No newline at end of file
+    period_start = db.Column(db.DateTime, nullable=True)  # billing period covered, [start, end)
+    period_end = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # One bill per period; bills from before periods were recorded have NULL here
+        db.Index('ix_water_bill_period_start', 'period_start', unique=True),
+    )
+
+class DataVersion(db.Model):
+    """Change counter per tenant ('tenant:<id>') plus one shared 'global' counter, see versions.py"""
+    key = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class IdSequence(db.Model):
+    """Persisted counters for identifier allocation, see tenant_ids.py"""
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.Integer, nullable=False, default=0)
+
+class ReminderOutbox(db.Model):
+    """One row per reminder to send; the unique key stops a restart from sending it twice, see reminders.py"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # e.g. 'rent_due'
+    period = db.Column(db.String(10), nullable=False)  # e.g. '2024-05'
+    phone_number = db.Column(db.String(20), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(200), nullable=True)
+    claimed_by = db.Column(db.String(32), nullable=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_reminder_outbox_key', 'user_id', 'kind', 'period', unique=True),
+        db.Index('ix_reminder_outbox_status_id', 'status', 'id'),
+    )
+
+class StripeEvent(db.Model):
+    """Log of verified Stripe webhook events, applied in batches by stripe_events.py"""
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.String(255), nullable=False)
+    type = db.Column(db.String(100), nullable=False)
+    payment_intent_id = db.Column(db.String(100), nullable=True)
+    created = db.Column(db.Integer, nullable=True)  # Stripe's event timestamp
+    payload = db.Column(db.Text, nullable=False)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    applied_at = db.Column(db.DateTime, nullable=True)  # set once its status change is applied
+
+    __table_args__ = (
+        # Stripe delivers at least once; a redelivered event is dropped on insert
+        db.Index('ix_stripe_event_event_id', 'event_id', unique=True),
+        # Finds the unapplied events in id order
+        db.Index('ix_stripe_event_applied_at', 'applied_at', 'id'),
+    )
@@ -0,0 +1,130 @@
+"""Bulk tenant onboarding from a CSV of name, rent and initial meter readings
+(plus optional phone_number and rent_due_day columns for reminders).
+
+Every row is validated before anything is written. Passwords are hashed in
+parallel on the password pool, then all users, initial readings and
+latest-reading entries go in with one executemany insert per table, in the
+caller's transaction: the import either completes or leaves nothing behind.
+"""
+import csv
+import io
+import math
+from datetime import datetime
+from models import db, User, MeterReading, LatestReading, MonthlyConsumption
+from passwords import hash_passwords
+from tenant_ids import allocate_tenant_ids
+from usage import month_start
+from versions import bump_tenants
+
+COLUMNS = ('name', 'rent_amount', 'initial_electricity_reading', 'initial_water_reading')
+MAX_ROWS = 5000
+
+class OnboardingError(ValueError):
+    """Raised with every problem found in the file, as (line number, message) pairs"""
+
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} invalid rows')
+        self.errors = errors
+
+def _number(value, field, errors, line):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        errors.append((line, f'{field} must be a number'))
+        return None
+    if not math.isfinite(number):
+        errors.append((line, f'{field} must be a finite number'))
+    elif number < 0:
+        errors.append((line, f'{field} cannot be negative'))
+    return number
+
+def parse_tenant_csv(text):
+    """Validated rows from CSV text with a header row; raises OnboardingError"""
+    reader = csv.DictReader(io.StringIO(text))
+    missing = [column for column in COLUMNS if column not in (reader.fieldnames or [])]
+    if missing:
+        raise OnboardingError([(1, f"missing column(s): {', '.join(missing)}")])
+
+    rows, errors = [], []
+    for line, record in enumerate(reader, start=2):
+        name = (record.get('name') or '').strip()
+        if not name:
+            errors.append((line, 'name is required'))
+        elif len(name) > 100:
+            errors.append((line, 'name must be at most 100 characters'))
+        phone_number = (record.get('phone_number') or '').strip() or None
+        if phone_number and len(phone_number) > 20:
+            errors.append((line, 'phone_number must be at most 20 characters'))
+        rent_due_day = (record.get('rent_due_day') or '').strip() or None
+        if rent_due_day is not None:
+            if not rent_due_day.isdigit() or not 1 <= int(rent_due_day) <= 31:
+                errors.append((line, 'rent_due_day must be a day of the month (1-31)'))
+            else:
+                rent_due_day = int(rent_due_day)
+        rows.append({
+            'name': name,
+            'phone_number': phone_number,
+            'rent_due_day': rent_due_day,
+            'rent_amount': _number(record.get('rent_amount'), 'rent_amount', errors, line),
+            'initial_electricity_reading': _number(record.get('initial_electricity_reading'), 'initial_electricity_reading', errors, line),
+            'initial_water_reading': _number(record.get('initial_water_reading'), 'initial_water_reading', errors, line),
+        })
+
+    if not rows:
+        errors.append((1, 'the file has no tenant rows'))
+    if len(rows) > MAX_ROWS:
+        errors.append((1, f'at most {MAX_ROWS} tenants can be imported at once'))
+    if errors:
+        raise OnboardingError(errors)
+    return rows
+
+def onboard_tenants(rows, now=None):
+    """Create tenants and their initial readings; returns their credentials. The caller commits."""
+    now = now or datetime.now()
+    passwords = [User.generate_tenant_password() for _ in rows]
+    hashes = hash_passwords(passwords)
+    # Reserving IDs takes the write lock until commit, so it waits for the hashes
+    tenant_ids = allocate_tenant_ids(len(rows))
+
+    user_ids = db.session.scalars(
+        db.insert(User).returning(User.id, sort_by_parameter_order=True),
+        [
+            {'tenant_id': tenant_id, 'name': row['name'], 'rent_amount': row['rent_amount'],
+             'phone_number': row['phone_number'], 'rent_due_day': row['rent_due_day'],
+             'password_hash': pwhash, 'is_owner': False, 'created_at': now}
+            for row, tenant_id, pwhash in zip(rows, tenant_ids, hashes)
+        ]
+    ).all()
+
+    readings = [
+        {'user_id': user_id, 'reading_value': row[f'initial_{meter_type}_reading'], 'reading_date': now,
+         'image_path': 'initial_reading.jpg', 'is_processed': True, 'meter_type': meter_type, 'created_at': now}
+        for row, user_id in zip(rows, user_ids)
+        for meter_type in ('electricity', 'water')
+    ]
+    reading_ids = db.session.scalars(
+        db.insert(MeterReading).returning(MeterReading.id, sort_by_parameter_order=True), readings
+    ).all()
+    db.session.execute(db.insert(LatestReading), [
+        {'user_id': reading['user_id'], 'meter_type': reading['meter_type'], 'latest_id': reading_id}
+        for reading, reading_id in zip(readings, reading_ids)
+    ])
+    # First readings use no units yet
+    db.session.execute(db.insert(MonthlyConsumption), [
+        {'user_id': reading['user_id'], 'meter_type': reading['meter_type'], 'month': month_start(now),
+         'units': 0.0, 'readings': 1}
+        for reading in readings
+    ])
+    bump_tenants(user_ids)
+
+    return [
+        {'name': row['name'], 'tenant_id': tenant_id, 'password': password}
+        for row, tenant_id, password in zip(rows, tenant_ids, passwords)
+    ]
+
+def credentials_csv(credentials):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=['name', 'tenant_id', 'password'])
+    writer.writeheader()
+    writer.writerows(credentials)
+    return buffer.getvalue()
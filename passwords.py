@@ -0,0 +1,95 @@
+"""Password hashing off the request threads.
+
+Hashing and verification are CPU bound, so they run in a fixed-size process
+pool where they can use several cores instead of holding the web server's
+worker threads (and the GIL). The method and cost are configurable; hashes
+made with older settings report needs_rehash() so login can upgrade them.
+
+The pool's workers are started with spawn, which imports the main module in
+every worker. A script that hashes passwords must therefore keep its
+top-level work under `if __name__ == '__main__':` (flask, gunicorn and the
+scripts in this repo do). If the pool's workers die anyway, as they do for an
+unguarded script, a warning is logged and hashing falls back to the calling
+thread for the rest of the process.
+
+PASSWORD_HASH_METHOD   werkzeug method string, e.g. pbkdf2:sha256:600000 or scrypt:32768:8:1
+PASSWORD_HASH_WORKERS  pool size; 0 hashes inline on the calling thread
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from werkzeug.security import generate_password_hash, check_password_hash
+
+METHOD = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', min(4, os.cpu_count() or 1)))
+
+_pool = None
+_pool_broken = False
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a threaded server process is not safe
+            _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+def _pool_failed():
+    """Stop using the pool after its workers died; callers then hash inline"""
+    global _pool, _pool_broken
+    logging.getLogger(__name__).warning(
+        'Password hashing pool broke, hashing on the calling thread from now on. If this process runs '
+        "a script, guard its top-level code with if __name__ == '__main__': (spawned workers import it)")
+    with _pool_lock:
+        _pool_broken = True
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False)
+
+def _inline():
+    return WORKERS <= 0 or _pool_broken
+
+def _run(fn, *args):
+    if not _inline():
+        try:
+            return _get_pool().submit(fn, *args).result()
+        except BrokenProcessPool:
+            _pool_failed()
+    return fn(*args)
+
+def hash_password(password):
+    return _run(generate_password_hash, password, METHOD)
+
+def hash_passwords(passwords):
+    """Hash many passwords in parallel, preserving order"""
+    passwords = list(passwords)
+    if not _inline():
+        try:
+            return list(_get_pool().map(generate_password_hash, passwords, [METHOD] * len(passwords)))
+        except BrokenProcessPool:
+            _pool_failed()
+    return [generate_password_hash(password, METHOD) for password in passwords]
+
+def verify_password(pwhash, password):
+    return _run(check_password_hash, pwhash, password)
+
+@lru_cache(maxsize=None)
+def _method_prefix(method):
+    # werkzeug fills in default parameters, so compare against what it actually writes
+    return generate_password_hash('', method).split('$', 1)[0]
+
+def needs_rehash(pwhash):
+    """True if `pwhash` was made with a different method or cost than METHOD"""
+    return pwhash.split('$', 1)[0] != _method_prefix(METHOD)
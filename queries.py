@@ -0,0 +1,143 @@
+import base64
+from datetime import datetime
+from sqlalchemy import func, case, and_, or_
+from sqlalchemy.orm import joinedload
+from models import db, MeterReading, LatestReading, Payment
+
+METER_TYPES = ('electricity', 'water')
+PAGE_SIZE = 50
+
+def _ranked_readings(user_ids=None):
+    """Every reading with its position per (tenant, meter_type), newest first"""
+    stmt = db.select(
+        MeterReading.id,
+        MeterReading.user_id,
+        MeterReading.meter_type,
+        func.row_number().over(
+            partition_by=(MeterReading.user_id, MeterReading.meter_type),
+            order_by=(MeterReading.reading_date.desc(), MeterReading.id.desc())
+        ).label('position'))
+    if user_ids is not None:
+        stmt = stmt.where(MeterReading.user_id.in_(user_ids))
+    return stmt.subquery()
+
+def latest_readings_by_tenant(user_ids):
+    """Latest and previous reading for every (tenant, meter_type) pair in one query.
+
+    Returns {user_id: {meter_type: {'current': reading, 'previous': reading}}}
+    with an entry for every requested tenant, even those without readings.
+    Reads the LatestReading table, so the cost does not depend on history size.
+    """
+    result = {
+        user_id: {meter_type: {'current': None, 'previous': None} for meter_type in METER_TYPES}
+        for user_id in user_ids
+    }
+    if not result:
+        return result
+
+    for entry in LatestReading.query.filter(LatestReading.user_id.in_(result)):
+        result[entry.user_id][entry.meter_type] = {'current': entry.latest, 'previous': entry.previous}
+
+    return result
+
+def recent_readings(tenant_readings):
+    """Readings held in one tenant's latest/previous slots, newest first"""
+    return sorted(
+        (reading for slot in tenant_readings.values() for reading in slot.values() if reading),
+        key=lambda reading: (reading.reading_date, reading.id),
+        reverse=True
+    )
+
+def rebuild_latest_readings(executor=None, user_ids=None):
+    """Recompute the LatestReading table from the full MeterReading history.
+
+    `executor` is a session or connection; the caller commits. Pass `user_ids`
+    to only rebuild those tenants' entries.
+    """
+    executor = executor or db.session
+    ranked = _ranked_readings(user_ids)
+    delete = db.delete(LatestReading)
+    if user_ids is not None:
+        delete = delete.where(LatestReading.user_id.in_(user_ids))
+    executor.execute(delete)
+    executor.execute(db.insert(LatestReading).from_select(
+        ['user_id', 'meter_type', 'latest_id', 'previous_id'],
+        db.select(
+            ranked.c.user_id,
+            ranked.c.meter_type,
+            func.max(case((ranked.c.position == 1, ranked.c.id))),
+            func.max(case((ranked.c.position == 2, ranked.c.id))))
+        .where(ranked.c.position <= 2)
+        .group_by(ranked.c.user_id, ranked.c.meter_type)
+    ))
+
+def attach_previous_readings(readings, attribute='previous_reading'):
+    """Set `attribute` on each reading to the preceding reading of the same tenant and meter.
+
+    Runs two queries regardless of how many readings are passed in: one window
+    query to find the predecessor ids and one to load those rows.
+    """
+    readings = list(readings)
+    for reading in readings:
+        setattr(reading, attribute, None)
+    if not readings:
+        return readings
+
+    ordered = (db.select(
+                 MeterReading.id,
+                 func.lag(MeterReading.id).over(
+                     partition_by=(MeterReading.user_id, MeterReading.meter_type),
+                     order_by=(MeterReading.reading_date, MeterReading.id)
+                 ).label('previous_id'))
+               .where(MeterReading.user_id.in_({reading.user_id for reading in readings}))
+               .subquery())
+
+    previous_ids = dict(db.session.execute(
+        db.select(ordered.c.id, ordered.c.previous_id)
+        .where(ordered.c.id.in_([reading.id for reading in readings]))
+        .where(ordered.c.previous_id.isnot(None))
+    ).all())
+    if not previous_ids:
+        return readings
+
+    previous = {
+        reading.id: reading
+        for reading in db.session.scalars(
+            db.select(MeterReading).where(MeterReading.id.in_(set(previous_ids.values())))
+        )
+    }
+    for reading in readings:
+        setattr(reading, attribute, previous.get(previous_ids.get(reading.id)))
+
+    return readings
+
+def encode_cursor(payment):
+    """Opaque keyset cursor for the position just after `payment`"""
+    raw = f"{payment.payment_date.isoformat()}|{payment.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    """(payment_date, id) from a cursor; raises ValueError if it is malformed"""
+    payment_date, payment_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(payment_date), int(payment_id)
+
+def payments_page(cursor=None, status=None, limit=PAGE_SIZE):
+    """One page of payments, newest first, using keyset pagination on (payment_date, id).
+
+    Returns (payments, next_cursor); next_cursor is None on the last page.
+    """
+    query = Payment.query.options(joinedload(Payment.user))
+    if status:
+        query = query.filter(Payment.status == status)
+    if cursor:
+        payment_date, payment_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            Payment.payment_date < payment_date,
+            and_(Payment.payment_date == payment_date, Payment.id < payment_id)
+        ))
+
+    payments = query.order_by(Payment.payment_date.desc(), Payment.id.desc()).limit(limit + 1).all()
+    if len(payments) > limit:
+        payments = payments[:limit]
+        return payments, encode_cursor(payments[-1])
+    return payments, None
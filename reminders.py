@@ -0,0 +1,213 @@
+"""Rent reminders: a durable outbox drained by a concurrent SMS sender.
+
+enqueue_due_reminders() streams the tenants whose rent is due on a day in
+chunks and records one outbox row per tenant and month; the unique key makes
+re-running it harmless. dispatch_reminders() claims pending rows a chunk at a
+time and sends them from an asyncio loop, with a cap on requests in flight
+and exponential backoff between retries. Each outcome is written back, so a
+restart resumes with what is still unsent. The outbox id travels with every
+request as its reference, so a gateway can drop the rare repeat after a crash
+mid-send.
+
+No async HTTP client is installed, so each request is a blocking
+requests.Session call run on a thread pool sized to the concurrency limit.
+
+SMS_GATEWAY_URL     endpoint accepting POSTed JSON {"to", "message", "reference"}
+SMS_GATEWAY_TOKEN   optional bearer token
+SMS_CONCURRENCY     requests in flight (default 20)
+SMS_MAX_ATTEMPTS    tries per message before it is marked failed (default 5)
+SMS_RETRY_BACKOFF   seconds before the first retry, doubling each time (default 0.5)
+"""
+import asyncio
+import calendar
+import os
+import random
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import or_, and_
+from models import db, User, ReminderOutbox
+
+CHUNK_SIZE = 500
+CLAIM_TIMEOUT = timedelta(minutes=10)
+CONCURRENCY = int(os.getenv('SMS_CONCURRENCY', 20))
+MAX_ATTEMPTS = int(os.getenv('SMS_MAX_ATTEMPTS', 5))
+RETRY_BACKOFF = float(os.getenv('SMS_RETRY_BACKOFF', 0.5))
+
+RENT_DUE = 'rent_due'
+
+OutgoingSms = namedtuple('OutgoingSms', 'id to message reference')
+
+class GatewayError(Exception):
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+class SmsGateway:
+    """Blocking client for an HTTP SMS gateway; safe to share between sender threads"""
+
+    def __init__(self, url, token=None, timeout=10, pool_size=CONCURRENCY):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount(url, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        if token:
+            self.session.headers['Authorization'] = f'Bearer {token}'
+
+    def send(self, to, message, reference):
+        try:
+            response = self.session.post(self.url, json={'to': to, 'message': message, 'reference': reference},
+                                         timeout=self.timeout)
+        except requests.RequestException as e:
+            raise GatewayError(f'{type(e).__name__}: {e}')
+        if response.status_code == 429 or response.status_code >= 500:
+            raise GatewayError(f'HTTP {response.status_code}')
+        if response.status_code >= 400:
+            raise GatewayError(f'HTTP {response.status_code}: {response.text[:100]}', retryable=False)
+
+def gateway_from_env():
+    url = os.getenv('SMS_GATEWAY_URL')
+    return SmsGateway(url, os.getenv('SMS_GATEWAY_TOKEN')) if url else None
+
+async def _send_one(loop, executor, semaphore, gateway, sms, max_attempts, backoff):
+    for attempt in range(1, max_attempts + 1):
+        async with semaphore:
+            try:
+                await loop.run_in_executor(executor, gateway.send, sms.to, sms.message, sms.reference)
+                return sms.id, attempt, None
+            except GatewayError as e:
+                error = e
+        if not error.retryable or attempt == max_attempts:
+            return sms.id, attempt, str(error)[:200]
+        # Back off outside the semaphore so other messages keep flowing; jitter spreads retries
+        await asyncio.sleep(backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+def send_all(gateway, messages, concurrency=CONCURRENCY, max_attempts=MAX_ATTEMPTS, backoff=RETRY_BACKOFF):
+    """Send OutgoingSms messages concurrently; returns [(id, attempts, error or None)] in input order"""
+    async def run(executor):
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*(
+            _send_one(loop, executor, semaphore, gateway, sms, max_attempts, backoff) for sms in messages
+        ))
+
+    if not messages:
+        return []
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='sms-sender') as executor:
+        return asyncio.run(run(executor))
+
+def rent_reminder_message(name, rent_amount):
+    return (
+        f"Hi {name}, this is a reminder that your rent payment of "
+        f"₹{rent_amount:.2f} is due today. Please make the payment "
+        f"through your tenant dashboard."
+    )
+
+def _due_on(day):
+    # Tenants due on the 29th-31st are reminded on the last day of shorter months
+    if day.day == calendar.monthrange(day.year, day.month)[1]:
+        return User.rent_due_day >= day.day
+    return User.rent_due_day == day.day
+
+def _insert_ignore(rows):
+    """Insert outbox rows, skipping any whose (user_id, kind, period) already exists"""
+    connection = db.session.connection()
+    if connection.dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        existing = set(db.session.scalars(db.select(ReminderOutbox.user_id).where(
+            ReminderOutbox.user_id.in_([row['user_id'] for row in rows]),
+            ReminderOutbox.kind == rows[0]['kind'], ReminderOutbox.period == rows[0]['period'])))
+        rows = [row for row in rows if row['user_id'] not in existing]
+        if rows:
+            db.session.execute(db.insert(ReminderOutbox), rows)
+        return len(rows)
+    stmt = insert(ReminderOutbox).on_conflict_do_nothing(index_elements=['user_id', 'kind', 'period'])
+    return connection.execute(stmt, rows).rowcount
+
+def enqueue_due_reminders(day=None):
+    """Queue a reminder for every tenant with a phone number whose rent is due on `day`; commits.
+
+    Returns the number of reminders added (tenants already queued this month are skipped).
+    """
+    day = day or date.today()
+    period = day.strftime('%Y-%m')
+    tenants = (db.select(User.id, User.name, User.rent_amount, User.phone_number)
+               .where(User.is_owner.is_(False), _due_on(day), User.phone_number.isnot(None), User.phone_number != '')
+               .order_by(User.id)
+               .execution_options(yield_per=CHUNK_SIZE))
+
+    added = 0
+    for chunk in db.session.execute(tenants).partitions():
+        added += _insert_ignore([
+            {'user_id': user_id, 'kind': RENT_DUE, 'period': period, 'phone_number': phone_number,
+             'message': rent_reminder_message(name, rent_amount or 0.0), 'status': 'pending', 'attempts': 0}
+            for user_id, name, rent_amount, phone_number in chunk
+        ])
+    db.session.commit()
+    return added
+
+def _claimable(now):
+    return or_(ReminderOutbox.status == 'pending',
+               and_(ReminderOutbox.status == 'sending', ReminderOutbox.claimed_at < now - CLAIM_TIMEOUT))
+
+def _claim(limit):
+    """Mark up to `limit` unsent rows as ours and return them; other dispatchers skip them"""
+    now = datetime.now()
+    token = uuid.uuid4().hex
+    ids = db.session.scalars(
+        db.select(ReminderOutbox.id).where(_claimable(now)).order_by(ReminderOutbox.id).limit(limit)
+    ).all()
+    if not ids:
+        return []
+    db.session.execute(
+        db.update(ReminderOutbox)
+        .where(ReminderOutbox.id.in_(ids), _claimable(now))
+        .values(status='sending', claimed_by=token, claimed_at=now)
+    )
+    db.session.commit()
+    return db.session.execute(
+        db.select(ReminderOutbox.id, ReminderOutbox.phone_number, ReminderOutbox.message, ReminderOutbox.attempts)
+        .where(ReminderOutbox.claimed_by == token, ReminderOutbox.status == 'sending')
+    ).all()
+
+def dispatch_reminders(gateway=None, concurrency=CONCURRENCY, max_attempts=MAX_ATTEMPTS, backoff=RETRY_BACKOFF):
+    """Send every unsent outbox row, a chunk at a time; returns {'sent', 'failed', 'seconds'}"""
+    gateway = gateway or gateway_from_env()
+    if gateway is None:
+        raise RuntimeError('SMS_GATEWAY_URL is not set')
+
+    started = time.perf_counter()
+    sent = failed = 0
+    while True:
+        claimed = _claim(CHUNK_SIZE)
+        if not claimed:
+            break
+        previous_attempts = {row.id: row.attempts for row in claimed}
+        results = send_all(gateway,
+                           [OutgoingSms(row.id, row.phone_number, row.message, f'reminder-{row.id}') for row in claimed],
+                           concurrency=concurrency, max_attempts=max_attempts, backoff=backoff)
+        now = datetime.now()
+        db.session.execute(db.update(ReminderOutbox), [
+            {'id': outbox_id, 'status': 'failed' if error else 'sent', 'attempts': previous_attempts[outbox_id] + attempts,
+             'last_error': error, 'sent_at': None if error else now, 'claimed_by': None}
+            for outbox_id, attempts, error in results
+        ])
+        db.session.commit()
+        errors = sum(1 for _, _, error in results if error)
+        failed += errors
+        sent += len(results) - errors
+    return {'sent': sent, 'failed': failed, 'seconds': time.perf_counter() - started}
+
+def send_rent_reminders(day=None, gateway=None):
+    """Queue today's reminders and send everything outstanding"""
+    queued = enqueue_due_reminders(day)
+    result = dispatch_reminders(gateway)
+    result['queued'] = queued
+    return result
@@ -1,35 +1,71 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
-from datetime import datetime
-from models import User, db
-import requests
+from apscheduler.triggers.interval import IntervalTrigger
+from billing import allocate_water_bill
+from card_payments import process_pending_intents
+from reminders import send_rent_reminders, gateway_from_env
+from stripe_events import apply_pending_events
 
-def send_sms_notification(phone_number, message):
-    # Integrate with SMS service provider (e.g., Twilio)
-    # Implementation depends on your chosen SMS service
-    pass
+def check_and_send_reminders(app):
+    if gateway_from_env() is None:
+        # Deployments without SMS simply have no reminders; only the send-reminders command treats it as an error
+        app.logger.warning('SMS_GATEWAY_URL is not set; skipping rent reminders')
+        return 0
+    with app.app_context():
+        result = send_rent_reminders()
+        app.logger.info('Rent reminders: %(queued)d queued, %(sent)d sent, %(failed)d failed', result)
+        return result['sent']
 
-def check_and_send_reminders():
-    today = datetime.now().day
-    tenants = User.query.filter(
-        User.is_owner == False,
-        User.rent_due_day == today
-    ).all()
-    
-    for tenant in tenants:
-        message = (
-            f"Hi {tenant.name}, this is a reminder that your rent payment of "
-            f"₹{tenant.rent_amount:.2f} is due today. Please make the payment "
-            f"through your tenant dashboard."
-        )
-        if tenant.phone_number:
-            send_sms_notification(tenant.phone_number, message)
+def allocate_last_months_water_bill(app):
+    with app.app_context():
+        allocate_water_bill()
 
-def init_scheduler():
-    scheduler = BackgroundScheduler()
+def apply_stripe_events(app):
+    with app.app_context():
+        apply_pending_events()
+
+def init_scheduler(app, scheduler=None):
+    """Start the background jobs; run it in one process only, or reminders are sent from each.
+
+    Pass a BlockingScheduler to run the jobs in the foreground, as the
+    run-scheduler command does.
+    """
+    scheduler = scheduler or BackgroundScheduler()
     # Run every day at 9:00 AM
     scheduler.add_job(
         check_and_send_reminders,
-        CronTrigger(hour=9, minute=0)
+        CronTrigger(hour=9, minute=0),
+        args=[app],
+        id='rent-reminders',
+        max_instances=1,
+        coalesce=True
+    )
+    # Bill last month's water early on the 1st
+    scheduler.add_job(
+        allocate_last_months_water_bill,
+        CronTrigger(day=1, hour=1, minute=0),
+        args=[app],
+        id='water-bill',
+        max_instances=1,
+        coalesce=True
+    )
+    # Pick up card payments whose intent creation was interrupted by a restart
+    scheduler.add_job(
+        process_pending_intents,
+        IntervalTrigger(minutes=1),
+        args=[app],
+        id='payment-intents',
+        max_instances=1,
+        coalesce=True
+    )
+    # Safety net for webhook events whose immediate processing was cut short
+    scheduler.add_job(
+        apply_stripe_events,
+        IntervalTrigger(minutes=1),
+        args=[app],
+        id='stripe-events',
+        max_instances=1,
+        coalesce=True
     )
-    scheduler.start() 
\ No newline at end of file
+    scheduler.start()
+    return scheduler
@@ -0,0 +1,26 @@
+"""The stripe library, imported and configured on first use.
+
+Importing stripe is a sizeable share of app startup. Most processes never
+talk to Stripe until the first card payment or webhook, and CLI commands
+other than process-payment-intents never do.
+
+STRIPE_API_KEY     secret API key
+STRIPE_API_BASE    point the client at another server, e.g. benchmarks/stripe_stub.py
+"""
+import os
+import threading
+
+_lock = threading.Lock()
+_stripe = None
+
+def get_stripe():
+    """The configured stripe module"""
+    global _stripe
+    if _stripe is None:
+        with _lock:
+            if _stripe is None:
+                import stripe
+                stripe.api_key = os.getenv('STRIPE_API_KEY')
+                stripe.api_base = os.getenv('STRIPE_API_BASE', stripe.api_base)
+                _stripe = stripe
+    return _stripe
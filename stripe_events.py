@@ -0,0 +1,161 @@
+"""Stripe webhook ingestion.
+
+The webhook handler only checks the signature and appends the event to the
+stripe_event log. A unique index on Stripe's event id drops redeliveries.
+apply_pending_events() reads the events not yet marked applied and applies
+their payment status changes a batch at a time. Each event is marked on its
+own row instead of moving one offset past the highest id, because Postgres
+can commit a lower id after a higher one was applied. On Postgres the batch
+is locked with SKIP LOCKED so concurrent consumers take different events;
+elsewhere a consumer that loses the race to mark a batch reads again. A
+month-end burst of events costs one read, one marking UPDATE and at most two
+payment UPDATEs per batch, instead of a transaction per event. Payments complete even if the tenant never comes
+back to /payment_success.
+
+STRIPE_WEBHOOK_SECRET   signing secret of the webhook endpoint (whsec_...)
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from models import db, Payment, StripeEvent
+from stripe_client import get_stripe
+from versions import bump_tenants
+
+BATCH_SIZE = 500
+# Wait this long after the first event of a burst so the rest land in the same batch
+BATCH_DELAY = 0.2
+SIGNATURE_TOLERANCE = 300
+
+SUCCEEDED = {'payment_intent.succeeded'}
+FAILED = {'payment_intent.payment_failed', 'payment_intent.canceled'}
+
+class InvalidEvent(ValueError):
+    """The request is not a correctly signed Stripe event"""
+
+def verify_event(payload, signature, secret=None):
+    """Check the Stripe-Signature header and parse the event; raises InvalidEvent"""
+    secret = secret or os.getenv('STRIPE_WEBHOOK_SECRET')
+    if not secret:
+        raise RuntimeError('STRIPE_WEBHOOK_SECRET is not set')
+    stripe = get_stripe()
+    try:
+        stripe.WebhookSignature.verify_header(payload, signature, secret, SIGNATURE_TOLERANCE)
+    except stripe.error.SignatureVerificationError as e:
+        raise InvalidEvent(str(e))
+    try:
+        event = json.loads(payload)
+    except ValueError:
+        raise InvalidEvent('Payload is not JSON')
+    if not isinstance(event, dict) or not event.get('id') or not event.get('type'):
+        raise InvalidEvent('Payload is not a Stripe event')
+    return event
+
+def _intent_id(event):
+    obj = (event.get('data') or {}).get('object') or {}
+    if obj.get('object') == 'payment_intent':
+        return obj.get('id')
+    return obj.get('payment_intent')
+
+def record_event(event, payload):
+    """Append a verified event to the log and commit; False if it was already there"""
+    row = {'event_id': event['id'], 'type': event['type'], 'payment_intent_id': _intent_id(event),
+           'created': event.get('created'), 'payload': payload}
+    connection = db.session.connection()
+    if connection.dialect.name in ('sqlite', 'postgresql'):
+        if connection.dialect.name == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        inserted = connection.execute(
+            insert(StripeEvent).values(**row).on_conflict_do_nothing(index_elements=['event_id'])
+        ).rowcount
+        db.session.commit()
+        return inserted == 1
+    try:
+        db.session.execute(db.insert(StripeEvent).values(**row))
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    return True
+
+def _claim(event_ids, now):
+    """Mark events applied in the current transaction; False if another consumer got to some first"""
+    return db.session.execute(
+        db.update(StripeEvent)
+        .where(StripeEvent.id.in_(event_ids), StripeEvent.applied_at.is_(None))
+        .values(applied_at=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount == len(event_ids)
+
+def _set_status(intent_ids, status, from_statuses):
+    if not intent_ids:
+        return []
+    return db.session.scalars(
+        db.update(Payment)
+        .where(Payment.stripe_payment_id.in_(intent_ids), Payment.status.in_(from_statuses))
+        .values(status=status)
+        .returning(Payment.user_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+def apply_pending_events(batch_size=BATCH_SIZE):
+    """Apply every event not yet marked applied to Payment, batch by batch; returns events applied"""
+    applied = 0
+    while True:
+        pending = (db.select(StripeEvent.id, StripeEvent.type, StripeEvent.payment_intent_id)
+                   .where(StripeEvent.applied_at.is_(None))
+                   .order_by(StripeEvent.id)
+                   .limit(batch_size))
+        if db.session.connection().dialect.name == 'postgresql':
+            pending = pending.with_for_update(skip_locked=True)
+        events = db.session.execute(pending).all()
+        if not events:
+            db.session.rollback()
+            return applied
+
+        if not _claim([event.id for event in events], datetime.utcnow()):
+            db.session.rollback()
+            continue
+
+        succeeded = {event.payment_intent_id for event in events if event.type in SUCCEEDED and event.payment_intent_id}
+        # A payment that failed and was then retried successfully only counts as succeeded
+        failed = {event.payment_intent_id for event in events if event.type in FAILED and event.payment_intent_id} - succeeded
+
+        # Never move a payment backwards: failures only touch payments still pending
+        user_ids = _set_status(succeeded, 'completed', ('pending', 'failed'))
+        user_ids += _set_status(failed, 'failed', ('pending',))
+        bump_tenants(set(user_ids))
+        db.session.commit()
+        applied += len(events)
+
+_executor = None
+_lock = threading.Lock()
+_scheduled = False
+
+def _drain(app):
+    global _scheduled
+    time.sleep(BATCH_DELAY)
+    with _lock:
+        _scheduled = False
+    with app.app_context():
+        try:
+            apply_pending_events()
+        except Exception:
+            app.logger.exception('Applying Stripe events failed; they stay in the log for the next run')
+            db.session.rollback()
+
+def schedule_event_processing(app):
+    """Apply new events shortly, on one background thread; a burst shares a single run"""
+    global _executor, _scheduled
+    with _lock:
+        if _scheduled:
+            return
+        _scheduled = True
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stripe-events')
+    _executor.submit(_drain, app)
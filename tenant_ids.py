@@ -0,0 +1,81 @@
+"""Collision-free allocation of 6-digit tenant IDs.
+
+IDs come from a persisted counter pushed through a keyed Feistel permutation
+of 000000-999999: every counter value maps to a different ID, consecutive
+values look unrelated, and nothing has to be probed. Reserving a block moves
+the counter once, inside the caller's transaction, so concurrent registrations
+(and bulk onboarding) can never be handed the same ID.
+
+TENANT_ID_KEY sets the permutation key (defaults to SECRET_KEY). Changing it
+after tenants exist is safe but may cost extra lookups for IDs already taken.
+"""
+import hashlib
+import hmac
+import os
+from sqlalchemy.exc import IntegrityError
+from models import db, User, IdSequence
+
+SEQUENCE_NAME = 'tenant_id'
+HALF = 1000  # IDs are split into two 3-digit halves
+ID_SPACE = HALF * HALF
+ROUNDS = 4
+
+def _key():
+    return (os.getenv('TENANT_ID_KEY') or os.getenv('SECRET_KEY', 'default-secret-key')).encode()
+
+def _round(key, number, value):
+    digest = hmac.new(key, f'{number}:{value}'.encode(), hashlib.sha256).digest()
+    return int.from_bytes(digest[:8], 'big') % HALF
+
+def permute(n, key=None):
+    """Map 0 <= n < ID_SPACE to a unique 6-digit string"""
+    key = key or _key()
+    left, right = divmod(n, HALF)
+    for number in range(ROUNDS):
+        left, right = right, (left + _round(key, number, right)) % HALF
+    return f'{left * HALF + right:06d}'
+
+def _seed_sequence():
+    """Create the counter row if it is missing, leaving one a concurrent caller made alone"""
+    connection = db.session.connection()
+    row = {'name': SEQUENCE_NAME, 'next_value': 0}
+    if connection.dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        try:
+            with db.session.begin_nested():
+                connection.execute(db.insert(IdSequence), row)
+        except IntegrityError:
+            pass
+        return
+    connection.execute(insert(IdSequence).on_conflict_do_nothing(index_elements=['name']), row)
+
+def _reserve(count):
+    # The UPDATE takes the write lock first, so concurrent reservations queue
+    # behind it and read back their own, non-overlapping range
+    increment = (db.update(IdSequence)
+                 .where(IdSequence.name == SEQUENCE_NAME)
+                 .values(next_value=IdSequence.next_value + count))
+    if db.session.execute(increment).rowcount == 0:
+        # Migration 7 seeds the row; databases made with create_all() get it here
+        _seed_sequence()
+        db.session.execute(increment)
+    next_value = db.session.scalar(db.select(IdSequence.next_value).where(IdSequence.name == SEQUENCE_NAME))
+    return next_value - count
+
+def allocate_tenant_ids(count):
+    """Reserve `count` unused tenant IDs in the current transaction"""
+    key = _key()
+    ids = []
+    while len(ids) < count:
+        needed = count - len(ids)
+        start = _reserve(needed)
+        if start + needed > ID_SPACE:
+            raise RuntimeError('Tenant ID space exhausted')
+        candidates = [permute(n, key) for n in range(start, start + needed)]
+        # Tenants registered before the allocator have random IDs that may collide
+        taken = set(db.session.scalars(db.select(User.tenant_id).where(User.tenant_id.in_(candidates))))
+        ids.extend(candidate for candidate in candidates if candidate not in taken)
+    return ids
@@ -0,0 +1,87 @@
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Configure before any app module is imported: they read these at import time
+_tmp = tempfile.mkdtemp(prefix='rentmanager-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ['PASSWORD_HASH_WORKERS'] = '0'
+os.environ['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+os.environ.pop('DATABASE_REPLICA_URL', None)
+os.environ.pop('SMS_GATEWAY_URL', None)
+
+from factory import create_app
+from models import db, User, ElectricityRate
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app(config={'TESTING': True,
+                             'SECRET_KEY': 'test-secret-key-long-enough-for-hs256',
+                             'UPLOAD_FOLDER': os.path.join(_tmp, 'uploads'),
+                             'UPLOAD_STAGING_FOLDER': os.path.join(_tmp, 'upload-staging')})
+    return app
+
+
+@pytest.fixture(autouse=True)
+def database(app):
+    import api
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        api.token_cache.clear()
+        api.dashboard_cache.clear()
+        yield db
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_tenant():
+    counter = iter(range(1, 1000))
+
+    def make(name=None, rent=1000.0, password='secret', **fields):
+        number = next(counter)
+        tenant = User(tenant_id=f'T{number:05d}', name=name or f'Tenant {number}', rent_amount=rent,
+                      is_owner=False, **fields)
+        tenant.set_password(password)
+        db.session.add(tenant)
+        db.session.commit()
+        return tenant
+    return make
+
+
+@pytest.fixture
+def owner():
+    owner = User(email='owner@example.com', name='Owner', is_owner=True)
+    owner.set_password('secret')
+    db.session.add(owner)
+    db.session.commit()
+    return owner
+
+
+@pytest.fixture
+def rate():
+    rate = ElectricityRate(rate_per_unit=8.0, effective_from=datetime(2024, 1, 1))
+    db.session.add(rate)
+    db.session.commit()
+    return rate
+
+
+@pytest.fixture
+def login(client):
+    def login(tenant_id, password='secret'):
+        response = client.post('/api/login', json={'tenant_id': tenant_id, 'password': password})
+        assert response.status_code == 200, response.get_json()
+        return {'Authorization': f"Bearer {response.get_json()['token']}"}
+    return login
@@ -0,0 +1,47 @@
+from models import db, User
+
+
+def test_tenant_dashboard_answers_304_for_a_matching_etag(client, make_tenant, login, rate):
+    tenant = make_tenant()
+    headers = login(tenant.tenant_id)
+
+    first = client.get('/api/tenant/dashboard', headers=headers)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+
+    cached = client.get('/api/tenant/dashboard', headers={**headers, 'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.headers['ETag'] == etag
+    assert cached.data == b''
+
+    other = client.get('/api/tenant/dashboard', headers={**headers, 'If-None-Match': '"something-else"'})
+    assert other.status_code == 200
+    assert other.get_json() == first.get_json()
+
+
+def test_tenant_dashboard_etag_changes_when_the_tenant_changes(client, make_tenant, login, rate):
+    tenant = make_tenant(rent=1000.0)
+    headers = login(tenant.tenant_id)
+    etag = client.get('/api/tenant/dashboard', headers=headers).headers['ETag']
+
+    db.session.get(User, tenant.id).rent_amount = 1500.0
+    db.session.commit()
+
+    response = client.get('/api/tenant/dashboard', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_cached_token_user_is_dropped_when_the_user_changes(client, make_tenant, login, app):
+    import api
+    tenant = make_tenant(name='Before')
+    headers = login(tenant.tenant_id)
+    client.get('/api/tenant/dashboard', headers=headers)
+    assert api.token_cache.stats()['size'] == 1
+
+    db.session.get(User, tenant.id).name = 'After'
+    db.session.commit()
+
+    with app.test_request_context():
+        user = api.resolve_token_user(headers['Authorization'].split(' ')[1])
+        assert user.name == 'After'
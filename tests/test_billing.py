@@ -0,0 +1,74 @@
+from datetime import datetime
+
+import pytest
+
+from billing import compute_bills, generate_monthly_bills, allocate_water_bill, water_consumption
+from ingest import ingest_readings
+from models import db, Payment, WaterBill
+
+
+def record(tenant, meter_type, value, timestamp):
+    return {'tenant_id': tenant.tenant_id, 'meter_type': meter_type, 'value': value, 'timestamp': timestamp}
+
+
+def test_compute_bills_adds_rent_electricity_and_water(make_tenant, rate):
+    tenant = make_tenant(rent=1000.0)
+    ingest_readings([record(tenant, 'electricity', 100, '2024-03-01T09:00:00'),
+                     record(tenant, 'electricity', 150, '2024-04-01T09:00:00')])
+    db.session.commit()
+    water = WaterBill(total_amount=30.0, billing_date=datetime(2024, 4, 1), total_tenants=2, amount_per_tenant=10.0)
+
+    [bill] = compute_bills([tenant], water_bill=water)
+
+    assert bill.units_consumed == 50
+    assert bill.electricity == pytest.approx(50 * 8.0)
+    assert bill.water == 10.0
+    assert bill.total == pytest.approx(1000.0 + 400.0 + 10.0)
+
+
+def test_compute_bills_skips_electricity_without_two_readings(make_tenant, rate):
+    tenant = make_tenant(rent=750.0)
+    ingest_readings([record(tenant, 'electricity', 100, '2024-03-01T09:00:00')])
+    db.session.commit()
+
+    [bill] = compute_bills([tenant])
+
+    assert bill.units_consumed is None
+    assert bill.electricity == 0.0
+    assert bill.total == 750.0
+
+
+def test_generate_monthly_bills_is_idempotent_within_a_period(make_tenant, rate):
+    make_tenant(rent=1000.0)
+    make_tenant(rent=1200.0)
+
+    assert generate_monthly_bills(now=datetime(2024, 5, 3)) == 2
+    assert generate_monthly_bills(now=datetime(2024, 5, 20)) == 0
+    assert Payment.query.count() == 2
+    assert sorted(payment.amount for payment in Payment.query) == [1000.0, 1200.0]
+
+    assert generate_monthly_bills(now=datetime(2024, 6, 1)) == 2
+
+
+def test_allocate_water_bill_rerun_rewrites_the_periods_row(make_tenant, rate):
+    first, second = make_tenant(), make_tenant()
+    ingest_readings([record(first, 'water', 10, '2024-03-31T09:00:00'),
+                     record(first, 'water', 40, '2024-04-15T09:00:00'),
+                     record(second, 'water', 5, '2024-04-02T09:00:00'),
+                     record(second, 'water', 25, '2024-04-28T09:00:00')])
+    db.session.commit()
+
+    assert water_consumption(datetime(2024, 4, 1), datetime(2024, 5, 1)) == {first.id: 30.0, second.id: 20.0}
+
+    bill = allocate_water_bill(now=datetime(2024, 5, 2))
+    assert (bill.period_start, bill.period_end) == (datetime(2024, 4, 1), datetime(2024, 5, 1))
+    assert bill.total_amount == 50.0
+    assert bill.amount_per_tenant == pytest.approx(50.0 / 3 * 8.0)
+
+    ingest_readings([record(second, 'water', 35, '2024-04-29T09:00:00')])
+    db.session.commit()
+    rerun = allocate_water_bill(now=datetime(2024, 5, 20))
+
+    assert rerun.id == bill.id
+    assert WaterBill.query.count() == 1
+    assert rerun.total_amount == 60.0
@@ -0,0 +1,112 @@
+from datetime import datetime
+
+import pytest
+
+from ingest import ingest_readings, records_from_csv, records_from_json, BatchRejected
+from models import db, MeterReading, LatestReading
+
+
+def test_valid_batch_is_inserted_and_latest_readings_rebuilt(make_tenant):
+    tenant = make_tenant()
+    report = ingest_readings([
+        {'tenant_id': tenant.tenant_id, 'meter_type': 'electricity', 'value': 10, 'timestamp': '2024-01-01T00:00:00'},
+        {'tenant_id': tenant.tenant_id, 'meter_type': 'electricity', 'value': 25, 'timestamp': '2024-02-01T00:00:00'},
+    ])
+    db.session.commit()
+
+    assert report == {'received': 2, 'accepted': 2, 'rejected': 0, 'errors': []}
+    assert MeterReading.query.count() == 2
+    latest = db.session.get(LatestReading, (tenant.id, 'electricity'))
+    assert latest.latest.reading_value == 25
+    assert latest.previous.reading_value == 10
+
+
+def test_invalid_records_are_reported_by_index_and_the_rest_accepted(make_tenant):
+    tenant = make_tenant()
+    ingest_readings([{'tenant_id': tenant.tenant_id, 'meter_type': 'water', 'value': 50,
+                      'timestamp': '2024-03-01T00:00:00'}])
+    db.session.commit()
+
+    report = ingest_readings([
+        {'tenant_id': 'NOBODY', 'meter_type': 'water', 'value': 1, 'timestamp': '2024-04-01T00:00:00'},
+        {'tenant_id': tenant.tenant_id, 'meter_type': 'water', 'value': 'NaN', 'timestamp': '2024-04-01T00:00:00'},
+        {'tenant_id': tenant.tenant_id, 'meter_type': 'water', 'value': 40, 'timestamp': '2024-04-01T00:00:00'},
+        {'tenant_id': tenant.tenant_id, 'meter_type': 'water', 'value': 55, 'timestamp': '2024-03-01T00:00:00'},
+        {'tenant_id': tenant.tenant_id, 'meter_type': 'gas', 'value': 1, 'timestamp': '2024-04-01T00:00:00'},
+        {'tenant_id': tenant.tenant_id, 'meter_type': 'water', 'value': 60, 'timestamp': 'yesterday'},
+        {'tenant_id': tenant.tenant_id, 'meter_type': 'water', 'value': 60, 'timestamp': '2024-05-01T00:00:00'},
+        {'tenant_id': tenant.tenant_id, 'meter_type': 'water', 'value': 61, 'timestamp': '2024-05-01T00:00:00'},
+        'not a record',
+    ])
+    db.session.commit()
+
+    errors = {error['index']: error['error'] for error in report['errors']}
+    assert report['received'] == 9
+    assert report['accepted'] == 1
+    assert report['rejected'] == 8
+    assert sorted(errors) == [0, 1, 2, 3, 4, 5, 7, 8]
+    assert errors[0] == 'unknown tenant'
+    assert errors[1] == 'value must be a non-negative number'
+    assert 'lower than the previous reading' in errors[2]
+    assert errors[3] == 'a reading is already recorded at this timestamp'
+    assert errors[4].startswith('meter_type must be one of')
+    assert errors[5] == 'timestamp must be ISO 8601 or Unix seconds'
+    assert errors[7] == 'duplicate timestamp in batch'
+    assert errors[8] == 'record must be an object'
+    assert [reading.reading_value for reading in MeterReading.query.order_by(MeterReading.reading_date)] == [50, 60]
+
+
+def test_record_higher_than_the_next_stored_reading_is_rejected(make_tenant):
+    tenant = make_tenant()
+    ingest_readings([{'tenant_id': tenant.tenant_id, 'meter_type': 'electricity', 'value': 100,
+                      'timestamp': '2024-06-01T00:00:00'}])
+    db.session.commit()
+
+    report = ingest_readings([{'tenant_id': tenant.tenant_id, 'meter_type': 'electricity', 'value': 120,
+                               'timestamp': '2024-05-01T00:00:00'}])
+
+    assert report['accepted'] == 0
+    assert 'higher than the next reading' in report['errors'][0]['error']
+
+
+def test_resending_a_batch_does_not_duplicate_it(make_tenant):
+    tenant = make_tenant()
+    batch = [{'tenant_id': tenant.tenant_id, 'meter_type': 'water', 'value': 5, 'timestamp': 1717200000}]
+    assert ingest_readings(batch)['accepted'] == 1
+    db.session.commit()
+
+    assert ingest_readings(batch)['accepted'] == 0
+    assert MeterReading.query.count() == 1
+
+
+def test_records_from_csv_requires_every_column():
+    with pytest.raises(BatchRejected, match='missing column'):
+        records_from_csv('tenant_id,value\nT00001,5\n')
+
+    rows = records_from_csv('tenant_id,meter_type,value,timestamp\nT00001,water,5,2024-01-01\n')
+    assert rows == [{'tenant_id': 'T00001', 'meter_type': 'water', 'value': '5', 'timestamp': '2024-01-01'}]
+
+
+def test_records_from_json_accepts_a_list_or_readings_object():
+    assert records_from_json([{'a': 1}]) == [{'a': 1}]
+    assert records_from_json({'readings': []}) == []
+    with pytest.raises(BatchRejected):
+        records_from_json({'rows': []})
+
+
+def test_batch_endpoint_requires_an_owner_and_reports_errors(client, make_tenant, owner, login):
+    tenant = make_tenant()
+
+    assert client.post('/api/readings/batch', json=[], headers=login(tenant.tenant_id)).status_code == 403
+
+    headers = login(owner.email)
+    response = client.post('/api/readings/batch', data='tenant_id,value\n', content_type='text/csv', headers=headers)
+    assert response.status_code == 400
+
+    response = client.post('/api/readings/batch', headers=headers, json={'readings': [
+        {'tenant_id': tenant.tenant_id, 'meter_type': 'water', 'value': 3, 'timestamp': '2024-01-01T00:00:00'},
+        {'tenant_id': 'NOBODY', 'meter_type': 'water', 'value': 3, 'timestamp': '2024-01-01T00:00:00'},
+    ]})
+    assert response.status_code == 200
+    assert response.get_json()['accepted'] == 1
+    assert response.get_json()['errors'] == [{'index': 1, 'tenant_id': 'NOBODY', 'error': 'unknown tenant'}]
@@ -0,0 +1,63 @@
+import base64
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, Payment
+from queries import encode_cursor, decode_cursor, payments_page
+
+
+def add_payments(tenant, count, status='completed'):
+    start = datetime(2024, 1, 1)
+    for day in range(count):
+        db.session.add(Payment(user_id=tenant.id, amount=100.0 + day, payment_date=start + timedelta(days=day),
+                               payment_method='cash', status=status))
+    db.session.commit()
+
+
+@pytest.mark.parametrize('cursor', [
+    'not base64!',
+    base64.urlsafe_b64encode(b'no separator').decode(),
+    base64.urlsafe_b64encode(b'2024-01-01T00:00:00|seven').decode(),
+    base64.urlsafe_b64encode(b'yesterday|7').decode(),
+    base64.urlsafe_b64encode(b'\xff\xfe|1').decode(),
+])
+def test_decode_cursor_rejects_malformed_cursors(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_cursor_round_trip(make_tenant):
+    add_payments(make_tenant(), 1)
+    payment = Payment.query.one()
+    assert decode_cursor(encode_cursor(payment)) == (payment.payment_date, payment.id)
+
+
+def test_payments_page_walks_every_payment_once(make_tenant):
+    add_payments(make_tenant(), 7)
+    seen, cursor = [], None
+    while True:
+        page, cursor = payments_page(cursor=cursor, limit=3)
+        seen += [payment.id for payment in page]
+        if cursor is None:
+            break
+
+    expected = [payment.id for payment in Payment.query.order_by(Payment.payment_date.desc(), Payment.id.desc())]
+    assert seen == expected
+
+
+def test_payments_page_filters_by_status(make_tenant):
+    tenant = make_tenant()
+    add_payments(tenant, 2, status='pending')
+    add_payments(tenant, 3)
+    page, cursor = payments_page(status='pending')
+    assert [payment.status for payment in page] == ['pending', 'pending']
+    assert cursor is None
+
+
+def test_payments_endpoint_answers_400_for_a_bad_cursor(client, owner):
+    with client.session_transaction() as session:
+        session['_user_id'] = str(owner.id)
+
+    assert client.get('/payments?cursor=garbage').status_code == 400
+    assert client.get('/payments').status_code == 200
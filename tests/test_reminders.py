@@ -0,0 +1,86 @@
+import threading
+from datetime import date
+
+import pytest
+
+from models import ReminderOutbox
+from reminders import enqueue_due_reminders, dispatch_reminders, GatewayError
+
+
+class FakeGateway:
+    """Records every send; `failures` maps a phone number to the errors to raise, in order"""
+
+    def __init__(self, failures=None):
+        self.failures = {to: list(errors) for to, errors in (failures or {}).items()}
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send(self, to, message, reference):
+        with self._lock:
+            pending = self.failures.get(to)
+            if pending:
+                raise pending.pop(0)
+            self.sent.append((to, reference))
+
+
+def test_enqueue_due_reminders_is_idempotent(make_tenant):
+    make_tenant(phone_number='+911111111111', rent_due_day=5)
+    make_tenant(phone_number='+912222222222', rent_due_day=5)
+    make_tenant(phone_number='+913333333333', rent_due_day=6)
+    make_tenant(rent_due_day=5)
+
+    assert enqueue_due_reminders(date(2024, 5, 5)) == 2
+    assert enqueue_due_reminders(date(2024, 5, 5)) == 0
+    assert ReminderOutbox.query.count() == 2
+    assert enqueue_due_reminders(date(2024, 6, 5)) == 2
+
+
+def test_enqueue_reminds_late_due_days_on_the_last_day_of_short_months(make_tenant):
+    make_tenant(phone_number='+911111111111', rent_due_day=31)
+    assert enqueue_due_reminders(date(2023, 2, 27)) == 0
+    assert enqueue_due_reminders(date(2023, 2, 28)) == 1
+
+
+def test_dispatch_sends_every_pending_row_once(make_tenant):
+    for number in range(3):
+        make_tenant(phone_number=f'+91000000000{number}', rent_due_day=1)
+    enqueue_due_reminders(date(2024, 5, 1))
+    gateway = FakeGateway()
+
+    assert dispatch_reminders(gateway, backoff=0)['sent'] == 3
+    assert dispatch_reminders(gateway, backoff=0)['sent'] == 0
+    assert len(gateway.sent) == 3
+    assert {row.status for row in ReminderOutbox.query} == {'sent'}
+    assert sorted(reference for _, reference in gateway.sent) == sorted(
+        f'reminder-{row.id}' for row in ReminderOutbox.query)
+
+
+def test_dispatch_retries_transient_errors_and_fails_permanent_ones(make_tenant):
+    make_tenant(phone_number='+911111111111', rent_due_day=1)
+    make_tenant(phone_number='+912222222222', rent_due_day=1)
+    enqueue_due_reminders(date(2024, 5, 1))
+    gateway = FakeGateway({
+        '+911111111111': [GatewayError('HTTP 503'), GatewayError('HTTP 503')],
+        '+912222222222': [GatewayError('HTTP 400: bad number', retryable=False)],
+    })
+
+    result = dispatch_reminders(gateway, max_attempts=5, backoff=0)
+
+    assert (result['sent'], result['failed']) == (1, 1)
+    rows = {row.phone_number: row for row in ReminderOutbox.query}
+    assert (rows['+911111111111'].status, rows['+911111111111'].attempts) == ('sent', 3)
+    assert (rows['+912222222222'].status, rows['+912222222222'].attempts) == ('failed', 1)
+    assert rows['+912222222222'].last_error == 'HTTP 400: bad number'
+
+
+def test_dispatch_without_a_gateway_raises(monkeypatch):
+    monkeypatch.delenv('SMS_GATEWAY_URL', raising=False)
+    with pytest.raises(RuntimeError):
+        dispatch_reminders()
+
+
+def test_scheduled_reminders_skip_without_a_gateway(app, make_tenant, monkeypatch):
+    from scheduler import check_and_send_reminders
+    monkeypatch.delenv('SMS_GATEWAY_URL', raising=False)
+    make_tenant(phone_number='+911111111111', rent_due_day=date.today().day)
+    assert check_and_send_reminders(app) == 0
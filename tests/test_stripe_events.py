@@ -0,0 +1,68 @@
+import json
+from datetime import datetime
+
+from models import db, Payment, StripeEvent
+from stripe_events import record_event, apply_pending_events
+
+
+def event(event_id, type, intent_id):
+    return {'id': event_id, 'type': type, 'created': 1717200000,
+            'data': {'object': {'object': 'payment_intent', 'id': intent_id}}}
+
+
+def add_payment(tenant, intent_id, status='pending'):
+    payment = Payment(user_id=tenant.id, amount=1000.0, payment_date=datetime(2024, 5, 1), payment_method='card',
+                      status=status, stripe_payment_id=intent_id)
+    db.session.add(payment)
+    db.session.commit()
+    return payment.id
+
+
+def deliver(*events):
+    return [record_event(item, json.dumps(item)) for item in events]
+
+
+def test_redelivered_events_are_recorded_once():
+    succeeded = event('evt_1', 'payment_intent.succeeded', 'pi_1')
+    assert deliver(succeeded, succeeded) == [True, False]
+    assert StripeEvent.query.count() == 1
+
+
+def test_apply_pending_events_marks_each_event_and_updates_payments(make_tenant):
+    tenant = make_tenant()
+    paid = add_payment(tenant, 'pi_paid')
+    declined = add_payment(tenant, 'pi_declined')
+    retried = add_payment(tenant, 'pi_retried')
+    deliver(event('evt_1', 'payment_intent.succeeded', 'pi_paid'),
+            event('evt_2', 'payment_intent.payment_failed', 'pi_declined'),
+            event('evt_3', 'payment_intent.payment_failed', 'pi_retried'),
+            event('evt_4', 'payment_intent.succeeded', 'pi_retried'),
+            event('evt_5', 'charge.refunded', None))
+
+    assert apply_pending_events(batch_size=2) == 5
+
+    assert all(row.applied_at is not None for row in StripeEvent.query)
+    assert db.session.get(Payment, paid).status == 'completed'
+    assert db.session.get(Payment, declined).status == 'failed'
+    assert db.session.get(Payment, retried).status == 'completed'
+    assert apply_pending_events() == 0
+
+
+def test_late_failure_never_moves_a_completed_payment_back(make_tenant):
+    payment_id = add_payment(make_tenant(), 'pi_1', status='completed')
+    deliver(event('evt_1', 'payment_intent.payment_failed', 'pi_1'))
+
+    assert apply_pending_events() == 1
+    assert db.session.get(Payment, payment_id).status == 'completed'
+
+
+def test_events_recorded_after_a_run_are_applied_by_the_next(make_tenant):
+    payment_id = add_payment(make_tenant(), 'pi_1')
+    deliver(event('evt_1', 'payment_intent.payment_failed', 'pi_1'))
+    assert apply_pending_events() == 1
+    assert db.session.get(Payment, payment_id).status == 'failed'
+
+    deliver(event('evt_2', 'payment_intent.succeeded', 'pi_1'))
+    assert apply_pending_events() == 1
+    db.session.expire_all()
+    assert db.session.get(Payment, payment_id).status == 'completed'
@@ -0,0 +1,22 @@
+from models import db
+from tenant_ids import permute, allocate_tenant_ids, ID_SPACE
+
+
+def test_permute_is_a_bijection_on_a_sample():
+    ids = {permute(n, b'key') for n in range(5000)}
+    assert len(ids) == 5000
+    assert all(len(tenant_id) == 6 and tenant_id.isdigit() for tenant_id in ids)
+    assert permute(ID_SPACE - 1, b'key') != permute(0, b'key')
+
+
+def test_allocated_ids_are_unique_across_calls_and_skip_taken_ones(make_tenant):
+    first = allocate_tenant_ids(50)
+    db.session.commit()
+    taken = make_tenant()
+    taken.tenant_id = permute(50)
+    db.session.commit()
+
+    second = allocate_tenant_ids(50)
+
+    assert len(set(first) | set(second)) == 100
+    assert permute(50) not in second
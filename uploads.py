@@ -0,0 +1,99 @@
+"""Size-capped, hashed storage of meter photo uploads.
+
+Werkzeug parses the multipart body before the view runs, spooling each file
+to a temporary file once it passes 500 KB. The only limit enforced while the
+body streams in is MAX_CONTENT_LENGTH (MAX_REQUEST_BYTES, room for two
+photos), which answers 413 as soon as a request crosses it. The per-file cap
+is checked afterwards. Each file is copied in fixed-size chunks into a temp
+file in a private staging folder while its SHA-256 is computed, and is
+rejected as soon as the copy crosses the cap. The first chunk is checked
+against the image formats images.py can decode before anything is written.
+Only a complete, accepted file is renamed into the public upload folder, so
+partial uploads are never served; the staging folder must be on the same
+filesystem as the upload folder for that rename to be atomic. A photo the
+tenant has already uploaded is not stored twice; the new reading points at
+the existing file instead.
+"""
+import hashlib
+import os
+import tempfile
+from collections import namedtuple
+from datetime import datetime
+from models import MeterReading
+
+CHUNK_SIZE = 64 * 1024
+MAX_FILE_BYTES = int(os.getenv('UPLOAD_MAX_FILE_BYTES', 10 * 1024 * 1024))
+# Applied to the whole request through Flask's MAX_CONTENT_LENGTH
+MAX_REQUEST_BYTES = int(os.getenv('UPLOAD_MAX_REQUEST_BYTES', 2 * MAX_FILE_BYTES + 64 * 1024))
+
+StoredPhoto = namedtuple('StoredPhoto', 'filename sha256 display_path thumbnail_path is_new')
+
+class UploadRejected(ValueError):
+    pass
+
+def sniff_image_type(head):
+    """File extension for the image format in the first bytes, or None if it is not one Pillow can read.
+
+    HEIC is not accepted: stock Pillow cannot decode it, so it would fail later in process-images.
+    """
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+def _copy_to_temp(stream, staging_folder, max_bytes):
+    head = stream.read(CHUNK_SIZE)
+    extension = sniff_image_type(head)
+    if extension is None:
+        raise UploadRejected('Only JPEG, PNG, GIF or WebP photos can be uploaded')
+
+    digest = hashlib.sha256()
+    size = 0
+    os.makedirs(staging_folder, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=staging_folder, prefix='upload-')
+    try:
+        with os.fdopen(fd, 'wb') as temp:
+            chunk = head
+            while chunk:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadRejected(f'Photos must be smaller than {max_bytes // (1024 * 1024)} MB')
+                digest.update(chunk)
+                temp.write(chunk)
+                chunk = stream.read(CHUNK_SIZE)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return temp_path, digest.hexdigest(), extension
+
+def store_reading_photo(file_storage, user_id, meter_type, upload_folder, staging_folder, max_bytes=MAX_FILE_BYTES):
+    """Store an uploaded meter photo, or reuse the tenant's identical earlier upload.
+
+    Raises UploadRejected if the file is not an image or is larger than max_bytes.
+    """
+    temp_path, sha256, extension = _copy_to_temp(file_storage.stream, staging_folder, max_bytes)
+
+    duplicate = MeterReading.query.filter_by(user_id=user_id, image_hash=sha256).first()
+    if duplicate and os.path.exists(os.path.join(upload_folder, duplicate.image_path)):
+        os.remove(temp_path)
+        return StoredPhoto(duplicate.image_path, sha256, duplicate.display_path, duplicate.thumbnail_path, False)
+
+    filename = f"{meter_type}_{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{sha256[:12]}.{extension}"
+    os.replace(temp_path, os.path.join(upload_folder, filename))
+    return StoredPhoto(filename, sha256, None, None, True)
+
+def attach_photo(reading, photo):
+    reading.image_path = photo.filename
+    reading.image_hash = photo.sha256
+    reading.display_path = photo.display_path
+    reading.thumbnail_path = photo.thumbnail_path
+
+def discard_photo(photo, upload_folder):
+    """Remove a photo stored by this request (used when the rest of the request fails)"""
+    if photo.is_new:
+        os.remove(os.path.join(upload_folder, photo.filename))
@@ -0,0 +1,131 @@
+"""Monthly consumption rollup and usage history.
+
+MonthlyConsumption holds the units each tenant used per meter and calendar
+month. A reading's units are its value minus the tenant's previous reading on
+the same meter. They count towards the month the reading was taken in, and a
+tenant's first reading counts as zero. LatestReading.record adds each new
+reading as it arrives. Bulk loads (ingest, onboarding, migrations) rebuild
+the rows of the tenants they touched with rebuild_monthly_consumption().
+Usage history then reads at most one row per meter and month, however long
+the reading history is.
+"""
+from datetime import date, datetime, time
+from sqlalchemy import func, cast, Date
+from models import db, MeterReading, MonthlyConsumption
+from queries import METER_TYPES
+
+DEFAULT_MONTHS = 36
+MAX_MONTHS = 120
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+def months_before(month, count):
+    """First day of the month `count` months before `month`"""
+    index = month.year * 12 + month.month - 1 - count
+    return date(index // 12, index % 12 + 1, 1)
+
+def _upsert(dialect_name):
+    if dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    stmt = insert(MonthlyConsumption)
+    return stmt.on_conflict_do_update(
+        index_elements=['user_id', 'meter_type', 'month'],
+        set_={'units': MonthlyConsumption.units + stmt.excluded.units,
+              'readings': MonthlyConsumption.readings + stmt.excluded.readings})
+
+def add_consumption(reading, units):
+    """Count one new reading and its units in its month's row, in the caller's transaction"""
+    row = {'user_id': reading.user_id, 'meter_type': reading.meter_type,
+           'month': month_start(reading.reading_date), 'units': units, 'readings': 1}
+    connection = db.session.connection()
+    stmt = _upsert(connection.dialect.name)
+    if stmt is not None:
+        connection.execute(stmt, row)
+        return
+
+    updated = connection.execute(
+        db.update(MonthlyConsumption)
+        .where(MonthlyConsumption.user_id == row['user_id'], MonthlyConsumption.meter_type == row['meter_type'],
+               MonthlyConsumption.month == row['month'])
+        .values(units=MonthlyConsumption.units + units, readings=MonthlyConsumption.readings + 1)
+    ).rowcount
+    if not updated:
+        connection.execute(db.insert(MonthlyConsumption), row)
+
+def _month_of(column, dialect_name):
+    if dialect_name == 'sqlite':
+        return func.date(column, 'start of month')
+    return cast(func.date_trunc('month', column), Date)
+
+def rebuild_monthly_consumption(executor=None, user_ids=None, since=None):
+    """Recompute MonthlyConsumption from the full MeterReading history.
+
+    `executor` is a session or connection; the caller commits. Pass `user_ids`
+    to only rebuild those tenants' rows, and `since` (a date or datetime) to
+    only rebuild the months from the one it falls in onwards.
+    """
+    executor = executor or db.session
+    dialect = getattr(executor, 'dialect', None) or executor.get_bind().dialect
+    units = (MeterReading.reading_value - func.lag(MeterReading.reading_value).over(
+        partition_by=(MeterReading.user_id, MeterReading.meter_type),
+        order_by=(MeterReading.reading_date, MeterReading.id)))
+    ordered = db.select(
+        MeterReading.user_id,
+        MeterReading.meter_type,
+        MeterReading.reading_date,
+        units.label('units'))
+    delete = db.delete(MonthlyConsumption)
+    if user_ids is not None:
+        ordered = ordered.where(MeterReading.user_id.in_(user_ids))
+        delete = delete.where(MonthlyConsumption.user_id.in_(user_ids))
+    ordered = ordered.subquery()
+    # The window runs over all history so the first reading of a month still has its predecessor
+    month = _month_of(ordered.c.reading_date, dialect.name).label('month')
+    rows = (db.select(ordered.c.user_id, ordered.c.meter_type, month,
+                      func.coalesce(func.sum(ordered.c.units), 0.0), func.count())
+            .group_by(ordered.c.user_id, ordered.c.meter_type, month))
+    if since is not None:
+        first_month = month_start(since)
+        rows = rows.where(ordered.c.reading_date >= datetime.combine(first_month, time()))
+        delete = delete.where(MonthlyConsumption.month >= first_month)
+
+    executor.execute(delete)
+    executor.execute(db.insert(MonthlyConsumption).from_select(
+        ['user_id', 'meter_type', 'month', 'units', 'readings'], rows))
+
+def usage_params(args):
+    """(months, meter_types) from request args; raises ValueError on bad input"""
+    months = args.get('months', DEFAULT_MONTHS, type=int)
+    if months is None or not 1 <= months <= MAX_MONTHS:
+        raise ValueError(f'months must be between 1 and {MAX_MONTHS}')
+    meter_type = args.get('meter_type')
+    if meter_type and meter_type not in METER_TYPES:
+        raise ValueError(f"meter_type must be one of {', '.join(METER_TYPES)}")
+    return months, (meter_type,) if meter_type else METER_TYPES
+
+def usage_history(user_id=None, months=DEFAULT_MONTHS, meter_types=METER_TYPES, today=None):
+    """Units per month over the last `months` months, for one tenant or summed over all of them.
+
+    Returns {'start': 'YYYY-MM', 'end': 'YYYY-MM', 'series': {meter_type: [point, ...]}},
+    where each point is {'month': 'YYYY-MM', 'units': float, 'readings': int}, oldest
+    first. Months without readings are left out.
+    """
+    end = month_start(today or date.today())
+    start = months_before(end, months - 1)
+    stmt = (db.select(MonthlyConsumption.meter_type, MonthlyConsumption.month,
+                      func.sum(MonthlyConsumption.units), func.sum(MonthlyConsumption.readings))
+            .where(MonthlyConsumption.month >= start, MonthlyConsumption.meter_type.in_(meter_types))
+            .group_by(MonthlyConsumption.meter_type, MonthlyConsumption.month)
+            .order_by(MonthlyConsumption.month))
+    if user_id is not None:
+        stmt = stmt.where(MonthlyConsumption.user_id == user_id)
+
+    series = {meter_type: [] for meter_type in meter_types}
+    for meter_type, month, units, readings in db.session.execute(stmt):
+        series[meter_type].append({'month': f'{month:%Y-%m}', 'units': round(units, 3), 'readings': readings})
+    return {'start': f'{start:%Y-%m}', 'end': f'{end:%Y-%m}', 'series': series}
@@ -0,0 +1,93 @@
+"""Data versions used to validate cached dashboard output.
+
+Every tenant has a counter that is bumped whenever something shown on their
+dashboard changes (readings, payments, their own account), and one global
+counter covers data shared by all tenants (electricity rates, water bills).
+Every account, owners included, also has a 'user:<id>' counter that only
+its own changes bump; API token snapshots are checked against it.
+ORM changes are picked up automatically at flush time; code that writes with
+bulk Core statements calls bump() itself. The counters live in the database,
+so every process sees the same versions.
+"""
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import db, User, MeterReading, Payment, ElectricityRate, WaterBill, DataVersion
+
+GLOBAL_KEY = 'global'
+
+def tenant_key(user_id):
+    return f'tenant:{user_id}'
+
+def user_key(user_id):
+    return f'user:{user_id}'
+
+def _keys_for(obj):
+    if isinstance(obj, (MeterReading, Payment)):
+        return {tenant_key(obj.user_id)}
+    if isinstance(obj, User) and obj.id is not None:
+        return {user_key(obj.id)} if obj.is_owner else {user_key(obj.id), tenant_key(obj.id)}
+    if isinstance(obj, (ElectricityRate, WaterBill)):
+        return {GLOBAL_KEY}
+    return set()
+
+def _upsert(dialect_name):
+    if dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    stmt = insert(DataVersion)
+    return stmt.on_conflict_do_update(index_elements=['key'], set_={'version': DataVersion.version + 1})
+
+def bump(keys, connection=None):
+    """Increment the counters for `keys` (creating them at 1), in the caller's transaction"""
+    keys = sorted(set(keys))
+    if not keys:
+        return
+    connection = connection or db.session.connection()
+    stmt = _upsert(connection.dialect.name)
+    if stmt is not None:
+        connection.execute(stmt, [{'key': key, 'version': 1} for key in keys])
+        return
+
+    existing = set(connection.execute(db.select(DataVersion.key).where(DataVersion.key.in_(keys))).scalars())
+    connection.execute(db.update(DataVersion).where(DataVersion.key.in_(existing))
+                       .values(version=DataVersion.version + 1))
+    missing = [{'key': key, 'version': 1} for key in keys if key not in existing]
+    if missing:
+        connection.execute(db.insert(DataVersion), missing)
+
+def bump_tenants(user_ids, connection=None):
+    bump([tenant_key(user_id) for user_id in user_ids], connection)
+
+@event.listens_for(Session, 'after_flush')
+def _bump_changed(session, flush_context):
+    # new/dirty/deleted still describe the pre-flush state here
+    dirty = [obj for obj in session.dirty if session.is_modified(obj, include_collections=False)]
+    keys = set()
+    for obj in list(session.new) + dirty + list(session.deleted):
+        keys |= _keys_for(obj)
+    bump(keys, session.connection())
+
+def dashboard_versions(user_id):
+    """(tenant_version, global_version) for one tenant, in a single primary-key query"""
+    versions = dict(db.session.execute(
+        db.select(DataVersion.key, DataVersion.version)
+        .where(DataVersion.key.in_([tenant_key(user_id), GLOBAL_KEY]))
+    ).all())
+    return versions.get(tenant_key(user_id), 0), versions.get(GLOBAL_KEY, 0)
+
+def user_version(user_id):
+    """Version of one account's own row, 0 if it never changed"""
+    return db.session.scalar(db.select(DataVersion.version).where(DataVersion.key == user_key(user_id))) or 0
+
+def tenant_versions():
+    """({user_id: version} for every tenant that has a counter, global_version), in one query"""
+    versions, global_version = {}, 0
+    for key, version in db.session.execute(db.select(DataVersion.key, DataVersion.version)).all():
+        if key == GLOBAL_KEY:
+            global_version = version
+        elif key.startswith('tenant:'):
+            versions[int(key.split(':', 1)[1])] = version
+    return versions, global_version
@@ -0,0 +1,861 @@
+"""The HTML site: pages for the owner and tenants, and the owner's flask CLI commands.
+
+Registered on the app by factory.create_app, next to the /api blueprint.
+"""
+from flask import (Blueprint, Response, render_template, stream_template, stream_with_context, request, redirect,
+                   url_for, flash, jsonify, abort, current_app)
+from flask_login import LoginManager, login_user, logout_user, login_required, current_user
+from models import db, User, MeterReading, LatestReading, MonthlyConsumption, Payment, ElectricityRate, ReminderOutbox
+from db_config import read_only, track_user
+from instrumentation import count_queries
+from fragments import render_fragments
+from queries import (latest_readings_by_tenant, recent_readings, attach_previous_readings,
+                     rebuild_latest_readings, payments_page, PAGE_SIZE)
+from billing import (bill_for_tenant, compute_bills, generate_monthly_bills, current_water_bill, allocate_water_bill,
+                     billing_period)
+from versions import tenant_versions, bump, GLOBAL_KEY
+from usage import usage_params, usage_history, rebuild_monthly_consumption
+import exports
+from images import schedule_reading_images, process_pending_images
+from ingest import ingest_readings, records_from_csv, BatchRejected
+from card_payments import queue_card_payment, schedule_intent, process_pending_intents, intent_status_payload
+from stripe_events import verify_event, record_event, schedule_event_processing, apply_pending_events, InvalidEvent
+from reminders import send_rent_reminders, enqueue_due_reminders
+from onboarding import parse_tenant_csv, onboard_tenants, credentials_csv, OnboardingError
+from uploads import store_reading_photo, attach_photo, discard_photo, UploadRejected, MAX_FILE_BYTES
+from datetime import datetime
+import click
+
+# CLI commands are top-level (flask send-reminders), not grouped under "web"
+bp = Blueprint('web', __name__, cli_group=None)
+
+login_manager = LoginManager()
+login_manager.login_view = 'web.login'
+
+# Payment list page sizes; pages above STREAM_PAGE_SIZE are streamed
+MAX_PAGE_SIZE = 1000
+STREAM_PAGE_SIZE = 200
+
+@login_manager.user_loader
+def load_user(user_id):
+    user = User.query.get(int(user_id))
+    if user:
+        track_user(user.id)
+    return user
+
+@bp.route('/')
+def index():
+    if current_user.is_authenticated:
+        if current_user.is_owner:
+            return redirect(url_for('web.owner_dashboard'))
+        return redirect(url_for('web.tenant_dashboard'))
+    return render_template('index.html')
+
+@bp.route('/login', methods=['GET', 'POST'])
+def login():
+    if request.method == 'POST':
+        tenant_id = request.form.get('tenant_id')
+        password = request.form.get('password')
+        
+        # Add debug prints
+        print(f"Attempting login with tenant_id/email: {tenant_id}")
+        
+        # Try to find user by tenant_id first (for tenants)
+        user = User.query.filter_by(tenant_id=tenant_id).first()
+        if not user:
+            # If not found, try email (for owner)
+            user = User.query.filter_by(email=tenant_id).first()
+            print(f"Found user by email: {user.email if user else 'None'}")
+        else:
+            print(f"Found user by tenant_id: {user.tenant_id}")
+        
+        if user and user.check_password(password):
+            if user.upgrade_password_hash(password):
+                db.session.commit()
+            login_user(user)
+            print(f"Successfully logged in user: {user.email}")
+            return redirect(url_for('web.index'))
+        
+        print("Invalid login credentials")
+        flash('Invalid credentials. Please check your email/tenant ID and password.')
+    return render_template('login.html')
+
+@bp.route('/register', methods=['GET', 'POST'])
+def register():
+    if request.method == 'POST':
+        email = request.form.get('email')
+        name = request.form.get('name')
+        password = request.form.get('password')
+        
+        # Add debug prints
+        print(f"Attempting to register new owner with email: {email}")
+        
+        # Check if any owner exists
+        existing_owner = User.query.filter_by(is_owner=True).first()
+        if existing_owner:
+            print(f"Found existing owner with email: {existing_owner.email}")
+            flash('An owner account already exists. Please login instead.')
+            return redirect(url_for('web.login'))
+        
+        # Check for existing email
+        existing_user = User.query.filter_by(email=email).first()
+        if existing_user:
+            print(f"Email {email} already registered")
+            flash('Email already registered')
+            return redirect(url_for('web.register'))
+        
+        # Create new owner user
+        user = User(
+            email=email,
+            name=name,
+            is_owner=True,
+            rent_amount=0.0  # Not relevant for owner
+        )
+        user.set_password(password)
+        
+        try:
+            print("Adding new owner to database")
+            db.session.add(user)
+            db.session.commit()
+            print(f"Successfully registered owner with email: {email}")
+            flash('Registration successful! Please login.')
+            return redirect(url_for('web.login'))
+        except Exception as e:
+            print(f"Error during registration: {str(e)}")
+            db.session.rollback()
+            flash('An error occurred during registration. Please try again.')
+            return redirect(url_for('web.register'))
+    
+    return render_template('register.html')
+
+@bp.route('/logout')
+@login_required
+def logout():
+    logout_user()
+    return redirect(url_for('web.index'))
+
+@bp.route('/tenant_dashboard')
+@login_required
+@read_only
+@count_queries
+def tenant_dashboard():
+    if current_user.is_owner:
+        return redirect(url_for('web.owner_dashboard'))
+    
+    # Latest and previous reading of each meter, read from the LatestReading table
+    readings = latest_readings_by_tenant([current_user.id])[current_user.id]
+    
+    # Get the latest reading of either meter and the one before it
+    recent = recent_readings(readings)
+    latest_reading = recent[0] if recent else None
+    previous_reading = recent[1] if len(recent) > 1 else None
+    
+    # Check for existing payment for current billing period
+    existing_payment = None
+    if latest_reading:
+        existing_payment = Payment.query.filter(
+            Payment.user_id == current_user.id,
+            Payment.payment_date >= latest_reading.reading_date
+        ).order_by(Payment.payment_date.desc()).first()
+    
+    # Determine if payment options should be shown
+    show_payment_options = True
+    if existing_payment and existing_payment.status in ['pending', 'completed', 'confirmed']:
+        show_payment_options = False
+    
+    # Get last 10 meter readings
+    meter_readings = MeterReading.query.filter_by(user_id=current_user.id).order_by(MeterReading.reading_date.desc()).limit(10).all()
+    
+    # Calculate consumption for each reading against the previous reading of the same meter
+    attach_previous_readings(meter_readings, 'previous')
+    for reading in meter_readings:
+        if reading.previous:
+            reading.consumption = reading.reading_value - reading.previous.reading_value
+        else:
+            reading.consumption = 0
+    
+    current_rate = ElectricityRate.query.order_by(ElectricityRate.effective_from.desc()).first()
+    
+    # Get payment history
+    payments = Payment.query.filter_by(user_id=current_user.id).order_by(Payment.payment_date.desc()).limit(10).all()
+    
+    # Get latest electricity reading
+    latest_electricity_reading = readings['electricity']['current']
+    if latest_electricity_reading:
+        latest_electricity_reading.previous = readings['electricity']['previous']
+    
+    # Get latest water reading and bill
+    latest_water_reading = readings['water']['current']
+    if latest_water_reading:
+        latest_water_reading.previous = readings['water']['previous']
+    
+    # Get total number of tenants
+    total_tenant = User.query.filter_by(is_owner=False).count()
+    
+    water_bill = current_water_bill()
+    bill = bill_for_tenant(current_user, readings={current_user.id: readings}, rate=current_rate, water_bill=water_bill)
+    
+    return render_template('tenant_dashboard.html',
+                         latest_reading=latest_reading,
+                         previous_reading=previous_reading,
+                         meter_readings=meter_readings,
+                         current_rate=current_rate,
+                         payments=payments,
+                         existing_payment=existing_payment,
+                         show_payment_options=show_payment_options,
+                         latest_electricity_reading=latest_electricity_reading,
+                         latest_water_reading=latest_water_reading,
+                         water_bill=water_bill,
+                         bill=bill,
+                         total_tenant=total_tenant)
+
+def _tenant_rows(tenants, versions, global_version, current_rate, water_bill):
+    """Rendered owner dashboard row per tenant id; readings are only loaded for rows not in the cache"""
+    tenants_by_id = {tenant.id: tenant for tenant in tenants}
+    
+    def load_context(user_ids):
+        tenant_readings = latest_readings_by_tenant(user_ids)
+        bills = compute_bills([tenants_by_id[user_id] for user_id in user_ids], readings=tenant_readings,
+                              rate=current_rate, water_bill=water_bill)
+        return {bill.user_id: dict(tenant=tenants_by_id[bill.user_id], readings=tenant_readings[bill.user_id],
+                                   bill=bill)
+                for bill in bills}
+    
+    row_versions = {tenant.id: f'{versions.get(tenant.id, 0)}-{global_version}' for tenant in tenants}
+    return render_fragments('owner_tenant_row.html', row_versions, load_context)
+
+@bp.route('/owner_dashboard')
+@login_required
+@read_only
+@count_queries
+def owner_dashboard():
+    if not current_user.is_owner:
+        return redirect(url_for('web.tenant_dashboard'))
+    
+    # Read versions before the data, so a row is never cached under a newer version than it shows
+    versions, global_version = tenant_versions()
+    
+    # Get all tenants
+    tenants = User.query.filter_by(is_owner=False).all()
+    
+    # Get all readings ordered by date
+    readings = MeterReading.query.join(User).filter(User.is_owner == False).order_by(MeterReading.reading_date.desc()).limit(50).all()
+    
+    # Previous reading of each recent row for consumption calculation
+    attach_previous_readings(readings)
+    
+    # Get current electricity rate
+    current_rate = ElectricityRate.query.order_by(ElectricityRate.effective_from.desc()).first()
+    
+    # Get latest water bill
+    water_bill = current_water_bill()
+    
+    # Tenant rows, re-rendered only for tenants whose data changed since they were cached
+    tenant_rows = _tenant_rows(tenants, versions, global_version, current_rate, water_bill)
+    
+    # First page of payment history and pending payments, newest first
+    per_page = max(1, min(request.args.get('per_page', PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    try:
+        payments, next_cursor = payments_page(cursor=request.args.get('cursor'), limit=per_page)
+        pending_payments, next_pending_cursor = payments_page(
+            cursor=request.args.get('pending_cursor'), status='pending', limit=per_page)
+    except ValueError:
+        abort(400)
+    
+    context = dict(tenants=tenants,
+                   readings=readings,
+                   tenant_rows=tenant_rows,
+                   current_rate=current_rate,
+                   water_bill=water_bill,
+                   pending_payments=pending_payments,
+                   next_pending_cursor=next_pending_cursor,
+                   payments=payments,
+                   next_cursor=next_cursor)
+    
+    # Stream large pages so the first bytes go out before every row is rendered
+    if per_page > STREAM_PAGE_SIZE:
+        return stream_template('owner_dashboard.html', **context)
+    return render_template('owner_dashboard.html', **context)
+
+@bp.route('/payments')
+@login_required
+def list_payments():
+    if not current_user.is_owner:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    limit = max(1, min(request.args.get('limit', PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    try:
+        payments, next_cursor = payments_page(
+            cursor=request.args.get('cursor'), status=request.args.get('status'), limit=limit)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    return jsonify({
+        'payments': [{
+            'id': payment.id,
+            'date': payment.payment_date.isoformat(),
+            'tenant_name': payment.user.name,
+            'tenant_id': payment.user.tenant_id,
+            'amount': payment.amount,
+            'method': payment.payment_method,
+            'status': payment.status,
+            'reference': payment.transaction_reference or payment.stripe_payment_id
+        } for payment in payments],
+        'next_cursor': next_cursor
+    })
+
+@bp.route('/usage')
+@login_required
+@read_only
+def usage():
+    """Monthly usage history: a tenant's own, or for the owner one tenant's (?tenant_id=) or the building's"""
+    try:
+        months, meter_types = usage_params(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    user_id = current_user.id
+    tenant_id = current_user.tenant_id
+    if current_user.is_owner:
+        tenant_id = request.args.get('tenant_id')
+        user_id = None
+        if tenant_id:
+            tenant = User.query.filter_by(tenant_id=tenant_id, is_owner=False).first()
+            if not tenant:
+                return jsonify({'error': 'Tenant not found'}), 404
+            user_id = tenant.id
+    
+    return jsonify({'tenant_id': tenant_id, **usage_history(user_id, months, meter_types)})
+
+@bp.route('/export/<dataset>.<fmt>')
+@login_required
+def export_data(dataset, fmt):
+    if not current_user.is_owner:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    if dataset not in exports.DATASETS or fmt not in exports.FORMATS:
+        abort(404)
+    
+    try:
+        filters = exports.parse_filters(request.args.get('start'), request.args.get('end'), request.args.get('tenant_id'))
+    except ValueError:
+        return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+    
+    _, mimetype = exports.FORMATS[fmt]
+    filename = f"{dataset}_{datetime.now().strftime('%Y%m%d')}.{fmt}"
+    return Response(stream_with_context(exports.export(dataset, fmt, **filters)),
+                    mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@bp.route('/register_tenant', methods=['GET', 'POST'])
+@login_required
+def register_tenant():
+    if not current_user.is_owner:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    if request.method == 'POST':
+        name = request.form.get('name')
+        rent_amount = float(request.form.get('rent_amount'))
+        initial_electricity_reading = float(request.form.get('initial_electricity_reading'))
+        initial_water_reading = float(request.form.get('initial_water_reading'))
+        phone_number = (request.form.get('phone_number') or '').strip() or None
+        rent_due_day = request.form.get('rent_due_day', type=int)
+        if rent_due_day is not None and not 1 <= rent_due_day <= 31:
+            flash('Rent due day must be between 1 and 31')
+            return redirect(url_for('web.register_tenant'))
+        
+        # Generate password and unique tenant ID
+        password = User.generate_tenant_password()
+        
+        tenant = User(
+            name=name,
+            rent_amount=rent_amount,
+            phone_number=phone_number,
+            rent_due_day=rent_due_day,
+            is_owner=False
+        )
+        # Hash before reserving the ID, which holds the write lock until commit
+        tenant.set_password(password)
+        tenant_id = User.generate_unique_tenant_id()
+        tenant.tenant_id = tenant_id
+        
+        # Add tenant to database first to get the user_id
+        db.session.add(tenant)
+        db.session.flush()  # This assigns the ID to the tenant object
+        
+        # Create initial electricity meter reading
+        initial_electricity = MeterReading(
+            user_id=tenant.id,
+            reading_value=initial_electricity_reading,
+            reading_date=datetime.now(),
+            image_path='initial_reading.jpg',  # Placeholder image path
+            is_processed=True,  # Mark as processed since it's entered by owner
+            meter_type='electricity'
+        )
+        
+        # Create initial water meter reading
+        initial_water = MeterReading(
+            user_id=tenant.id,
+            reading_value=initial_water_reading,
+            reading_date=datetime.now(),
+            image_path='initial_reading.jpg',  # Placeholder image path
+            is_processed=True,  # Mark as processed since it's entered by owner
+            meter_type='water'
+        )
+        
+        db.session.add(initial_electricity)
+        db.session.add(initial_water)
+        LatestReading.record(initial_electricity)
+        LatestReading.record(initial_water)
+        db.session.commit()
+        
+        flash(f'Tenant registered successfully! Tenant ID: {tenant_id}, Password: {password}')
+        return redirect(url_for('web.owner_dashboard'))
+    
+    return render_template('register_tenant.html')
+
+@bp.route('/bulk_register_tenants', methods=['POST'])
+@login_required
+def bulk_register_tenants():
+    if not current_user.is_owner:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    file = request.files.get('tenants_csv')
+    if not file or not file.filename:
+        flash('Please choose a CSV file to import')
+        return redirect(url_for('web.register_tenant'))
+    
+    try:
+        rows = parse_tenant_csv(file.read().decode('utf-8-sig'))
+        credentials = onboard_tenants(rows)
+        db.session.commit()
+    except UnicodeDecodeError:
+        flash('The CSV file must be UTF-8 encoded')
+        return redirect(url_for('web.register_tenant'))
+    except OnboardingError as e:
+        # Nothing has been written yet; report every bad row at once
+        db.session.rollback()
+        for line, message in e.errors[:20]:
+            flash(f'Line {line}: {message}')
+        if len(e.errors) > 20:
+            flash(f'...and {len(e.errors) - 20} more errors')
+        return redirect(url_for('web.register_tenant'))
+    except Exception:
+        db.session.rollback()
+        raise
+    
+    current_app.logger.info('Bulk registered %d tenants', len(credentials))
+    filename = f"tenant_credentials_{datetime.now().strftime('%Y%m%d%H%M%S')}.csv"
+    return Response(credentials_csv(credentials), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@bp.route('/set_electricity_rate', methods=['POST'])
+@login_required
+def set_electricity_rate():
+    if not current_user.is_owner:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    rate = float(request.form.get('rate_per_unit'))
+    
+    new_rate = ElectricityRate(
+        rate_per_unit=rate,
+        effective_from=datetime.now()
+    )
+    db.session.add(new_rate)
+    db.session.commit()
+    
+    flash('Electricity rate updated successfully')
+    return redirect(url_for('web.owner_dashboard'))
+
+def _discard_upload(stored_photos):
+    db.session.rollback()
+    for photo in stored_photos:
+        discard_photo(photo, current_app.config['UPLOAD_FOLDER'])
+
+def _reject_upload(stored_photos, message):
+    _discard_upload(stored_photos)
+    flash(message)
+    return redirect(url_for('web.tenant_dashboard'))
+
+@bp.errorhandler(413)
+def upload_too_large(e):
+    flash(f'Upload too large. Photos must be smaller than {MAX_FILE_BYTES // (1024 * 1024)} MB each.')
+    return redirect(url_for('web.tenant_dashboard'))
+
+@bp.route('/upload_reading', methods=['POST'])
+@login_required
+def upload_reading():
+    if current_user.is_owner:
+        return redirect(url_for('web.owner_dashboard'))
+    
+    # Photos stored by this request, the readings to save, and those whose photo still needs resizing
+    stored_photos = []
+    readings = []
+    photo_readings = []
+    
+    # Handle electricity reading
+    if 'electricity_reading' in request.form and 'electricity_image' in request.files:
+        electricity_reading = float(request.form.get('electricity_reading'))
+        electricity_image = request.files['electricity_image']
+        
+        reading = MeterReading(
+            user_id=current_user.id,
+            reading_value=electricity_reading,
+            reading_date=datetime.now(),
+            image_path='',
+            meter_type='electricity',
+            is_processed=True
+        )
+        
+        if electricity_image.filename:
+            try:
+                photo = store_reading_photo(electricity_image, current_user.id, 'electricity', current_app.config['UPLOAD_FOLDER'],
+                                            current_app.config['UPLOAD_STAGING_FOLDER'])
+            except UploadRejected as e:
+                return _reject_upload(stored_photos, str(e))
+            stored_photos.append(photo)
+            attach_photo(reading, photo)
+            if not reading.display_path:
+                photo_readings.append(reading)
+        
+        readings.append(reading)
+    
+    # Handle water reading
+    if 'water_reading' in request.form and 'water_image' in request.files:
+        water_reading = float(request.form.get('water_reading'))
+        water_image = request.files['water_image']
+        
+        reading = MeterReading(
+            user_id=current_user.id,
+            reading_value=water_reading,
+            reading_date=datetime.now(),
+            image_path='',
+            meter_type='water',
+            is_processed=True
+        )
+        
+        if water_image.filename:
+            try:
+                photo = store_reading_photo(water_image, current_user.id, 'water', current_app.config['UPLOAD_FOLDER'],
+                                            current_app.config['UPLOAD_STAGING_FOLDER'])
+            except UploadRejected as e:
+                return _reject_upload(stored_photos, str(e))
+            stored_photos.append(photo)
+            attach_photo(reading, photo)
+            if not reading.display_path:
+                photo_readings.append(reading)
+        
+        readings.append(reading)
+    
+    try:
+        for reading in readings:
+            db.session.add(reading)
+            LatestReading.record(reading)
+        db.session.commit()
+    except Exception:
+        # Don't leave the stored photos behind without a reading pointing at them
+        _discard_upload(stored_photos)
+        raise
+    schedule_reading_images(current_app._get_current_object(), [reading.id for reading in photo_readings])
+    flash('Readings uploaded successfully')
+    return redirect(url_for('web.tenant_dashboard'))
+
+@bp.route('/create_payment', methods=['POST'])
+@login_required
+def create_payment():
+    payment_method = request.json.get('payment_method', 'card')
+    if payment_method not in ['card', 'cash', 'bank_transfer']:
+        return jsonify({'error': 'Invalid payment method'}), 400
+
+    # Calculate rent + electricity + water for the current period
+    bill = bill_for_tenant(current_user)
+    electricity_cost = bill.electricity
+    water_cost = bill.water
+    total_amount = bill.total
+    
+    # Create payment record
+    payment = Payment(
+        user_id=current_user.id,
+        amount=total_amount,
+        rent_component=current_user.rent_amount,
+        electricity_component=electricity_cost,
+        water_component=water_cost,
+        payment_date=datetime.now(),
+        payment_method=payment_method,
+        status='pending'  # Make sure this is set to 'pending' for all methods
+    )
+    
+    if payment_method == 'card':
+        # The PaymentIntent is created in the background; the client polls status_url for its secret
+        queue_card_payment(payment)
+        db.session.add(payment)
+        db.session.commit()
+        schedule_intent(current_app._get_current_object(), payment.id)
+        
+        return jsonify({
+            'payment_id': payment.id,
+            'status': payment.intent_status,
+            'status_url': url_for('web.payment_intent_status', payment_id=payment.id),
+            'amount': total_amount
+        }), 202
+    else:
+        # For cash and UPI payments
+        reference = f"RENT{datetime.now().strftime('%Y%m%d%H%M%S')}{current_user.id}"
+        payment.transaction_reference = reference
+        db.session.add(payment)
+        db.session.commit()
+        
+        return jsonify({
+            'reference': reference,
+            'amount': total_amount,
+            'message': f'Please use reference {reference} when making the payment'
+        })
+
+@bp.route('/payment_intent/<int:payment_id>')
+@login_required
+def payment_intent_status(payment_id):
+    payment = db.session.get(Payment, payment_id)
+    if not payment or (payment.user_id != current_user.id and not current_user.is_owner):
+        return jsonify({'error': 'Payment not found'}), 404
+    
+    response = jsonify(intent_status_payload(payment))
+    if payment.intent_status in ('queued', 'creating'):
+        response.headers['Retry-After'] = '1'
+    return response
+
+@bp.route('/confirm_payment/<int:payment_id>', methods=['POST'])
+@login_required
+def confirm_payment(payment_id):
+    if not current_user.is_owner:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    payment = Payment.query.get_or_404(payment_id)
+    payment.status = 'confirmed'
+    db.session.commit()
+    
+    # After successful confirmation, redirect back to owner dashboard
+    return redirect(url_for('web.owner_dashboard'))
+
+@bp.route('/reject_payment/<int:payment_id>', methods=['POST'])
+@login_required
+def reject_payment(payment_id):
+    if not current_user.is_owner:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    payment = Payment.query.get_or_404(payment_id)
+    payment.status = 'rejected'
+    db.session.commit()
+    
+    # After successful rejection, redirect back to owner dashboard
+    return redirect(url_for('web.owner_dashboard'))
+
+@bp.route('/payment_success')
+@login_required
+def payment_success():
+    payment_intent_id = request.args.get('payment_intent')
+    if payment_intent_id:
+        payment = Payment.query.filter_by(stripe_payment_id=payment_intent_id).first()
+        if payment:
+            payment.status = 'completed'
+            db.session.commit()
+            flash('Payment successful!')
+    return redirect(url_for('web.tenant_dashboard'))
+
+@bp.route('/stripe/webhook', methods=['POST'])
+def stripe_webhook():
+    """Record signed Stripe events; payment statuses are updated in batches off the request"""
+    payload = request.get_data(as_text=True)
+    try:
+        event = verify_event(payload, request.headers.get('Stripe-Signature', ''))
+    except InvalidEvent as e:
+        return jsonify({'error': str(e)}), 400
+    except RuntimeError as e:
+        current_app.logger.error('Stripe webhook rejected: %s', e)
+        return jsonify({'error': 'Webhook not configured'}), 503
+    
+    if record_event(event, payload):
+        schedule_event_processing(current_app._get_current_object())
+    return jsonify({'received': True})
+
+@bp.route('/delete_tenant/<int:tenant_id>', methods=['POST'])
+@login_required
+def delete_tenant(tenant_id):
+    if not current_user.is_owner:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    tenant = User.query.get(tenant_id)
+    if not tenant:
+        flash('Tenant not found')
+        return redirect(url_for('web.owner_dashboard'))
+    
+    if tenant.is_owner:
+        flash('Cannot delete owner account')
+        return redirect(url_for('web.owner_dashboard'))
+    
+    # Delete associated meter readings
+    LatestReading.query.filter_by(user_id=tenant.id).delete()
+    MonthlyConsumption.query.filter_by(user_id=tenant.id).delete()
+    ReminderOutbox.query.filter_by(user_id=tenant.id).delete()
+    MeterReading.query.filter_by(user_id=tenant.id).delete()
+    
+    # Delete associated payments
+    Payment.query.filter_by(user_id=tenant.id).delete()
+    
+    # Delete tenant
+    db.session.delete(tenant)
+    db.session.commit()
+    
+    flash(f'Tenant {tenant.name} has been deleted')
+    return redirect(url_for('web.owner_dashboard'))
+
+@bp.route('/change_password', methods=['GET', 'POST'])
+@login_required
+def change_password():
+    if request.method == 'POST':
+        current_password = request.form.get('current_password')
+        new_password = request.form.get('new_password')
+        confirm_password = request.form.get('confirm_password')
+        
+        # Validate current password
+        if not current_user.check_password(current_password):
+            flash('Current password is incorrect')
+            return redirect(url_for('web.change_password'))
+        
+        # Validate new password
+        if new_password != confirm_password:
+            flash('New passwords do not match')
+            return redirect(url_for('web.change_password'))
+        
+        if len(new_password) < 8:
+            flash('New password must be at least 8 characters long')
+            return redirect(url_for('web.change_password'))
+        
+        # Update password
+        current_user.set_password(new_password)
+        db.session.commit()
+        
+        flash('Password updated successfully')
+        return redirect(url_for('web.tenant_dashboard'))
+    
+    return render_template('change_password.html')
+
+@bp.cli.command('generate-bills')
+@click.option('--method', default='bank_transfer', type=click.Choice(['cash', 'bank_transfer']),
+              help='Payment method recorded on the generated bills')
+def generate_bills_command(method):
+    """Create this period's pending bill for every tenant in one bulk write"""
+    created = generate_monthly_bills(payment_method=method)
+    print(f"Generated {created} bills")
+
+@bp.cli.command('allocate-water-bill')
+@click.option('--period', help='Month to bill as YYYY-MM (default: last month)')
+def allocate_water_bill_command(period):
+    """Compute the water bill for one billing period; safe to re-run"""
+    try:
+        day = datetime.strptime(period, '%Y-%m') if period else None
+    except ValueError:
+        raise click.BadParameter('use YYYY-MM', param_hint='--period')
+    bill = allocate_water_bill(billing_period(day) if day else None)
+    print(f"Water bill for {bill.period_start:%B %Y}: {bill.total_amount:g} units, "
+          f"₹{bill.amount_per_tenant:.2f} per tenant")
+
+@bp.cli.command('send-reminders')
+@click.option('--day', type=click.DateTime(formats=['%Y-%m-%d']), help='Due day to remind for (default: today)')
+@click.option('--queue-only', is_flag=True, help='Only add reminders to the outbox, do not send')
+def send_reminders_command(day, queue_only):
+    """Queue rent reminders for tenants due on a day and send all unsent ones"""
+    day = day.date() if day else None
+    if queue_only:
+        print(f"Queued {enqueue_due_reminders(day)} reminders")
+        return
+    result = send_rent_reminders(day)
+    print(f"Queued {result['queued']}, sent {result['sent']}, failed {result['failed']} "
+          f"in {result['seconds']:.2f}s")
+
+@bp.cli.command('process-payment-intents')
+def process_payment_intents_command():
+    """Create Stripe PaymentIntents for queued card payments, e.g. after a restart"""
+    print(f"Created {process_pending_intents(current_app._get_current_object())} payment intents")
+
+@bp.cli.command('process-stripe-events')
+def process_stripe_events_command():
+    """Apply any Stripe webhook events not yet reflected in payment statuses"""
+    print(f"Applied {apply_pending_events()} Stripe events")
+
+@bp.cli.command('run-scheduler')
+def run_scheduler_command():
+    """Run the background jobs (reminders, water bill, Stripe retries) until stopped; start exactly one"""
+    from apscheduler.schedulers.blocking import BlockingScheduler
+    from scheduler import init_scheduler
+    print("Running scheduled jobs, press Ctrl+C to stop")
+    try:
+        init_scheduler(current_app._get_current_object(), BlockingScheduler())
+    except (KeyboardInterrupt, SystemExit):
+        pass
+
+@bp.cli.command('rebuild-latest-readings')
+def rebuild_latest_readings_command():
+    """Recompute the latest/previous reading table from full meter history"""
+    rebuild_latest_readings()
+    # Cached dashboards may show readings the rebuild replaced
+    bump([GLOBAL_KEY])
+    db.session.commit()
+    print(f"Rebuilt {LatestReading.query.count()} latest reading entries")
+
+@bp.cli.command('rebuild-monthly-consumption')
+def rebuild_monthly_consumption_command():
+    """Recompute the monthly consumption rollup from full meter history"""
+    rebuild_monthly_consumption()
+    db.session.commit()
+    print(f"Rebuilt {MonthlyConsumption.query.count()} monthly consumption rows")
+
+@bp.cli.command('export')
+@click.argument('dataset', type=click.Choice(list(exports.DATASETS)))
+@click.option('--format', 'fmt', default='csv', type=click.Choice(list(exports.FORMATS)))
+@click.option('--start', help='First day to include (YYYY-MM-DD)')
+@click.option('--end', help='Last day to include (YYYY-MM-DD)')
+@click.option('--tenant', 'tenant_id', help='Only export this tenant ID')
+@click.option('--output', type=click.File('w'), default='-', help='Output file (default: stdout)')
+def export_command(dataset, fmt, start, end, tenant_id, output):
+    """Stream payments or meter readings to CSV / NDJSON"""
+    for chunk in exports.export(dataset, fmt, **exports.parse_filters(start, end, tenant_id)):
+        output.write(chunk)
+
+@bp.cli.command('process-images')
+def process_images_command():
+    """Generate display images and thumbnails for uploads that lack them"""
+    print(f"Processed {process_pending_images(current_app._get_current_object())} meter photos")
+
+@bp.cli.command('import-tenants')
+@click.argument('csv_file', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--output', type=click.File('w'), default='-', help='Credentials file (default: stdout)')
+def import_tenants_command(csv_file, output):
+    """Register every tenant in a CSV in one transaction and write their credentials"""
+    try:
+        rows = parse_tenant_csv(csv_file.read())
+        credentials = onboard_tenants(rows)
+        db.session.commit()
+    except OnboardingError as e:
+        db.session.rollback()
+        for line, message in e.errors:
+            click.echo(f'Line {line}: {message}', err=True)
+        raise click.ClickException('No tenants were imported')
+    except Exception:
+        db.session.rollback()
+        raise
+    output.write(credentials_csv(credentials))
+    click.echo(f"Imported {len(credentials)} tenants", err=True)
+
+@bp.cli.command('import-readings')
+@click.argument('csv_file', type=click.File('r', encoding='utf-8-sig'))
+def import_readings_command(csv_file):
+    """Load a sub-meter CSV export (tenant_id, meter_type, value, timestamp)"""
+    try:
+        report = ingest_readings(records_from_csv(csv_file.read()))
+        db.session.commit()
+    except BatchRejected as e:
+        db.session.rollback()
+        raise click.ClickException(str(e))
+    for error in report['errors']:
+        click.echo(f"Record {error['index']}: {error['error']}", err=True)
+    print(f"Imported {report['accepted']} of {report['received']} readings")